@@ -0,0 +1,646 @@
+"""
+ASCON-128 reference model of the SystemVerilog core (ascon.sv).
+
+The scalar path works on Python integers and mirrors the phases of the
+hardware (initialisation, associated data, plaintext blocks, finalisation).
+The NumPy path runs the same permutation on uint64 lanes, one lane per
+record, to check large batches of FPGA outputs at once.
+"""
+
+import sys
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the batch functions
+    np = None
+
+# Initialisation vector of ASCON-128 (k=128, r=64, a=12, b=6), as wired in ascon.sv
+IV = 0x80400C0600000000
+
+# Round constants of Pc.sv; p12 uses all of them, p6 the last six
+ROUND_CONSTANTS = (0xF0, 0xE1, 0xD2, 0xC3, 0xB4, 0xA5, 0x96, 0x87, 0x78, 0x69, 0x5A, 0x4B)
+
+# Rate of ASCON-128 in bytes (one 64-bit block)
+RATE = 8
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+# Test vector of ascon_tb.sv: key, nonce, associated data ("A to B") and ECG trace
+ECG_KEY = bytes.fromhex("8A55114D1CB6A9A2BE263D4D7AECAAFF")
+ECG_NONCE = bytes.fromhex("04ED0ECB98C529B7C8CDDF37BCD0284A")
+ECG_ASSOCIATED_DATA = bytes.fromhex("4120746F2042")
+ECG_PLAINTEXT = bytes.fromhex(
+    "5A5B5B5A5A5A5A5A" "59554E4A4C4F5455" "5351515354565758" "5A5A595756595B5A"
+    "5554545252504F4F" "4C4C4D4D4A494444" "4747464442434140" "3B36383E44494947"
+    "4746464443424345" "4745444546474A49" "4745484F58697C92" "AECEEDFFFFE3B47C"
+    "471600041729363C" "3F3E40414141403F" "3F403F3E3B3A3B3E" "3D3E3C393C414646"
+    "46454447464A4C4F" "4C505555524F5155" "595C5A595A5C5C5B" "5959575351504F4F"
+    "53575A5C5A5B5D5E" "6060615F605F5E5A" "5857545252"
+)
+
+# Cipher blocks printed by the behavioural simulation of ascon_tb.sv (simulate.log).
+# The testbench presents each block for 40 ns, shorter than a p6 permutation, so
+# the core absorbs every other block: these are the ciphers of blocks 0, 2, ..., 18.
+ECG_EXPECTED_CIPHER_BLOCKS = (
+    0x392C467F14B40B38, 0xF40D83D35514C8C5, 0x20064BF57A25D38B, 0xA54AD69A887F6C20,
+    0x885B87CDBF951FD9, 0xFE6C3C49206515CF, 0x1C1BFC5E55CD62AE, 0xE53BF444551B8A75,
+    0x8143B7D1312D2C82, 0x22C2B7597A617761,
+)
+
+
+class AsconTagError(ValueError):
+    """
+    Raised when a tag does not authenticate the ciphertext.
+    """
+
+
+def _ror(x, n):
+    return ((x >> n) | (x << (64 - n))) & MASK64
+
+
+def permutation(state, rounds):
+    """
+    Apply the ASCON permutation to a state in place.
+
+    Args:
+        state (list of int): Five 64-bit words X0..X4
+        rounds (int): Number of rounds (12 for p12, 6 for p6)
+    """
+    x0, x1, x2, x3, x4 = state
+    for constant in ROUND_CONSTANTS[12 - rounds:]:
+        # Pc: constant addition
+        x2 ^= constant
+        # Ps: substitution layer (bitsliced Sbox.sv)
+        x0 ^= x4
+        x4 ^= x3
+        x2 ^= x1
+        t0 = ~x0 & x1
+        t1 = ~x1 & x2
+        t2 = ~x2 & x3
+        t3 = ~x3 & x4
+        t4 = ~x4 & x0
+        x0 ^= t1
+        x1 ^= t2
+        x2 ^= t3
+        x3 ^= t4
+        x4 ^= t0
+        x1 ^= x0
+        x0 ^= x4
+        x3 ^= x2
+        x2 = ~x2 & MASK64
+        # Pl: linear diffusion layer
+        x0 ^= _ror(x0, 19) ^ _ror(x0, 28)
+        x1 ^= _ror(x1, 61) ^ _ror(x1, 39)
+        x2 ^= _ror(x2, 1) ^ _ror(x2, 6)
+        x3 ^= _ror(x3, 10) ^ _ror(x3, 17)
+        x4 ^= _ror(x4, 7) ^ _ror(x4, 41)
+    state[:] = [x0, x1, x2, x3, x4]
+
+
+def pad(data):
+    """
+    Apply ASCON padding (0x80 then zeros) up to a multiple of the rate.
+
+    Args:
+        data (bytes): Data to pad
+
+    Returns:
+        bytes: Padded data, always at least one byte longer than the input
+    """
+    return bytes(data) + b'\x80' + bytes(RATE - 1 - len(data) % RATE)
+
+
+def to_blocks(data):
+    """
+    Split padded data into big-endian 64-bit blocks.
+
+    Args:
+        data (bytes): Data whose length is a multiple of the rate
+
+    Returns:
+        list of int: 64-bit blocks as fed to data_i
+    """
+    return [int.from_bytes(data[i:i + RATE], 'big') for i in range(0, len(data), RATE)]
+
+
+class AsconState:
+    """
+    Incremental ASCON-128 encryption, one 64-bit block at a time.
+
+    The methods follow the phases of the hardware FSM: the constructor runs
+    the initialisation, then associated data blocks, plaintext blocks and the
+    final block are fed in, already padded, like data_i in ascon_tb.sv.
+    """
+
+    def __init__(self, key, nonce, state=None):
+        """
+        Args:
+            key (bytes): 16-byte key
+            nonce (bytes): 16-byte nonce
+            state (list of int): Post-initialisation state to start from, e.g.
+                from an InitStateCache, instead of running the initialisation
+        """
+        if len(key) != 16 or len(nonce) != 16:
+            raise ValueError("ASCON-128 key and nonce must be 16 bytes each")
+        self.key = (int.from_bytes(key[:8], 'big'), int.from_bytes(key[8:], 'big'))
+        if state is None:
+            state = [IV, *self.key, int.from_bytes(nonce[:8], 'big'), int.from_bytes(nonce[8:], 'big')]
+            permutation(state, 12)
+            state[3] ^= self.key[0]
+            state[4] ^= self.key[1]
+        self.state = list(state)
+
+    def absorb_block(self, block):
+        """
+        Absorb one padded block of associated data.
+
+        Args:
+            block (int): 64-bit associated data block
+        """
+        self.state[0] ^= block
+        permutation(self.state, 6)
+
+    def end_associated_data(self):
+        """
+        Apply the domain separation between associated data and plaintext.
+        """
+        self.state[4] ^= 1
+
+    def encrypt_block(self, block):
+        """
+        Encrypt one full plaintext block that is not the last one.
+
+        Args:
+            block (int): 64-bit plaintext block
+
+        Returns:
+            int: 64-bit cipher block
+        """
+        self.state[0] ^= block
+        cipher = self.state[0]
+        permutation(self.state, 6)
+        return cipher
+
+    def decrypt_block(self, cipher):
+        """
+        Decrypt one full cipher block that is not the last one.
+
+        Args:
+            cipher (int): 64-bit cipher block
+
+        Returns:
+            int: 64-bit plaintext block
+        """
+        block = self.state[0] ^ cipher
+        self.state[0] = cipher
+        permutation(self.state, 6)
+        return block
+
+    def finalize(self, block):
+        """
+        Encrypt the last (padded) plaintext block and compute the tag.
+
+        Args:
+            block (int): 64-bit padded plaintext block
+
+        Returns:
+            tuple: (cipher block as int, 128-bit tag as int)
+        """
+        self.state[0] ^= block
+        cipher = self.state[0]
+        return cipher, self._tag()
+
+    def _tag(self):
+        self.state[1] ^= self.key[0]
+        self.state[2] ^= self.key[1]
+        permutation(self.state, 12)
+        return ((self.state[3] ^ self.key[0]) << 64) | (self.state[4] ^ self.key[1])
+
+
+class InitStateCache:
+    """
+    LRU cache of post-initialisation states keyed by (key, nonce).
+
+    The initialisation runs p12, which dominates the cost of short records,
+    so repeated verification of the same (key, nonce) pair skips it.
+    """
+
+    def __init__(self, maxsize=4096):
+        """
+        Args:
+            maxsize (int): Maximum number of cached states
+        """
+        self.maxsize = maxsize
+        self._states = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._states)
+
+    def get(self, key, nonce):
+        """
+        Return the post-initialisation state for a key and nonce.
+
+        Args:
+            key (bytes): 16-byte key
+            nonce (bytes): 16-byte nonce
+
+        Returns:
+            list of int: Copy of the five state words
+        """
+        cache_key = (bytes(key), bytes(nonce))
+        state = self._states.get(cache_key)
+        if state is not None:
+            self.hits += 1
+            self._states.move_to_end(cache_key)
+            return list(state)
+
+        self.misses += 1
+        state = tuple(AsconState(key, nonce).state)
+        self._store(cache_key, state)
+        return list(state)
+
+    def get_batch(self, keys, nonces):
+        """
+        Return the post-initialisation states of a batch of records as uint64 lanes.
+
+        Missing states are computed together on the vectorised path.
+
+        Args:
+            keys (numpy.ndarray): (N, 16) uint8 keys
+            nonces (numpy.ndarray): (N, 16) uint8 nonces
+
+        Returns:
+            list of numpy.ndarray: Five (N,) uint64 arrays X0..X4
+        """
+        _require_numpy()
+        keys = np.ascontiguousarray(keys, dtype=np.uint8).reshape(-1, 16)
+        nonces = np.ascontiguousarray(nonces, dtype=np.uint8).reshape(-1, 16)
+        states = np.empty((5, len(keys)), dtype=np.uint64)
+
+        missing = []
+        for i in range(len(keys)):
+            cache_key = (keys[i].tobytes(), nonces[i].tobytes())
+            state = self._states.get(cache_key)
+            if state is None:
+                missing.append(i)
+            else:
+                self.hits += 1
+                self._states.move_to_end(cache_key)
+                states[:, i] = state
+
+        if missing:
+            self.misses += len(missing)
+            computed = _initialize_lanes(_words(keys[missing]), _words(nonces[missing]))
+            for lane, i in enumerate(missing):
+                state = tuple(int(word[lane]) for word in computed)
+                states[:, i] = state
+                self._store((keys[i].tobytes(), nonces[i].tobytes()), state)
+        return list(states)
+
+    def _store(self, cache_key, state):
+        self._states[cache_key] = state
+        if len(self._states) > self.maxsize:
+            self._states.popitem(last=False)
+
+
+def encrypt(key, nonce, associated_data, plaintext, cache=None):
+    """
+    Encrypt a message with ASCON-128.
+
+    Args:
+        key (bytes): 16-byte key
+        nonce (bytes): 16-byte nonce
+        associated_data (bytes): Associated data (may be empty)
+        plaintext (bytes): Plaintext
+        cache (InitStateCache): Optional cache of post-initialisation states
+
+    Returns:
+        tuple: (ciphertext as bytes of the plaintext length, 16-byte tag)
+    """
+    ascon = AsconState(key, nonce, cache.get(key, nonce) if cache else None)
+    _absorb_associated_data(ascon, associated_data)
+
+    blocks = to_blocks(pad(plaintext))
+    cipher = bytearray()
+    for block in blocks[:-1]:
+        cipher += ascon.encrypt_block(block).to_bytes(RATE, 'big')
+    last_cipher, tag = ascon.finalize(blocks[-1])
+    cipher += last_cipher.to_bytes(RATE, 'big')[:len(plaintext) % RATE]
+    return bytes(cipher), tag.to_bytes(16, 'big')
+
+
+def decrypt(key, nonce, associated_data, ciphertext, tag, cache=None):
+    """
+    Decrypt and authenticate a message with ASCON-128.
+
+    Args:
+        key (bytes): 16-byte key
+        nonce (bytes): 16-byte nonce
+        associated_data (bytes): Associated data (may be empty)
+        ciphertext (bytes): Ciphertext
+        tag (bytes): 16-byte tag
+        cache (InitStateCache): Optional cache of post-initialisation states
+
+    Returns:
+        bytes: Plaintext
+
+    Raises:
+        AsconTagError: If the tag does not match
+    """
+    ascon = AsconState(key, nonce, cache.get(key, nonce) if cache else None)
+    _absorb_associated_data(ascon, associated_data)
+
+    full = len(ciphertext) - len(ciphertext) % RATE
+    plaintext = bytearray()
+    for cipher in to_blocks(ciphertext[:full]):
+        plaintext += ascon.decrypt_block(cipher).to_bytes(RATE, 'big')
+
+    # Last block: the ciphertext replaces the leading bytes of X0, the padding
+    # is XORed into the byte that follows them
+    remaining = len(ciphertext) - full
+    x0 = ascon.state[0].to_bytes(RATE, 'big')
+    plaintext += bytes(c ^ s for c, s in zip(ciphertext[full:], x0))
+    last = bytearray(x0)
+    last[:remaining] = ciphertext[full:]
+    last[remaining] ^= 0x80
+    ascon.state[0] = int.from_bytes(last, 'big')
+
+    if ascon._tag().to_bytes(16, 'big') != bytes(tag):
+        raise AsconTagError("ASCON-128 tag mismatch")
+    return bytes(plaintext)
+
+
+def _absorb_associated_data(ascon, associated_data):
+    if associated_data:
+        for block in to_blocks(pad(associated_data)):
+            ascon.absorb_block(block)
+    ascon.end_associated_data()
+
+
+# ---------------------------------------------------------------------------
+# Vectorised path: one uint64 lane per record
+# ---------------------------------------------------------------------------
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for the ASCON-128 batch functions")
+
+
+def _words(data):
+    """
+    View (N, 8*k) uint8 rows as k big-endian 64-bit words per row, as (k, N) uint64.
+    """
+    data = np.ascontiguousarray(data, dtype=np.uint8)
+    return data.view('>u8').astype(np.uint64).T.copy()
+
+
+def _bytes(words):
+    """
+    Inverse of _words: (k, N) uint64 words to (N, 8*k) uint8 rows.
+    """
+    return np.ascontiguousarray(words.T).astype('>u8').view(np.uint8)
+
+
+def permutation_lanes(state, rounds):
+    """
+    Apply the ASCON permutation to every lane of a batch of states, in place.
+
+    Args:
+        state (list of numpy.ndarray): Five (N,) uint64 arrays X0..X4
+        rounds (int): Number of rounds (12 for p12, 6 for p6)
+    """
+    x0, x1, x2, x3, x4 = state
+    t0 = np.empty_like(x0)
+    t1 = np.empty_like(x0)
+    t2 = np.empty_like(x0)
+    t3 = np.empty_like(x0)
+    t4 = np.empty_like(x0)
+    r0 = np.empty_like(x0)
+    r1 = np.empty_like(x0)
+    for constant in _NP_ROUND_CONSTANTS[12 - rounds:]:
+        x2 ^= constant
+        x0 ^= x4
+        x4 ^= x3
+        x2 ^= x1
+        np.invert(x0, out=t0)
+        t0 &= x1
+        np.invert(x1, out=t1)
+        t1 &= x2
+        np.invert(x2, out=t2)
+        t2 &= x3
+        np.invert(x3, out=t3)
+        t3 &= x4
+        np.invert(x4, out=t4)
+        t4 &= x0
+        x0 ^= t1
+        x1 ^= t2
+        x2 ^= t3
+        x3 ^= t4
+        x4 ^= t0
+        x1 ^= x0
+        x0 ^= x4
+        x3 ^= x2
+        np.invert(x2, out=x2)
+        for x, (a, b) in zip(state, _NP_ROTATIONS):
+            # x ^= ror(x, a) ^ ror(x, b)
+            np.right_shift(x, a[0], out=r0)
+            np.left_shift(x, a[1], out=r1)
+            r0 |= r1
+            np.right_shift(x, b[0], out=t0)
+            np.left_shift(x, b[1], out=r1)
+            t0 |= r1
+            r0 ^= t0
+            x ^= r0
+
+
+def _initialize_lanes(key_words, nonce_words):
+    n = key_words.shape[1]
+    state = [np.full(n, IV, dtype=np.uint64), key_words[0].copy(), key_words[1].copy(),
+             nonce_words[0].copy(), nonce_words[1].copy()]
+    permutation_lanes(state, 12)
+    state[3] ^= key_words[0]
+    state[4] ^= key_words[1]
+    return state
+
+
+def _pad_rows(data):
+    """
+    Pad (N, L) uint8 rows with 0x80 and zeros up to a multiple of the rate.
+    """
+    n, length = data.shape
+    padded = np.zeros((n, length + RATE - length % RATE), dtype=np.uint8)
+    padded[:, :length] = data
+    padded[:, length] = 0x80
+    return padded
+
+
+def _prepare_batch(keys, nonces, associated_data, cache):
+    keys = np.ascontiguousarray(keys, dtype=np.uint8).reshape(-1, 16)
+    nonces = np.ascontiguousarray(nonces, dtype=np.uint8).reshape(-1, 16)
+    key_words = _words(keys)
+    if cache is not None:
+        state = cache.get_batch(keys, nonces)
+    else:
+        state = _initialize_lanes(key_words, _words(nonces))
+
+    associated_data = np.asarray(associated_data, dtype=np.uint8).reshape(len(keys), -1)
+    if associated_data.shape[1]:
+        for block in _words(_pad_rows(associated_data)):
+            state[0] ^= block
+            permutation_lanes(state, 6)
+    state[4] ^= np.uint64(1)
+    return state, key_words
+
+
+def _tag_lanes(state, key_words):
+    state[1] ^= key_words[0]
+    state[2] ^= key_words[1]
+    permutation_lanes(state, 12)
+    return _bytes(np.stack([state[3] ^ key_words[0], state[4] ^ key_words[1]]))
+
+
+def encrypt_batch(keys, nonces, associated_data, plaintexts, cache=None):
+    """
+    Encrypt a batch of equal-length messages with ASCON-128, one lane per record.
+
+    Args:
+        keys (array-like): (N, 16) uint8 keys
+        nonces (array-like): (N, 16) uint8 nonces
+        associated_data (array-like): (N, La) uint8 associated data, La may be 0
+        plaintexts (array-like): (N, L) uint8 plaintexts
+        cache (InitStateCache): Optional cache of post-initialisation states
+
+    Returns:
+        tuple: ((N, L) uint8 ciphertexts, (N, 16) uint8 tags)
+    """
+    _require_numpy()
+    plaintexts = np.asarray(plaintexts, dtype=np.uint8)
+    n, length = plaintexts.shape
+    state, key_words = _prepare_batch(keys, nonces, associated_data, cache)
+
+    blocks = _words(_pad_rows(plaintexts))
+    cipher = np.empty_like(blocks)
+    for i, block in enumerate(blocks):
+        state[0] ^= block
+        cipher[i] = state[0]
+        if i < len(blocks) - 1:
+            permutation_lanes(state, 6)
+
+    return _bytes(cipher)[:, :length], _tag_lanes(state, key_words)
+
+
+def decrypt_batch(keys, nonces, associated_data, ciphertexts, tags, cache=None):
+    """
+    Decrypt and authenticate a batch of equal-length messages with ASCON-128.
+
+    Args:
+        keys (array-like): (N, 16) uint8 keys
+        nonces (array-like): (N, 16) uint8 nonces
+        associated_data (array-like): (N, La) uint8 associated data, La may be 0
+        ciphertexts (array-like): (N, L) uint8 ciphertexts
+        tags (array-like): (N, 16) uint8 tags
+        cache (InitStateCache): Optional cache of post-initialisation states
+
+    Returns:
+        tuple: ((N, L) uint8 plaintexts, (N,) bool array, True where the tag matches)
+    """
+    _require_numpy()
+    ciphertexts = np.asarray(ciphertexts, dtype=np.uint8)
+    n, length = ciphertexts.shape
+    state, key_words = _prepare_batch(keys, nonces, associated_data, cache)
+
+    full_blocks = length // RATE
+    cipher = _words(ciphertexts[:, :full_blocks * RATE]) if full_blocks else np.empty((0, n), np.uint64)
+    plain = np.empty((full_blocks + 1, n), dtype=np.uint64)
+    for i in range(full_blocks):
+        plain[i] = state[0] ^ cipher[i]
+        state[0][:] = cipher[i]
+        permutation_lanes(state, 6)
+
+    # Last block: ciphertext bytes replace the leading bytes of X0, padding follows them
+    remaining = length - full_blocks * RATE
+    x0 = _bytes(state[0][np.newaxis])
+    last = x0.copy()
+    last[:, :remaining] = ciphertexts[:, full_blocks * RATE:]
+    plain[full_blocks] = _words(last ^ x0)[0]
+    last[:, remaining] ^= 0x80
+    state[0] = _words(last)[0]
+
+    expected = _tag_lanes(state, key_words)
+    valid = np.all(expected == np.asarray(tags, dtype=np.uint8).reshape(n, 16), axis=1)
+    return _bytes(plain)[:, :length], valid
+
+
+def verify_batch(keys, nonces, associated_data, plaintexts, ciphertexts, tags, cache=None):
+    """
+    Check FPGA outputs against the reference model.
+
+    Args:
+        keys (array-like): (N, 16) uint8 keys
+        nonces (array-like): (N, 16) uint8 nonces
+        associated_data (array-like): (N, La) uint8 associated data
+        plaintexts (array-like): (N, L) uint8 plaintexts sent to the FPGA
+        ciphertexts (array-like): (N, L) uint8 ciphertexts returned by the FPGA
+        tags (array-like): (N, 16) uint8 tags returned by the FPGA
+        cache (InitStateCache): Optional cache of post-initialisation states
+
+    Returns:
+        numpy.ndarray: (N,) bool array, True where both ciphertext and tag match
+    """
+    expected_cipher, expected_tags = encrypt_batch(keys, nonces, associated_data, plaintexts, cache)
+    cipher_ok = np.all(expected_cipher == np.asarray(ciphertexts, dtype=np.uint8), axis=1)
+    tag_ok = np.all(expected_tags == np.asarray(tags, dtype=np.uint8), axis=1)
+    return cipher_ok & tag_ok
+
+
+if np is not None:
+    _NP_ROUND_CONSTANTS = [np.uint64(c) for c in ROUND_CONSTANTS]
+    _NP_ROTATIONS = [((np.uint64(a), np.uint64(64 - a)), (np.uint64(b), np.uint64(64 - b)))
+                     for a, b in ((19, 28), (61, 39), (1, 6), (10, 17), (7, 41))]
+
+
+def self_test():
+    """
+    Check the model against the ascon_tb.sv simulation and a known answer.
+
+    Returns:
+        bool: True if every check passed
+    """
+    # Replay the blocks the simulated core actually absorbed
+    ascon = AsconState(ECG_KEY, ECG_NONCE)
+    _absorb_associated_data(ascon, ECG_ASSOCIATED_DATA)
+    blocks = to_blocks(ECG_PLAINTEXT[:len(ECG_PLAINTEXT) - len(ECG_PLAINTEXT) % RATE])
+    ok = tuple(ascon.encrypt_block(block) for block in blocks[0:20:2]) == ECG_EXPECTED_CIPHER_BLOCKS
+    print(f"ascon_tb.sv simulation blocks: {'OK' if ok else 'MISMATCH'}")
+
+    # Known-answer test of the ASCON-128 reference (empty message and AD)
+    _, kat_tag = encrypt(bytes(range(16)), bytes(range(16)), b'', b'')
+    kat_ok = kat_tag == bytes.fromhex("E355159F292911F794CB1432A0103A8A")
+    print(f"ASCON-128 known answer: {'OK' if kat_ok else 'MISMATCH'}")
+    ok = ok and kat_ok
+
+    cipher, tag = encrypt(ECG_KEY, ECG_NONCE, ECG_ASSOCIATED_DATA, ECG_PLAINTEXT)
+    print(f"ECG vector: {len(ECG_PLAINTEXT)} bytes, tag {tag.hex().upper()}")
+    ok = ok and decrypt(ECG_KEY, ECG_NONCE, ECG_ASSOCIATED_DATA, cipher, tag) == ECG_PLAINTEXT
+
+    if np is not None:
+        count = 4
+        keys = np.tile(np.frombuffer(ECG_KEY, np.uint8), (count, 1))
+        nonces = np.tile(np.frombuffer(ECG_NONCE, np.uint8), (count, 1))
+        ad = np.tile(np.frombuffer(ECG_ASSOCIATED_DATA, np.uint8), (count, 1))
+        plain = np.tile(np.frombuffer(ECG_PLAINTEXT, np.uint8), (count, 1))
+        batch_cipher, batch_tags = encrypt_batch(keys, nonces, ad, plain)
+        batch_ok = bool(np.all(batch_cipher == np.frombuffer(cipher, np.uint8))) and \
+            bool(np.all(batch_tags == np.frombuffer(tag, np.uint8)))
+        decrypted, valid = decrypt_batch(keys, nonces, ad, batch_cipher, batch_tags)
+        batch_ok = batch_ok and bool(valid.all()) and bool(np.all(decrypted == plain))
+        print(f"  vectorised path vs scalar path: {'OK' if batch_ok else 'MISMATCH'}")
+        ok = ok and batch_ok
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if self_test() else 1)
@@ -0,0 +1,129 @@
+"""
+ASCON mailbox: how the ASCON-128 core is reached through the UART memory.
+
+The core's ports (ascon.sv) are mapped onto the 256-byte memory of the UART
+interface. The host writes the key, nonce and data block with the usual 'A'/'W'
+commands, pulses a control register to start a phase, and reads the cipher
+block and tag back with 'R' commands. Multi-byte fields are big-endian, like
+data_i in ascon_tb.sv.
+
+The current top level does not yet connect the core to the UART memory; this
+map is what the host code and the virtual FPGA (fpga_sim.AsconMailboxModel)
+implement, and what the hardware glue has to follow.
+"""
+
+from ascon128 import RATE, pad
+from uart_improv3 import ADDR_COMMANDS, WRITE_COMMANDS
+
+# Memory map
+KEY_ADDR = 0x00        # key_i, 16 bytes
+NONCE_ADDR = 0x10      # nonce_i, 16 bytes
+DATA_ADDR = 0x20       # data_i, 8 bytes
+CIPHER_ADDR = 0x28     # cipher_o, 8 bytes
+TAG_ADDR = 0x30        # tag_o, 16 bytes
+CONTROL_ADDR = 0x40    # written to start a phase of the core
+
+# Values written to CONTROL_ADDR
+CONTROL_INIT = 0x01         # init_i
+CONTROL_ASSOCIATED = 0x02   # associate_data_i with data_valid_i
+CONTROL_DATA = 0x04         # data_valid_i (plaintext block)
+CONTROL_FINAL = 0x08        # finalisation_i with data_valid_i (last plaintext block)
+
+TAG_SIZE = 16
+
+
+class BoardEncryptor:
+    """
+    Drive the ASCON core of one FPGA through the mailbox.
+
+    Blocks are submitted to a CommandPipeline, so several blocks can be in
+    flight while earlier ciphers are collected. Commands of consecutive
+    blocks are executed in order by the FPGA, so each cipher is read before
+    the next block overwrites it.
+    """
+
+    def __init__(self, fpga, window=64):
+        """
+        Args:
+            fpga (FPGA): Open FPGA connection
+            window (int): Maximum number of commands in flight
+        """
+        self.fpga = fpga
+        self.window = window
+        self._pipe = None
+        if fpga.shadow is not None:
+            # Written by the core, and the control register must always be written
+            fpga.shadow.mark_volatile(list(range(CIPHER_ADDR, CIPHER_ADDR + RATE)) +
+                                      list(range(TAG_ADDR, TAG_ADDR + TAG_SIZE)) + [CONTROL_ADDR])
+
+    def start(self, key, nonce, associated_data=b''):
+        """
+        Load key and nonce, run the initialisation and absorb the associated data.
+
+        Args:
+            key (bytes): 16-byte key
+            nonce (bytes): 16-byte nonce
+            associated_data (bytes): Associated data, unpadded
+        """
+        if len(key) != 16 or len(nonce) != 16:
+            raise ValueError("ASCON-128 key and nonce must be 16 bytes each")
+        self.fpga.write_block(KEY_ADDR, bytes(key) + bytes(nonce))
+        self._pipe = self.fpga.pipeline(self.window)
+
+        commands = _write_commands(CONTROL_ADDR, bytes([CONTROL_INIT]))
+        if associated_data:
+            padded = pad(associated_data)
+            for offset in range(0, len(padded), RATE):
+                commands += _write_commands(DATA_ADDR, padded[offset:offset + RATE])
+                commands += _write_commands(CONTROL_ADDR, bytes([CONTROL_ASSOCIATED]))
+        for pending in self._pipe.submit_many(commands):
+            pending.result()
+
+    def submit(self, block, last=False):
+        """
+        Queue the commands that encrypt one padded plaintext block.
+
+        Args:
+            block (bytes): 8-byte plaintext block (padded if last)
+            last (bool): True for the last block, which also produces the tag
+
+        Returns:
+            list of PendingResponse: Handle to pass to collect()
+        """
+        control = CONTROL_FINAL if last else CONTROL_DATA
+        commands = _write_commands(DATA_ADDR, block) + _write_commands(CONTROL_ADDR, bytes([control]))
+        reads = _read_commands(CIPHER_ADDR, RATE)
+        if last:
+            reads += _read_commands(TAG_ADDR, TAG_SIZE)
+        return self._pipe.submit_many(commands + reads)
+
+    def collect(self, handle):
+        """
+        Wait for a submitted block and return its outputs.
+
+        Args:
+            handle (list of PendingResponse): Value returned by submit()
+
+        Returns:
+            tuple: (8-byte cipher block, 16-byte tag or None)
+        """
+        # Every command is checked, so a failed write cannot go unnoticed
+        results = [pending.result() for pending in handle]
+        values = bytes(result for pending, result in zip(handle, results) if pending.command == 'R')
+        return values[:RATE], values[RATE:] or None
+
+
+def _write_commands(addr, data):
+    commands = []
+    for offset, value in enumerate(data):
+        commands.append(ADDR_COMMANDS[addr + offset])
+        commands.append(WRITE_COMMANDS[value])
+    return commands
+
+
+def _read_commands(addr, length):
+    commands = []
+    for offset in range(length):
+        commands.append(ADDR_COMMANDS[addr + offset])
+        commands.append("R")
+    return commands
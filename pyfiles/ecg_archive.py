@@ -0,0 +1,422 @@
+"""
+Indexed capture archive for encrypted ECG records.
+
+Each record is one ASCON-128 message as produced by the board: nonce,
+associated data, ciphertext and tag. The file is laid out as
+
+    header      64 bytes: magic, version, key ID and encryption parameters,
+                record count and index offset
+    records     per record: associated data blocks, ciphertext blocks, then
+                the record's 64-byte index entry (nonce, tag, lengths,
+                offset of its first block, capture time)
+    index       the index entries of every record again, contiguous
+
+All blocks are 8 bytes wide (the ASCON rate), zero-padded at the end of the
+associated data and of the ciphertext. The writer appends through a buffered
+file and never syncs per record, so it keeps up with the stream; the index
+and final header are written and synced once by close(). An archive that was
+not closed (crash, power loss) is still readable: the reader rebuilds the
+index from the entries that follow each record.
+
+The reader maps the file with numpy.memmap. Opening is O(1), every record is
+reached through the index in O(1), and blocks, ciphertext and associated data
+are returned as views of the mapping. The index is a structured array, so
+ARCHIVE.index['nonce'] is an (N, 16) view of every nonce.
+"""
+
+import hashlib
+import os
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from ascon128 import RATE
+
+# Header: magic, format version, rate, bytes per sample, signed samples,
+# flags, key ID, algorithm, sampling frequency, record count, index offset
+ARCHIVE_MAGIC = b'ECGCAPT\0'
+ARCHIVE_VERSION = 1
+HEADER = struct.Struct('<8sHHBBH16s8sdQQ')
+
+# Header flags
+FLAG_CLOSED = 0x0001   # index and record count are valid
+
+ALGORITHM = b'ascon128'
+KEY_ID_SIZE = 16
+NONCE_SIZE = 16
+TAG_SIZE = 16
+
+# Index entry, also written after the blocks of its record: marker,
+# associated data length, file offset of the record's first block, ciphertext
+# length, capture time, nonce and tag. ENTRY_DTYPE is the same layout for
+# NumPy.
+ENTRY_MARKER = 0x52474345   # 'ECGR'
+ENTRY = struct.Struct('<IIQQd16s16s')
+ENTRY_DTYPE = np.dtype([
+    ('marker', '<u4'),
+    ('ad_len', '<u4'),
+    ('offset', '<u8'),
+    ('cipher_len', '<u8'),
+    ('timestamp', '<f8'),
+    ('nonce', 'u1', NONCE_SIZE),
+    ('tag', 'u1', TAG_SIZE),
+])
+
+# Write buffer of ArchiveWriter, in bytes
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+# One record of an archive; the arrays are views of the mapped file
+ArchiveRecord = namedtuple('ArchiveRecord', ['record_id', 'timestamp', 'nonce', 'associated_data',
+                                             'ciphertext', 'tag'])
+
+
+def key_fingerprint(key):
+    """
+    Key ID that identifies a key without revealing it.
+
+    Args:
+        key (bytes): 16-byte ASCON key
+
+    Returns:
+        bytes: First KEY_ID_SIZE bytes of its SHA-256 digest
+    """
+    return hashlib.sha256(bytes(key)).digest()[:KEY_ID_SIZE]
+
+
+def _blocks(length):
+    return -(-length // RATE)
+
+
+class ArchiveWriter:
+    """
+    Append-only writer of a capture archive.
+    """
+
+    def __init__(self, path, key_id, sample_bytes=1, signed=False, fs=0.0,
+                 buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        Args:
+            path (str): Archive file, replaced if it exists
+            key_id (bytes or str): Identifier of the key, at most KEY_ID_SIZE
+                bytes (see key_fingerprint); never the key itself
+            sample_bytes (int): Bytes per ECG sample in the plaintext
+            signed (bool): Samples are two's complement
+            fs (float): Sampling frequency in Hz, 0 if unknown
+            buffer_size (int): Size of the write buffer in bytes
+        """
+        if isinstance(key_id, str):
+            key_id = key_id.encode()
+        if len(key_id) > KEY_ID_SIZE:
+            raise ValueError(f"Key ID must be at most {KEY_ID_SIZE} bytes, got {len(key_id)}")
+        self.path = path
+        self.key_id = bytes(key_id)
+        self.sample_bytes = sample_bytes
+        self.signed = signed
+        self.fs = fs
+        self.closed = False
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._file.write(self._header(0, 0, 0))
+        self._position = HEADER.size
+        self._index = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._index) // ENTRY.size
+
+    def _header(self, flags, count, index_offset):
+        return HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, RATE, self.sample_bytes, int(self.signed),
+                           flags, self.key_id, ALGORITHM, self.fs, count, index_offset)
+
+    def _check(self, nonce, tag):
+        if self.closed:
+            raise ValueError("Archive is closed")
+        if len(nonce) != NONCE_SIZE or (tag is not None and len(tag) != TAG_SIZE):
+            raise ValueError(f"Nonce and tag must be {NONCE_SIZE} and {TAG_SIZE} bytes")
+
+    def _write_padded(self, data):
+        # Write bytes followed by zeros up to a whole number of blocks
+        data = memoryview(data).cast('B')
+        length = len(data)
+        self._file.write(data)
+        if length % RATE:
+            self._file.write(bytes(RATE - length % RATE))
+        self._position += _blocks(length) * RATE
+        return length
+
+    def _finish(self, start, ad_len, cipher_len, nonce, tag, timestamp):
+        raw = ENTRY.pack(ENTRY_MARKER, ad_len, start, cipher_len, time.time() if timestamp is None else timestamp,
+                         bytes(nonce), bytes(tag))
+        self._file.write(raw)
+        self._position += len(raw)
+        self._index += raw
+        return len(self) - 1
+
+    def append(self, nonce, ciphertext, tag, associated_data=b'', timestamp=None):
+        """
+        Append one complete record.
+
+        Args:
+            nonce (bytes): 16-byte nonce
+            ciphertext (bytes-like): Ciphertext, any length
+            tag (bytes): 16-byte tag
+            associated_data (bytes-like): Associated data, unpadded
+            timestamp (float): Capture time (default: now)
+
+        Returns:
+            int: Record ID (its position in the archive)
+        """
+        self._check(nonce, tag)
+        start = self._position
+        ad_len = self._write_padded(associated_data)
+        cipher_len = self._write_padded(ciphertext)
+        return self._finish(start, ad_len, cipher_len, nonce, tag, timestamp)
+
+    def append_stream(self, records, nonce, associated_data=b'', timestamp=None):
+        """
+        Append one record from the CipherRecords of ecg_stream.encrypt_stream,
+        writing the blocks as they arrive.
+
+        Args:
+            records (iterable of CipherRecord): Blocks of one message, the last
+                one carrying the tag
+            nonce (bytes): 16-byte nonce the message was encrypted with
+            associated_data (bytes-like): Associated data, unpadded
+            timestamp (float): Capture time (default: when the tag arrives)
+
+        Returns:
+            int: Record ID
+        """
+        self._check(nonce, None)
+        start = self._position
+        ad_len = self._write_padded(associated_data)
+        cipher_len = 0
+        tag = None
+        for record in records:
+            if cipher_len % RATE:
+                raise ValueError(f"Block {record.index} follows a partial block")
+            cipher_len += self._write_padded(record.cipher)
+            tag = record.tag
+        if tag is None or len(tag) != TAG_SIZE:
+            raise ValueError("The stream ended without a tag")
+        return self._finish(start, ad_len, cipher_len, nonce, tag, timestamp)
+
+    def flush(self):
+        """
+        Hand the buffered records to the operating system (no sync).
+        """
+        self._file.flush()
+
+    def sync(self):
+        """
+        Flush and sync the records written so far to disk.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        """
+        Write the index and the final header, and sync the file once.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            index_offset = self._position
+            self._file.write(self._index)
+            self._file.seek(0)
+            self._file.write(self._header(FLAG_CLOSED, len(self), index_offset))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        finally:
+            self._file.close()
+
+
+class ArchiveReader:
+    """
+    Memory-mapped reader of a capture archive.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Archive file
+
+        Raises:
+            ValueError: If the file is not a capture archive
+        """
+        self.path = path
+        size = os.path.getsize(path)
+        if size < HEADER.size:
+            raise ValueError(f"{path} is not a capture archive (too short)")
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+
+        (magic, version, rate, self.sample_bytes, signed, self.flags, key_id, algorithm, self.fs,
+         count, index_offset) = HEADER.unpack_from(self.data)
+        if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+            raise ValueError(f"{path} is not a capture archive (version {ARCHIVE_VERSION})")
+        if rate != RATE or algorithm != ALGORITHM:
+            raise ValueError(f"{path} holds {algorithm.decode()} records with {rate}-byte blocks")
+        self.signed = bool(signed)
+        self.key_id = key_id.rstrip(b'\0')
+        self.algorithm = algorithm.decode()
+
+        if self.flags & FLAG_CLOSED:
+            end = index_offset + count * ENTRY_DTYPE.itemsize
+            if end > size:
+                raise ValueError(f"{path} is truncated: index ends at {end}, file at {size}")
+            self.index = self.data[index_offset:end].view(ENTRY_DTYPE)
+        else:
+            self.index = self._recover(index_offset or size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, record_id):
+        return self.record(record_id)
+
+    def __iter__(self):
+        return (self.record(i) for i in range(len(self)))
+
+    @property
+    def complete(self):
+        """
+        Returns:
+            bool: False for an archive that was not closed, whose index was rebuilt
+        """
+        return bool(self.flags & FLAG_CLOSED)
+
+    @property
+    def nonces(self):
+        """
+        Returns:
+            numpy.ndarray: (N, 16) view of every record's nonce
+        """
+        return self.index['nonce']
+
+    @property
+    def tags(self):
+        """
+        Returns:
+            numpy.ndarray: (N, 16) view of every record's tag
+        """
+        return self.index['tag']
+
+    def _recover(self, end):
+        """
+        Rebuild the index of an archive that was not closed, following the
+        entries written after each record back from the end of the file. A
+        record cut short at the end is skipped.
+        """
+        entries = []
+        position = end - end % RATE
+        size = ENTRY_DTYPE.itemsize
+        while position - size >= HEADER.size:
+            entry = self.data[position - size:position].view(ENTRY_DTYPE)[0]
+            start = int(entry['offset'])
+            valid = entry['marker'] == ENTRY_MARKER and start >= HEADER.size and \
+                start + (_blocks(int(entry['ad_len'])) + _blocks(int(entry['cipher_len']))) * RATE == position - size
+            if valid:
+                entries.append(self.data[position - size:position])
+                position = start
+            elif entries:
+                # The chain of records is broken: keep the records after the break
+                break
+            else:
+                # Bytes of a record that was never finished
+                position -= RATE
+        entries.reverse()
+        if not entries:
+            return np.zeros(0, ENTRY_DTYPE)
+        return np.concatenate(entries).view(ENTRY_DTYPE)
+
+    def _span(self, record_id):
+        entry = self.index[record_id]
+        start = int(entry['offset'])
+        ad_end = start + _blocks(int(entry['ad_len'])) * RATE
+        return entry, start, ad_end
+
+    def associated_data(self, record_id):
+        """
+        Returns:
+            numpy.ndarray: uint8 view of the record's associated data
+        """
+        entry, start, _ = self._span(record_id)
+        return self.data[start:start + int(entry['ad_len'])]
+
+    def cipher_blocks(self, record_id):
+        """
+        Ciphertext of a record as 8-byte blocks, the last one zero-padded.
+
+        Returns:
+            numpy.ndarray: (blocks, 8) uint8 view
+        """
+        entry, _, ad_end = self._span(record_id)
+        return self.data[ad_end:ad_end + _blocks(int(entry['cipher_len'])) * RATE].reshape(-1, RATE)
+
+    def ciphertext(self, record_id):
+        """
+        Returns:
+            numpy.ndarray: uint8 view of the record's ciphertext, unpadded
+        """
+        entry, _, ad_end = self._span(record_id)
+        return self.data[ad_end:ad_end + int(entry['cipher_len'])]
+
+    def record(self, record_id):
+        """
+        Returns:
+            ArchiveRecord: Record with the given ID, as views of the file
+        """
+        if record_id < 0:
+            record_id += len(self)
+        if not 0 <= record_id < len(self):
+            raise IndexError(f"Record {record_id} out of range ({len(self)} records)")
+        entry = self.index[record_id]
+        return ArchiveRecord(record_id, float(entry['timestamp']), entry['nonce'],
+                             self.associated_data(record_id), self.ciphertext(record_id), entry['tag'])
+
+    def close(self):
+        """
+        Release the mapping. Views handed out keep it alive until they are dropped.
+        """
+        self.index = np.zeros(0, ENTRY_DTYPE)
+        self.data = None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Show the contents of an ECG capture archive')
+    parser.add_argument('path', help='Capture archive')
+    parser.add_argument('--record', '-r', type=int, action='append', default=[],
+                        help='Print this record (may be repeated)')
+
+    args = parser.parse_args()
+
+    with ArchiveReader(args.path) as archive:
+        print(f"{args.path}: {len(archive)} records, key ID {archive.key_id.hex().upper()}, "
+              f"{archive.algorithm}, {archive.sample_bytes}-byte {'signed' if archive.signed else 'unsigned'} "
+              f"samples, fs {archive.fs:g} Hz{'' if archive.complete else ' (not closed, index rebuilt)'}")
+        if len(archive):
+            lengths = archive.index['cipher_len']
+            print(f"Ciphertext: {int(lengths.sum())} bytes, {int(lengths.min())}-{int(lengths.max())} per record")
+        for record_id in args.record:
+            record = archive.record(record_id)
+            print(f"Record {record.record_id} at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.timestamp))}")
+            print(f"  Nonce: {record.nonce.tobytes().hex().upper()}")
+            print(f"  AD:    {record.associated_data.tobytes().hex().upper()}")
+            print(f"  Tag:   {record.tag.tobytes().hex().upper()}")
+            for i, block in enumerate(archive.cipher_blocks(record_id)):
+                print(f"  Block {i:4d}: {block.tobytes().hex().upper()}")
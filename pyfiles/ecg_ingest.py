@@ -0,0 +1,245 @@
+"""
+Zero-copy ingestion of large ECG recordings.
+
+Raw binary and WFDB signal files are memory-mapped with numpy.memmap, so
+opening a multi-hour recording is instant and only the pages being encrypted
+are resident. Leads are exposed as strided views and the byte stream is
+handed to the encryption path in 64-bit-block-aligned windows that are views
+of the mapping, not copies. WFDB format 212, used by the MIT-BIH databases,
+packs two samples in three bytes: it is decoded to int16 in memory instead.
+"""
+
+import mmap
+import os
+
+import numpy as np
+
+from ascon128 import RATE
+
+# Sample types of the WFDB storage formats that can be mapped directly
+WFDB_FORMATS = {
+    '80': np.dtype(np.uint8),    # 8-bit offset binary
+    '16': np.dtype('<i2'),       # 16-bit two's complement, little-endian
+    '61': np.dtype('>i2'),       # 16-bit two's complement, big-endian
+    '32': np.dtype('<i4'),       # 32-bit two's complement, little-endian
+}
+
+# WFDB format of two 12-bit samples packed in three bytes, decoded by unpack_212
+WFDB_PACKED_FORMAT = '212'
+
+# Default window size handed to the encryption path, in 64-bit blocks
+DEFAULT_WINDOW_BLOCKS = 4096
+
+
+def unpack_212(data):
+    """
+    Decode WFDB format 212 samples.
+
+    Each pair of samples is stored in three bytes: the first sample in the
+    first byte and the low nibble of the second, the second sample in the
+    third byte and the high nibble of the second, both 12-bit two's
+    complement. An odd sample count ends with a two-byte group.
+
+    Args:
+        data (bytes-like or numpy.ndarray): Packed bytes
+
+    Returns:
+        numpy.ndarray: int16 samples, in file order
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    n_pairs = len(data) // 3
+    groups = data[:n_pairs * 3].reshape(n_pairs, 3).astype(np.int16)
+    samples = np.empty(len(data) * 2 // 3, dtype=np.int16)
+    samples[0:2 * n_pairs:2] = groups[:, 0] | ((groups[:, 1] & 0x0F) << 8)
+    samples[1:2 * n_pairs:2] = groups[:, 2] | ((groups[:, 1] & 0xF0) << 4)
+    if len(data) % 3 == 2:
+        samples[-1] = int(data[-2]) | ((int(data[-1]) & 0x0F) << 8)
+    samples[samples >= 2048] -= 4096
+    return samples
+
+
+class Recording:
+    """
+    Memory-mapped multi-lead ECG recording.
+
+    Samples are stored frame by frame: one sample of each lead, then the next
+    frame, as in WFDB signal files.
+    """
+
+    def __init__(self, path, n_leads=1, dtype=np.uint8, offset=0, fs=None, packed=False):
+        """
+        Args:
+            path (str): Signal file
+            n_leads (int): Number of interleaved leads
+            dtype (numpy.dtype): Sample type (default: uint8, as in ascon_tb.sv)
+            offset (int): Bytes to skip at the start of the file
+            fs (float): Sampling frequency in Hz, if known
+            packed (bool): The file is in WFDB format 212; its samples are
+                decoded to int16 in memory and `dtype` is ignored
+        """
+        self.path = path
+        self.n_leads = n_leads
+        self.dtype = np.dtype('<i2' if packed else dtype)
+        self.offset = offset
+        self.fs = fs
+
+        if packed:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                samples = unpack_212(f.read())
+            n_frames = len(samples) // n_leads
+            if n_frames <= 0:
+                raise ValueError(f"{path} holds no complete frame of {n_leads} leads")
+            self.frames = samples[:n_frames * n_leads].reshape(n_frames, n_leads)
+            return
+
+        frame_size = self.dtype.itemsize * n_leads
+        n_frames = (os.path.getsize(path) - offset) // frame_size
+        if n_frames <= 0:
+            raise ValueError(f"{path} holds no complete frame of {n_leads} leads")
+        self.frames = np.memmap(path, dtype=self.dtype, mode='r', offset=offset,
+                                shape=(n_frames, n_leads))
+        self._advise(getattr(mmap, 'MADV_SEQUENTIAL', None), 0)
+
+    @classmethod
+    def from_header(cls, header_path):
+        """
+        Open a WFDB record from its header (.hea) file.
+
+        All signals must be stored in the same file with a format listed in
+        WFDB_FORMATS, or in format 212 (which is decoded, not mapped).
+
+        Args:
+            header_path (str): Path of the .hea file
+
+        Returns:
+            Recording: Mapped recording
+        """
+        with open(header_path) as f:
+            lines = [line.split() for line in f if line.strip() and not line.startswith('#')]
+
+        record_line, signal_lines = lines[0], lines[1:]
+        n_leads = int(record_line[1])
+        fs = float(record_line[2].split('/')[0]) if len(record_line) > 2 else None
+
+        files = {line[0] for line in signal_lines[:n_leads]}
+        formats = {line[1].split('x')[0].split(':')[0].split('+')[0] for line in signal_lines[:n_leads]}
+        if len(files) != 1 or len(formats) != 1:
+            raise ValueError(f"{header_path}: all signals must share one file and one format")
+        fmt = formats.pop()
+        if fmt not in WFDB_FORMATS and fmt != WFDB_PACKED_FORMAT:
+            raise ValueError(f"{header_path}: WFDB format {fmt} is not supported")
+
+        # Byte offset is the '+offset' suffix of the format field, if any
+        format_field = signal_lines[0][1]
+        offset = int(format_field.split('+')[1]) if '+' in format_field else 0
+        path = os.path.join(os.path.dirname(header_path), files.pop())
+        if fmt == WFDB_PACKED_FORMAT:
+            return cls(path, n_leads, offset=offset, fs=fs, packed=True)
+        return cls(path, n_leads, WFDB_FORMATS[fmt], offset, fs)
+
+    def __len__(self):
+        return self.frames.shape[0]
+
+    @property
+    def raw(self):
+        """
+        Returns:
+            numpy.ndarray: uint8 view of every sample byte, in file order
+        """
+        return self.frames.reshape(-1).view(np.uint8)
+
+    def lead(self, index):
+        """
+        Samples of one lead.
+
+        Args:
+            index (int): Lead number
+
+        Returns:
+            numpy.ndarray: Strided view, no copy
+        """
+        return self.frames[:, index]
+
+    def block_windows(self, window_blocks=DEFAULT_WINDOW_BLOCKS, lead=None):
+        """
+        Hand out the recording bytes in windows of whole 64-bit blocks.
+
+        Windows over the whole frame stream (or over a single-lead recording)
+        are views of the mapping. A single lead of a multi-lead recording is
+        not contiguous in the file, so each of its windows is gathered into a
+        new buffer (one window at a time, never the whole lead). Pages of windows already handed out are
+        released, keeping the resident set bounded.
+
+        Args:
+            window_blocks (int): Window size in 64-bit blocks
+            lead (int): Lead to extract, None for the interleaved frame stream
+
+        Yields:
+            memoryview: Window of bytes; all but the last are a multiple of 8 bytes
+        """
+        window = window_blocks * RATE
+        if lead is None or self.n_leads == 1:
+            data = self.raw
+            for start in range(0, len(data), window):
+                yield memoryview(data[start:start + window])
+                self._release(start, window)
+            return
+
+        samples = self.lead(lead)
+        per_window = window // self.dtype.itemsize
+        for start in range(0, len(samples), per_window):
+            # Each window gets its own buffer: consumers may hold views of earlier ones
+            chunk = np.ascontiguousarray(samples[start:start + per_window])
+            yield memoryview(chunk.view(np.uint8))
+            self._release(start * self.frames.strides[0], per_window * self.frames.strides[0])
+
+    def _release(self, start, length):
+        self._advise(getattr(mmap, 'MADV_DONTNEED', None), start, length)
+
+    def _advise(self, option, start, length=None):
+        # numpy.memmap keeps its mmap object in _mmap; the mapping starts at the
+        # allocation-granularity boundary below `offset`
+        mapping = getattr(self.frames, '_mmap', None)
+        if option is None or mapping is None or not hasattr(mapping, 'madvise'):
+            return
+        start += self.offset % mmap.ALLOCATIONGRANULARITY
+        first = start - start % mmap.PAGESIZE
+        end = len(mapping) if length is None else min(start + length, len(mapping))
+        if end > first:
+            mapping.madvise(option, first, end - first)
+
+
+if __name__ == '__main__':
+    import argparse
+    import resource
+    import time
+
+    parser = argparse.ArgumentParser(description='Map an ECG recording and walk its block windows')
+    parser.add_argument('path', help='Raw signal file, or WFDB header (.hea)')
+    parser.add_argument('--leads', type=int, default=1,
+                        help='Number of interleaved leads of a raw file (default: 1)')
+    parser.add_argument('--dtype', type=str, default='u1',
+                        help='NumPy sample type of a raw file (default: u1)')
+    parser.add_argument('--lead', type=int, default=None,
+                        help='Walk only this lead (default: interleaved frames)')
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.path.endswith('.hea'):
+        recording = Recording.from_header(args.path)
+    else:
+        recording = Recording(args.path, args.leads, args.dtype)
+    opened = time.perf_counter() - start
+
+    checksum = 0
+    size = 0
+    for window in recording.block_windows(lead=args.lead):
+        checksum ^= int(np.bitwise_xor.reduce(np.frombuffer(window, np.uint8)))
+        size += len(window)
+    walked = time.perf_counter() - start - opened
+
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{len(recording)} frames x {recording.n_leads} leads ({recording.dtype}), opened in {opened * 1e3:.2f} ms")
+    print(f"{size} bytes walked in {walked:.3f} s, XOR checksum 0x{checksum:02X}, peak RSS {rss_mb:.1f} MB")
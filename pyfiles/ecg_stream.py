@@ -0,0 +1,240 @@
+"""
+Streaming ECG encryption pipeline.
+
+Samples are packed into 64-bit blocks with ASCON padding, streamed to an
+encryptor (the board through the ASCON mailbox, or the reference model) with
+a bounded number of blocks in flight, and the (cipher block, tag) records are
+yielded as they complete. Memory use does not depend on the recording length.
+"""
+
+import itertools
+from collections import deque, namedtuple
+
+from ascon128 import RATE, AsconState, pad, to_blocks
+
+# Samples converted to bytes at a time by samples_to_chunks
+CHUNK_SAMPLES = 512
+
+# One encrypted block of a recording. `cipher` holds only the bytes that carry
+# plaintext (shorter for the last block); `tag` is set on the last record only.
+CipherRecord = namedtuple('CipherRecord', ['index', 'cipher', 'tag'])
+
+
+def samples_to_chunks(samples, sample_bytes=1, signed=False):
+    """
+    Convert integer samples to big-endian bytes, a chunk at a time.
+
+    Args:
+        samples (iterable of int): ECG samples
+        sample_bytes (int): Bytes per sample (1 as in ascon_tb.sv, or 2)
+        signed (bool): Encode samples as two's complement
+
+    Yields:
+        bytes: Encoded samples, CHUNK_SAMPLES at a time
+    """
+    samples = iter(samples)
+    while True:
+        batch = list(itertools.islice(samples, CHUNK_SAMPLES))
+        if not batch:
+            return
+        if sample_bytes == 1 and not signed:
+            yield bytes(batch)
+        else:
+            yield b''.join(sample.to_bytes(sample_bytes, 'big', signed=signed) for sample in batch)
+
+
+def pack_blocks(chunks):
+    """
+    Pack a byte stream into 8-byte ASCON blocks, padding the last one.
+
+    The last block always carries the 0x80 padding byte, so a stream whose
+    length is a multiple of 8 ends with a block made only of padding.
+
+    Full blocks inside a chunk are yielded as memoryview slices of it, so
+    block-aligned windows (see ecg_ingest.py) are not copied. Chunks must not
+    be modified once handed over.
+
+    Args:
+        chunks (iterable of bytes-like): Plaintext, in pieces of any size
+
+    Yields:
+        tuple: (8-byte block, number of plaintext bytes in it, True for the last block)
+    """
+    pending = bytearray()
+    held = None
+    for chunk in chunks:
+        view = memoryview(chunk).cast('B')
+        start = 0
+        if pending:
+            # Complete the block left over from the previous chunk
+            start = min(RATE - len(pending), len(view))
+            pending += view[:start]
+            if len(pending) < RATE:
+                continue
+            if held is not None:
+                yield held, RATE, False
+            held = bytes(pending)
+            pending.clear()
+
+        full = start + (len(view) - start) // RATE * RATE
+        for offset in range(start, full, RATE):
+            # Hold one full block back: it is the last one if the stream ends here
+            if held is not None:
+                yield held, RATE, False
+            held = view[offset:offset + RATE]
+        pending += view[full:]
+
+    if held is not None:
+        yield held, RATE, False
+    yield pad(pending), len(pending), True
+
+
+class ReferenceEncryptor:
+    """
+    Encryptor backed by the ascon128 reference model, with the same interface
+    as ascon_mailbox.BoardEncryptor.
+    """
+
+    def __init__(self):
+        self._ascon = None
+
+    def start(self, key, nonce, associated_data=b''):
+        """
+        Run the initialisation and absorb the associated data.
+
+        Args:
+            key (bytes): 16-byte key
+            nonce (bytes): 16-byte nonce
+            associated_data (bytes): Associated data, unpadded
+        """
+        self._ascon = AsconState(key, nonce)
+        if associated_data:
+            for block in to_blocks(pad(associated_data)):
+                self._ascon.absorb_block(block)
+        self._ascon.end_associated_data()
+
+    def submit(self, block, last=False):
+        """
+        Encrypt one padded plaintext block.
+
+        Returns:
+            tuple: Handle to pass to collect()
+        """
+        value = int.from_bytes(block, 'big')
+        if not last:
+            return self._ascon.encrypt_block(value).to_bytes(RATE, 'big'), None
+        cipher, tag = self._ascon.finalize(value)
+        return cipher.to_bytes(RATE, 'big'), tag.to_bytes(16, 'big')
+
+    def collect(self, handle):
+        """
+        Returns:
+            tuple: (8-byte cipher block, 16-byte tag or None)
+        """
+        return handle
+
+
+def encrypt_stream(samples, encryptor, key, nonce, associated_data=b'', sample_bytes=1,
+                   signed=False, depth=4):
+    """
+    Encrypt a recording block by block and yield the records as they complete.
+
+    Args:
+        samples (iterable): Integer samples, or bytes-like chunks if sample_bytes is None
+        encryptor: BoardEncryptor or ReferenceEncryptor
+        key (bytes): 16-byte key
+        nonce (bytes): 16-byte nonce
+        associated_data (bytes): Associated data, unpadded
+        sample_bytes (int): Bytes per sample, None if `samples` already yields bytes
+        signed (bool): Encode samples as two's complement
+        depth (int): Maximum number of blocks submitted but not yet yielded
+
+    Yields:
+        CipherRecord: One record per block, in order; the last one carries the tag
+    """
+    chunks = samples if sample_bytes is None else samples_to_chunks(samples, sample_bytes, signed)
+    encryptor.start(key, nonce, associated_data)
+
+    in_flight = deque()
+    for index, (block, length, last) in enumerate(pack_blocks(chunks)):
+        in_flight.append((index, length, encryptor.submit(block, last)))
+        if len(in_flight) > depth:
+            yield _complete(encryptor, *in_flight.popleft())
+    while in_flight:
+        yield _complete(encryptor, *in_flight.popleft())
+
+
+def _complete(encryptor, index, length, handle):
+    cipher, tag = encryptor.collect(handle)
+    return CipherRecord(index, cipher[:length], tag)
+
+
+if __name__ == '__main__':
+    import argparse
+    import logging
+
+    from ascon128 import ECG_ASSOCIATED_DATA, ECG_KEY, ECG_NONCE, ECG_PLAINTEXT, encrypt
+
+    parser = argparse.ArgumentParser(description='Encrypt an ECG recording block by block')
+    parser.add_argument('input', nargs='?', default=None,
+                        help='Raw recording file (default: ECG trace of ascon_tb.sv)')
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--port', '-p', type=str, default=None,
+                        help='Serial port of the FPGA (default: reference model)')
+    target.add_argument('--sim', action='store_true',
+                        help='Use a local virtual FPGA with the ASCON mailbox')
+    parser.add_argument('--baud', '-b', type=int, default=115200,
+                        help='Baud rate (default: 115200)')
+    parser.add_argument('--reliable', action='store_true',
+                        help='Send the blocks in CRC-checked frames with retransmission')
+    parser.add_argument('--quiet', '-q', action='store_true',
+                        help='Only print the tag and the verification result')
+    parser.add_argument('--archive', type=str, default=None,
+                        help='Write the encrypted record to this capture archive (see ecg_archive.py)')
+
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, 'rb') as f:
+            plaintext = f.read()
+    else:
+        plaintext = ECG_PLAINTEXT
+
+    device = fpga = None
+    if args.port or args.sim:
+        from ascon_mailbox import BoardEncryptor
+        from uart_improv3 import FPGA
+        port = args.port
+        if args.sim:
+            from fpga_sim import AsconMailboxModel, VirtualFPGA
+            device = VirtualFPGA(baud_rate=args.baud, model=AsconMailboxModel())
+            port = device.start()
+        fpga = FPGA(port=port, baud_rate=args.baud, reliable=args.reliable, log_level=logging.WARNING)
+        if not fpga.open_instrument():
+            raise SystemExit(f"Failed to connect to FPGA on port {port}")
+        encryptor = BoardEncryptor(fpga)
+    else:
+        encryptor = ReferenceEncryptor()
+
+    try:
+        cipher = bytearray()
+        for record in encrypt_stream([plaintext], encryptor, ECG_KEY, ECG_NONCE,
+                                     ECG_ASSOCIATED_DATA, sample_bytes=None):
+            cipher += record.cipher
+            if not args.quiet:
+                print(f"Block {record.index:4d}: {record.cipher.hex().upper()}")
+            if record.tag is not None:
+                tag = record.tag
+        expected = encrypt(ECG_KEY, ECG_NONCE, ECG_ASSOCIATED_DATA, plaintext)
+        print(f"Tag: {tag.hex().upper()}")
+        print(f"Reference model check: {'OK' if (bytes(cipher), tag) == expected else 'MISMATCH'}")
+        if args.archive:
+            from ecg_archive import ArchiveWriter, key_fingerprint
+            with ArchiveWriter(args.archive, key_fingerprint(ECG_KEY)) as archive:
+                archive.append(ECG_NONCE, cipher, tag, ECG_ASSOCIATED_DATA)
+            print(f"Record written to {args.archive}")
+    finally:
+        if fpga is not None:
+            fpga.close_instrument()
+        if device is not None:
+            device.stop()
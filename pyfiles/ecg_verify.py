@@ -0,0 +1,337 @@
+"""
+Parallel verification and decryption of captured ASCON-128 records.
+
+Records (key, nonce, associated data, ciphertext, tag) are checked against
+the ascon128 reference model on a pool of worker processes. The inputs are
+never pickled: a capture archive (see ecg_archive.py) is memory-mapped by
+every worker, so all of them share the page cache, and records held in
+memory are packed once into a multiprocessing.shared_memory block that the
+workers attach to. Only record ranges travel to the workers and only the IDs
+of failed records come back.
+
+Each worker groups its range by (associated data, ciphertext) length and
+decrypts every group with ascon128.decrypt_batch, one uint64 lane per
+record. Decrypted plaintext can be written to an output file that the
+workers map as well, each record at the position given by the cumulative
+ciphertext lengths.
+
+    python ecg_verify.py capture.ecgc --key 8A55114D1CB6A9A2BE263D4D7AECAAFF
+"""
+
+import logging
+import os
+import time
+from collections import namedtuple
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from ascon128 import RATE, decrypt_batch
+from ecg_archive import ArchiveReader, key_fingerprint
+
+# Records per task handed to a worker
+DEFAULT_CHUNK_RECORDS = 4096
+
+# Records decrypted together at most, bounding the memory of a group
+MAX_BATCH_RECORDS = 65536
+
+# Records packed into shared memory: where each one's associated data starts
+# in the payload (its ciphertext follows at the next block boundary), as in
+# the index of a capture archive
+SHARED_DTYPE = np.dtype([
+    ('key', 'u1', 16),
+    ('nonce', 'u1', 16),
+    ('tag', 'u1', 16),
+    ('offset', '<u8'),
+    ('ad_len', '<u8'),
+    ('cipher_len', '<u8'),
+])
+
+# Outcome of a verification run
+VerifyReport = namedtuple('VerifyReport', ['records', 'bytes', 'failed', 'elapsed', 'processes'])
+
+# Input of the worker processes, opened once per process by _init_worker
+_source = None
+
+
+def _blocks(length):
+    return -(-length // RATE)
+
+
+class SharedRecords:
+    """
+    Captured records packed into one shared memory block: a SHARED_DTYPE
+    table followed by the associated data and ciphertext, each padded to
+    whole 8-byte blocks.
+    """
+
+    def __init__(self, name):
+        """
+        Attach to a block created by pack().
+
+        Args:
+            name (str): Name of the shared memory block
+        """
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.owner = False
+        self._views()
+
+    @classmethod
+    def pack(cls, records):
+        """
+        Copy records into a new shared memory block.
+
+        Args:
+            records (list of tuple): (key, nonce, associated_data, ciphertext, tag)
+
+        Returns:
+            SharedRecords: Owner of the block; close() releases and unlinks it
+        """
+        count = len(records)
+        payload = sum((_blocks(len(ad)) + _blocks(len(cipher))) * RATE for _, _, ad, cipher, _ in records)
+        table_size = count * SHARED_DTYPE.itemsize
+        self = cls.__new__(cls)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(8 + table_size + payload, 1))
+        self.owner = True
+        self.shm.buf[:8] = count.to_bytes(8, 'little')
+        self._views()
+
+        offset = 0
+        for row, (key, nonce, ad, cipher, tag) in zip(self.table, records):
+            row['key'] = np.frombuffer(bytes(key), np.uint8)
+            row['nonce'] = np.frombuffer(bytes(nonce), np.uint8)
+            row['tag'] = np.frombuffer(bytes(tag), np.uint8)
+            row['offset'] = offset
+            row['ad_len'] = len(ad)
+            row['cipher_len'] = len(cipher)
+            self.payload[offset:offset + len(ad)] = np.frombuffer(bytes(ad), np.uint8)
+            offset += _blocks(len(ad)) * RATE
+            self.payload[offset:offset + len(cipher)] = np.frombuffer(bytes(cipher), np.uint8)
+            offset += _blocks(len(cipher)) * RATE
+        return self
+
+    def _views(self):
+        buffer = np.frombuffer(self.shm.buf, np.uint8)
+        count = int.from_bytes(bytes(buffer[:8]), 'little')
+        table_end = 8 + count * SHARED_DTYPE.itemsize
+        self.table = buffer[8:table_end].view(SHARED_DTYPE)
+        self.payload = buffer[table_end:]
+
+    def close(self):
+        """
+        Detach from the block, and unlink it if this object created it.
+        """
+        # Views must go before the buffer can be released
+        self.table = self.payload = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class _ArchiveSource:
+    # Records of a capture archive, all under one key
+    def __init__(self, path, key):
+        self.reader = ArchiveReader(path)
+        self.key = np.frombuffer(bytes(key), np.uint8)
+
+    def columns(self, start, stop):
+        index = self.reader.index[start:stop]
+        keys = np.broadcast_to(self.key, (len(index), 16))
+        return keys, index, self.reader.data
+
+
+class _SharedSource:
+    # Records packed in shared memory; the pool's workers share the parent's
+    # resource tracker, so the block is unlinked once, by its creator
+    def __init__(self, name):
+        self.records = SharedRecords(name)
+
+    def columns(self, start, stop):
+        table = self.records.table[start:stop]
+        return table['key'], table, self.records.payload
+
+
+def _init_worker(kind, location, key, output):
+    global _source
+    source = _ArchiveSource(location, key) if kind == 'archive' else _SharedSource(location)
+    plaintext = None
+    if output is not None:
+        path, offsets = output
+        plaintext = (np.memmap(path, dtype=np.uint8, mode='r+'), offsets)
+    _source = (source, plaintext)
+
+
+def _gather(payload, starts, length):
+    """
+    Copy `length` bytes from each start offset into an (N, length) array.
+    """
+    if length == 0:
+        return np.zeros((len(starts), 0), np.uint8)
+    return payload[starts[:, np.newaxis] + np.arange(length)]
+
+
+def verify_range(keys, index, payload, plaintext=None, first_id=0):
+    """
+    Decrypt and authenticate a range of records.
+
+    Args:
+        keys (numpy.ndarray): (N, 16) uint8 keys
+        index (numpy.ndarray): N records with 'nonce', 'tag', 'offset',
+            'ad_len' and 'cipher_len' fields (SHARED_DTYPE or the index of
+            a capture archive)
+        payload (numpy.ndarray): uint8 buffer the offsets point into
+        plaintext (tuple): (uint8 output buffer, start offset of each
+            record's plaintext in it), or None
+        first_id (int): Record ID of the first record
+
+    Returns:
+        numpy.ndarray: IDs of the records whose tag does not match
+    """
+    ad_len = index['ad_len'].astype(np.int64)
+    cipher_len = index['cipher_len'].astype(np.int64)
+    ad_start = index['offset'].astype(np.int64)
+    cipher_start = ad_start + (ad_len + RATE - 1) // RATE * RATE
+
+    failed = []
+    # Records of equal lengths are decrypted together
+    lengths = np.stack([ad_len, cipher_len], axis=1)
+    shapes, group = np.unique(lengths, axis=0, return_inverse=True)
+    group = group.reshape(-1)
+    for number, (ad_size, cipher_size) in enumerate(shapes):
+        members = np.flatnonzero(group == number)
+        for batch in np.array_split(members, -(-len(members) // MAX_BATCH_RECORDS)):
+            plain, valid = decrypt_batch(keys[batch], index['nonce'][batch],
+                                         _gather(payload, ad_start[batch], int(ad_size)),
+                                         _gather(payload, cipher_start[batch], int(cipher_size)),
+                                         index['tag'][batch])
+            failed.append(batch[~valid])
+            if plaintext is not None and cipher_size:
+                output, offsets = plaintext
+                plain[~valid] = 0
+                output[offsets[first_id + batch][:, np.newaxis] + np.arange(int(cipher_size))] = plain
+    failed = np.concatenate(failed) if failed else np.zeros(0, np.int64)
+    return np.sort(failed) + first_id
+
+
+def _verify_task(span):
+    source, plaintext = _source
+    start, stop = span
+    keys, index, payload = source.columns(start, stop)
+    failed = verify_range(keys, index, payload, plaintext, start)
+    return stop - start, int(index['cipher_len'].sum()), failed.tolist()
+
+
+def _run(kind, location, key, count, cipher_lengths, processes, chunk_records, plaintext_path):
+    output = None
+    if plaintext_path is not None:
+        offsets = np.zeros(count, np.int64)
+        np.cumsum(cipher_lengths[:-1], out=offsets[1:])
+        total = int(cipher_lengths.sum())
+        with open(plaintext_path, 'wb') as f:
+            f.truncate(total)
+        # np.memmap cannot map an empty file
+        output = (plaintext_path, offsets) if total else None
+
+    processes = processes or os.cpu_count() or 1
+    spans = [(start, min(start + chunk_records, count)) for start in range(0, count, chunk_records)]
+    records = size = 0
+    failed = []
+    start = time.perf_counter()
+    with Pool(processes, _init_worker, (kind, location, key, output)) as pool:
+        for checked, checked_bytes, span_failed in pool.imap_unordered(_verify_task, spans):
+            records += checked
+            size += checked_bytes
+            failed += span_failed
+    return VerifyReport(records, size, sorted(failed), time.perf_counter() - start, processes)
+
+
+def verify_archive(path, key, processes=None, chunk_records=DEFAULT_CHUNK_RECORDS, plaintext_path=None):
+    """
+    Verify every record of a capture archive on a pool of processes.
+
+    Args:
+        path (str): Capture archive
+        key (bytes): 16-byte key the records were encrypted with
+        processes (int): Worker processes (default: one per CPU)
+        chunk_records (int): Records per task
+        plaintext_path (str): File to write the decrypted records to, one
+            after the other (zeros for failed records), or None
+
+    Returns:
+        VerifyReport: Records and ciphertext bytes checked, IDs of the
+            records whose tag does not match, elapsed seconds, processes used
+    """
+    with ArchiveReader(path) as archive:
+        if archive.key_id and archive.key_id != key_fingerprint(key)[:len(archive.key_id)]:
+            logging.getLogger("ECGVerify").warning(
+                "The key does not match the key ID of %s (%s); checking anyway", path, archive.key_id.hex())
+        count = len(archive)
+        cipher_lengths = archive.index['cipher_len'].astype(np.int64)
+    return _run('archive', path, bytes(key), count, cipher_lengths, processes, chunk_records, plaintext_path)
+
+
+def verify_records(records, processes=None, chunk_records=DEFAULT_CHUNK_RECORDS, plaintext_path=None):
+    """
+    Verify records held in memory on a pool of processes, through shared memory.
+
+    Args:
+        records (list of tuple): (key, nonce, associated_data, ciphertext, tag)
+        processes (int): Worker processes (default: one per CPU)
+        chunk_records (int): Records per task
+        plaintext_path (str): File to write the decrypted records to, or None
+
+    Returns:
+        VerifyReport: As for verify_archive; record IDs are list positions
+    """
+    shared = SharedRecords.pack(records)
+    try:
+        cipher_lengths = shared.table['cipher_len'].astype(np.int64)
+        return _run('shared', shared.shm.name, None, len(records), cipher_lengths, processes,
+                    chunk_records, plaintext_path)
+    finally:
+        shared.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description='Verify and decrypt a capture archive on all CPU cores')
+    parser.add_argument('archive', help='Capture archive (see ecg_archive.py)')
+    parser.add_argument('--key', '-k', type=str, required=True,
+                        help='Key of the records, in hex')
+    parser.add_argument('--processes', '-j', type=int, default=None,
+                        help='Worker processes (default: one per CPU)')
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK_RECORDS,
+                        help=f'Records per task (default: {DEFAULT_CHUNK_RECORDS})')
+    parser.add_argument('--plaintext', type=str, default=None,
+                        help='Write the decrypted records to this file, one after the other')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the report as JSON')
+
+    args = parser.parse_args()
+
+    try:
+        key = bytes.fromhex(args.key)
+    except ValueError:
+        key = b''
+    if len(key) != 16:
+        parser.error("--key must be 16 bytes in hex")
+
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)s - %(message)s')
+    report = verify_archive(args.archive, key, args.processes, args.chunk, args.plaintext)
+
+    if args.json:
+        print(json.dumps(report._asdict(), indent=2))
+    else:
+        rate = report.records / report.elapsed if report.elapsed else 0.0
+        print(f"{report.records} records ({report.bytes} bytes) verified in {report.elapsed:.3f} s "
+              f"on {report.processes} processes: {rate:.0f} records/s, "
+              f"{report.bytes / report.elapsed / 1e6 if report.elapsed else 0.0:.2f} MB/s")
+        if report.failed:
+            print(f"{len(report.failed)} records failed the tag check: "
+                  f"{', '.join(map(str, report.failed[:50]))}{' ...' if len(report.failed) > 50 else ''}")
+        else:
+            print("All tags match")
+    sys.exit(1 if report.failed else 0)
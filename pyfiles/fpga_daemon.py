@@ -0,0 +1,575 @@
+"""
+Long-lived daemon owning an FPGA serial port, with a local RPC for clients.
+
+The daemon opens the port once and serves any number of local processes over
+a Unix socket. Requests are JSON lines:
+
+    {"id": 1, "method": "read_block", "params": {"start": 0, "length": 16}}
+
+and each gets one JSON line back, with the same id:
+
+    {"id": 1, "result": "00112233..."}
+    {"id": 1, "error": {"type": "FPGATimeoutError", "message": "..."}}
+
+A client may send several requests before reading the responses (streaming);
+they are executed in order. Requests of different clients are served round-
+robin, one request per client per turn, so a client sending a long stream
+cannot starve the others. Byte strings travel as hex.
+
+Each client has its own address register: 'set_addr' only records the
+address, and 'write', 'read' and 'display' select it on the board when
+needed, so clients sharing the board do not write to each other's addresses.
+"""
+
+import json
+import logging
+import os
+import queue
+import socket
+import tempfile
+import threading
+from collections import deque
+
+import serial
+
+from uart_improv3 import FPGA, FPGAResponseError, FPGATimeoutError, MEMORY_SIZE
+
+# Requests read from a client and not yet executed; reading stops beyond this
+MAX_QUEUED = 64
+
+# Errors re-raised under their own type by DaemonClient
+REMOTE_ERRORS = {
+    'FPGATimeoutError': FPGATimeoutError,
+    'FPGAResponseError': FPGAResponseError,
+    'ValueError': ValueError,
+}
+
+
+class DaemonError(RuntimeError):
+    """
+    Raised by DaemonClient for a daemon-side error without a local equivalent.
+    """
+
+
+def default_socket_path(port):
+    """
+    Returns:
+        str: Socket path used for a serial port when none is given
+    """
+    return os.path.join(tempfile.gettempdir(), f"fpga_{os.path.basename(port)}.sock")
+
+
+def _check_byte(value, what):
+    if not isinstance(value, int) or not 0 <= value < MEMORY_SIZE:
+        raise ValueError(f"{what} must be an integer from 0 to {MEMORY_SIZE - 1}, got {value!r}")
+    return value
+
+
+class _Session:
+    """
+    One connected client.
+    """
+
+    def __init__(self, number, conn):
+        self.number = number
+        self.conn = conn
+        self.addr = 0
+        self.requests = deque()
+        self.outgoing = queue.Queue()
+        self.served = 0
+        self.closed = False
+
+
+class FPGADaemon:
+    """
+    Serve one open FPGA to local clients over a Unix socket.
+
+    A reader and a writer thread run per client; a single scheduler thread
+    owns the FPGA and executes the requests.
+    """
+
+    # Methods callable over the socket, implemented by _rpc_<name>
+    METHODS = ('ping', 'stats', 'set_addr', 'write', 'read', 'display', 'write_block',
+               'read_block', 'batch', 'memtest')
+
+    def __init__(self, fpga, socket_path=None):
+        """
+        Args:
+            fpga (FPGA): Open FPGA connection, used only by the daemon from now on
+            socket_path (str): Unix socket to listen on (default: default_socket_path(fpga.port))
+        """
+        self.fpga = fpga
+        self.socket_path = socket_path or default_socket_path(fpga.port)
+        self.logger = logging.getLogger("FPGADaemon")
+        self.requests_served = 0
+        self._sessions = deque()
+        self._cond = threading.Condition()
+        self._running = False
+        self._listener = None
+        self._threads = []
+        self._next_session = 1
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """
+        Bind the socket and start serving.
+
+        Raises:
+            RuntimeError: If another daemon already listens on the socket
+        """
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                # Left behind by a daemon that did not stop cleanly
+                os.unlink(self.socket_path)
+            else:
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            finally:
+                probe.close()
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        self._listener.listen()
+        self._running = True
+        for target in (self._accept_loop, self._schedule_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self.logger.info("Serving %s on %s", self.fpga.port, self.socket_path)
+
+    def stop(self):
+        """
+        Stop serving, disconnect every client and remove the socket.
+
+        The FPGA is left open.
+        """
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+        try:
+            # Wake the accept loop
+            self._listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._listener.close()
+        for thread in self._threads:
+            thread.join()
+        with self._cond:
+            for session in list(self._sessions):
+                self._close_session(session)
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+        self.logger.info("Daemon on %s stopped", self.socket_path)
+
+    def serve_forever(self):
+        """
+        Start serving and block until interrupted.
+        """
+        self.start()
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                return
+            with self._cond:
+                session = _Session(self._next_session, conn)
+                self._next_session += 1
+                self._sessions.append(session)
+            self.logger.info("Client %d connected", session.number)
+            threading.Thread(target=self._read_loop, args=(session,), daemon=True).start()
+            threading.Thread(target=self._write_loop, args=(session,), daemon=True).start()
+
+    def _read_loop(self, session):
+        with session.conn.makefile('rb') as stream:
+            for line in stream:
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                except ValueError as e:
+                    session.outgoing.put({'id': None, 'error': {'type': 'ValueError',
+                                                                'message': f"Invalid request: {e}"}})
+                    continue
+                with self._cond:
+                    while len(session.requests) >= MAX_QUEUED and self._running:
+                        self._cond.wait()
+                    if not self._running:
+                        break
+                    session.requests.append(request)
+                    self._cond.notify_all()
+        with self._cond:
+            self._close_session(session)
+        self.logger.info("Client %d disconnected after %d requests", session.number, session.served)
+
+    def _write_loop(self, session):
+        while True:
+            response = session.outgoing.get()
+            if response is None:
+                return
+            try:
+                session.conn.sendall(json.dumps(response).encode() + b'\n')
+            except OSError:
+                # Client gone; the reader notices it too
+                return
+
+    def _close_session(self, session):
+        # Called with self._cond held
+        if session.closed:
+            return
+        session.closed = True
+        session.requests.clear()
+        session.outgoing.put(None)
+        try:
+            session.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        session.conn.close()
+        self._sessions.remove(session)
+        self._cond.notify_all()
+
+    def _next_request(self):
+        # Round-robin: take the oldest request of the first client that has
+        # one, then move that client to the back of the line
+        with self._cond:
+            while self._running:
+                for _ in range(len(self._sessions)):
+                    session = self._sessions[0]
+                    self._sessions.rotate(-1)
+                    if session.requests:
+                        request = session.requests.popleft()
+                        self._cond.notify_all()
+                        return session, request
+                self._cond.wait()
+        return None, None
+
+    def _schedule_loop(self):
+        while True:
+            session, request = self._next_request()
+            if session is None:
+                return
+            session.outgoing.put(self._execute(session, request))
+            session.served += 1
+            self.requests_served += 1
+
+    def _execute(self, session, request):
+        request_id = request.get('id')
+        method = request.get('method')
+        params = request.get('params') or {}
+        try:
+            if method not in self.METHODS:
+                raise ValueError(f"Unknown method: {method!r}")
+            if not isinstance(params, dict):
+                raise ValueError("params must be a JSON object")
+            try:
+                result = getattr(self, f"_rpc_{method}")(session, **params)
+            except TypeError as e:
+                raise ValueError(f"Invalid parameters for {method}: {e}") from None
+        except (FPGATimeoutError, serial.SerialException, ConnectionError) as e:
+            # The board may or may not have executed the commands
+            self.fpga.current_addr = None
+            return self._error(request_id, e)
+        except (ValueError, RuntimeError) as e:
+            return self._error(request_id, e)
+        except Exception as e:
+            # A bug in one request must not stop the scheduler serving the others
+            self.logger.exception("Request %s raised an unexpected error", request_id)
+            self.fpga.current_addr = None
+            return self._error(request_id, e)
+        return {'id': request_id, 'result': result}
+
+    def _error(self, request_id, error):
+        self.logger.warning("Request %s failed: %s", request_id, error)
+        return {'id': request_id, 'error': {'type': type(error).__name__, 'message': str(error)}}
+
+    def _select(self, session):
+        if self.fpga.current_addr != session.addr:
+            self.fpga.set_memory_addr(session.addr)
+
+    def _rpc_ping(self, session):
+        return 'pong'
+
+    def _rpc_stats(self, session):
+        with self._cond:
+            clients = {str(other.number): {'served': other.served, 'queued': len(other.requests)}
+                       for other in self._sessions}
+        stats = {'port': self.fpga.port, 'client': session.number, 'clients': clients,
+                 'requests_served': self.requests_served, 'commands_sent': self.fpga.commands_sent,
+                 'binary': self.fpga.binary}
+        if self.fpga.metrics is not None:
+            stats['metrics'] = self.fpga.metrics.snapshot()
+        return stats
+
+    def _rpc_set_addr(self, session, addr):
+        session.addr = _check_byte(addr, "Address")
+        return True
+
+    def _rpc_write(self, session, value):
+        _check_byte(value, "Value")
+        self._select(session)
+        return self.fpga.write_val_mem(value)
+
+    def _rpc_read(self, session):
+        self._select(session)
+        return int(self.fpga.read_mem_val(), 16)
+
+    def _rpc_display(self, session):
+        self._select(session)
+        return self.fpga.display_mem_vals_leds()
+
+    def _rpc_write_block(self, session, start, data):
+        return self.fpga.write_block(start, bytes.fromhex(data))
+
+    def _rpc_read_block(self, session, start, length):
+        return self.fpga.read_block(start, length).hex()
+
+    def _rpc_batch(self, session, commands, window=None):
+        # Raw protocol commands, pipelined and executed without interleaving
+        # other clients' requests
+        if not isinstance(commands, list) or not all(isinstance(c, str) for c in commands):
+            raise ValueError("commands must be a list of strings")
+        with self.fpga.pipeline(window or max(len(commands), 1)) as pipe:
+            pending = pipe.submit_many(commands)
+        results = []
+        for response in pending:
+            error = response.exception()
+            results.append(response.result() if error is None
+                           else {'type': type(error).__name__, 'message': str(error)})
+        return results
+
+    def _rpc_memtest(self, session, patterns=None, seed=None):
+        from uart_memtest import PATTERNS, run_memtest
+        if patterns is not None:
+            if not isinstance(patterns, list) or not all(isinstance(p, str) for p in patterns):
+                raise ValueError("patterns must be a list of strings")
+            unknown = [name for name in patterns if name not in PATTERNS]
+            if unknown:
+                raise ValueError(f"Unknown memory test patterns: {', '.join(unknown)} "
+                                 f"(available: {', '.join(PATTERNS)})")
+        if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+            raise ValueError("seed must be an integer")
+        return [result.summary() for result in run_memtest(self.fpga, patterns, seed)]
+
+
+class DaemonClient:
+    """
+    Client of an FPGADaemon.
+
+    The single-byte operations mirror the FPGA class, so the client can stand
+    in for it in interactive_mode (uart_improv3.py).
+    """
+
+    def __init__(self, socket_path, timeout=None):
+        """
+        Args:
+            socket_path (str): Socket of the daemon
+            timeout (float): Deadline for each daemon response in seconds (default: none)
+        """
+        self.socket_path = socket_path
+        self.logger = logging.getLogger("FPGADaemonClient")
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(socket_path)
+        self._stream = self._sock.makefile('rb')
+        self._next_id = 1
+        self._responses = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Disconnect from the daemon.
+        """
+        self._stream.close()
+        self._sock.close()
+
+    def close_instrument(self):
+        """
+        Same as close(), for code written against the FPGA class.
+        """
+        self.close()
+
+    def submit(self, method, **params):
+        """
+        Send a request without waiting for its response.
+
+        Returns:
+            int: Request id, to pass to collect()
+        """
+        request_id = self._next_id
+        self._next_id += 1
+        request = {'id': request_id, 'method': method, 'params': params}
+        self._sock.sendall(json.dumps(request).encode() + b'\n')
+        return request_id
+
+    def collect(self, request_id):
+        """
+        Wait for the response to a request.
+
+        Returns:
+            Result of the request
+
+        Raises:
+            FPGATimeoutError, FPGAResponseError, ValueError: Daemon-side error
+                of the same type
+            DaemonError: Any other daemon-side error
+            ConnectionError: If the daemon closed the connection
+        """
+        while request_id not in self._responses:
+            line = self._stream.readline()
+            if not line:
+                raise ConnectionError(f"Daemon on {self.socket_path} closed the connection")
+            response = json.loads(line)
+            self._responses[response.get('id')] = response
+        response = self._responses.pop(request_id)
+        if 'error' in response:
+            error = response['error']
+            raise REMOTE_ERRORS.get(error['type'], DaemonError)(error['message'])
+        return response['result']
+
+    def call(self, method, **params):
+        """
+        Send a request and wait for its result.
+        """
+        return self.collect(self.submit(method, **params))
+
+    def stream(self, calls, depth=16):
+        """
+        Run many requests with up to `depth` of them in flight.
+
+        Args:
+            calls (iterable of tuple): (method, params dict) pairs
+            depth (int): Maximum number of requests awaiting a response
+
+        Yields:
+            Result of each request, in order
+        """
+        in_flight = deque()
+        for method, params in calls:
+            in_flight.append(self.submit(method, **params))
+            if len(in_flight) >= depth:
+                yield self.collect(in_flight.popleft())
+        while in_flight:
+            yield self.collect(in_flight.popleft())
+
+    def set_memory_addr(self, addr):
+        return self.call('set_addr', addr=_parse_hex(addr, "Address"))
+
+    def write_val_mem(self, value):
+        return self.call('write', value=_parse_hex(value, "Value"))
+
+    def display_mem_vals_leds(self):
+        return self.call('display')
+
+    def read_mem_val(self):
+        return f"0x{self.call('read'):02X}"
+
+    def write_block(self, start_addr, data):
+        return self.call('write_block', start=start_addr, data=bytes(data).hex())
+
+    def read_block(self, start_addr, length):
+        return bytes.fromhex(self.call('read_block', start=start_addr, length=length))
+
+    def batch(self, commands, window=None):
+        """
+        Pipeline raw protocol commands on the board.
+
+        Returns:
+            list: Result of each command, or an error dict for failed ones
+        """
+        return self.call('batch', commands=list(commands), window=window)
+
+    def memtest(self, patterns=None, seed=None):
+        """
+        Returns:
+            list of str: Summary of each pattern (see uart_memtest.py)
+        """
+        return self.call('memtest', patterns=patterns, seed=seed)
+
+    def stats(self):
+        return self.call('stats')
+
+
+def _parse_hex(value, what):
+    # Accept the '0xXX' strings of the FPGA class as well as integers
+    if isinstance(value, int):
+        return value
+    if not isinstance(value, str) or not value.startswith('0x'):
+        raise ValueError(f"{what} must be a hex string (e.g., '0x00'), got {value}")
+    return int(value, 16)
+
+
+if __name__ == '__main__':
+    import argparse
+    import signal
+    import sys
+
+    parser = argparse.ArgumentParser(description='Serve an FPGA to local clients over a Unix socket')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--port', '-p', type=str, help='Serial port of the FPGA')
+    target.add_argument('--sim', action='store_true', help='Serve a local virtual FPGA')
+    parser.add_argument('--socket', '-s', type=str, default=None,
+                        help='Unix socket path (default: fpga_<port>.sock in the temp directory)')
+    parser.add_argument('--baud', '-b', type=int, default=115200,
+                        help='Baud rate (default: 115200)')
+    parser.add_argument('--timeout', '-t', type=float, default=1.0,
+                        help='Per-command response deadline in seconds (default: 1.0)')
+    parser.add_argument('--binary', action='store_true',
+                        help='Use the binary framing mode if the FPGA supports it')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve the board metrics in the Prometheus format on this local port')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    device = None
+    port = args.port
+    if args.sim:
+        from fpga_sim import VirtualFPGA
+        device = VirtualFPGA(baud_rate=args.baud)
+        port = device.start()
+
+    board = FPGA(port=port, baud_rate=args.baud, timeout=args.timeout, binary=args.binary,
+                 log_level=logging.WARNING, metrics=args.metrics_port is not None)
+    if not board.open_instrument():
+        raise SystemExit(f"Failed to connect to FPGA on port {port}")
+    metrics_server = None
+    if args.metrics_port is not None:
+        from uart_metrics import MetricsServer
+        metrics_server = MetricsServer([board], port=args.metrics_port).start()
+        print(f"Metrics served on {metrics_server.url}")
+    # Stop cleanly (and remove the socket) when terminated by a service manager
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        daemon = FPGADaemon(board, args.socket)
+        print(f"Serving {port} on {daemon.socket_path}")
+        daemon.serve_forever()
+    finally:
+        if metrics_server is not None:
+            metrics_server.stop()
+        board.close_instrument()
+        if device is not None:
+            device.stop()
@@ -0,0 +1,304 @@
+"""
+Pool of FPGA boards sharing a stream of work items.
+
+Each board is driven by its own worker thread. Idle workers take the next
+item from a shared queue, so every item goes to the least-loaded board. A
+board that times out is re-probed and retired if the probe fails, and its
+item goes back to the queue for another board. Results are returned in input
+order.
+"""
+
+import logging
+import queue
+import threading
+
+import serial
+
+from uart_improv3 import FPGA, FPGATimeoutError, parse_response
+
+# Address used by the health-check probe
+PROBE_ADDR = 0x00
+
+# Errors that mean the board (not the work item) is at fault
+BOARD_ERRORS = (FPGATimeoutError, serial.SerialException, OSError)
+
+
+class PoolExhaustedError(RuntimeError):
+    """
+    Raised when no healthy board is left to process the remaining work.
+    """
+
+
+class BoardWorker:
+    """
+    One board of the pool and its statistics.
+    """
+
+    def __init__(self, fpga):
+        self.fpga = fpga
+        self.port = fpga.port
+        self.healthy = False
+        self.completed = 0
+        self.failures = 0
+
+    def probe(self, timeout=0.2):
+        """
+        Check that the board answers an 'A' and an 'R' command in time.
+
+        Args:
+            timeout (float): Deadline of each probe command in seconds
+
+        Returns:
+            bool: True if the board answered correctly
+        """
+        try:
+            self.fpga.discard_input()
+            parse_response("A", self.fpga.send_command(f"A{PROBE_ADDR:02X}", timeout))
+            self.fpga.current_addr = PROBE_ADDR
+            parse_response("R", self.fpga.send_command("R", timeout))
+            self.healthy = True
+        except (BOARD_ERRORS + (ValueError, RuntimeError)) as e:
+            self.fpga.logger.warning(f"Health check of {self.port} failed: {e}")
+            self.healthy = False
+        return self.healthy
+
+
+class FPGAPool:
+    """
+    Pool of FPGA boards processing work items in parallel.
+
+    Work is given as a function `func(fpga, item)` applied to every item on
+    whichever board is free first.
+    """
+
+    def __init__(self, ports, max_attempts=3, probe_timeout=0.2, **fpga_kwargs):
+        """
+        Args:
+            ports (list of str): Serial ports of the boards
+            max_attempts (int): Boards an item is tried on before it fails
+            probe_timeout (float): Deadline of each health-check command in seconds
+            **fpga_kwargs: Extra arguments for every FPGA (baud_rate, timeout, ...)
+        """
+        self.ports = list(ports)
+        self.max_attempts = max_attempts
+        self.probe_timeout = probe_timeout
+        self.fpga_kwargs = fpga_kwargs
+        self.workers = []
+        self.logger = logging.getLogger("FPGAPool")
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """
+        Open every port and keep the boards that pass the health check.
+
+        Returns:
+            int: Number of healthy boards
+
+        Raises:
+            PoolExhaustedError: If no board passes the health check
+        """
+        for port in self.ports:
+            fpga = FPGA(port=port, **self.fpga_kwargs)
+            worker = BoardWorker(fpga)
+            if fpga.open_instrument() and worker.probe(self.probe_timeout):
+                self.logger.info(f"Board {port} is healthy")
+            else:
+                self.logger.warning(f"Board {port} excluded from the pool")
+            self.workers.append(worker)
+
+        healthy = sum(worker.healthy for worker in self.workers)
+        if not healthy:
+            raise PoolExhaustedError("No healthy board in the pool")
+        return healthy
+
+    def close(self):
+        """
+        Close every board of the pool.
+        """
+        for worker in self.workers:
+            worker.fpga.close_instrument()
+
+    def healthy_workers(self):
+        """
+        Returns:
+            list of BoardWorker: Boards currently accepting work
+        """
+        return [worker for worker in self.workers if worker.healthy]
+
+    def map(self, func, items):
+        """
+        Apply `func(fpga, item)` to every item, spread over the healthy boards.
+
+        Args:
+            func (callable): Work function, called with an FPGA and one item
+            items (iterable): Work items (e.g. ECG records or block ranges)
+
+        Returns:
+            list: Result of each item, in input order
+
+        Raises:
+            Exception: First error of an item that could not be processed
+        """
+        results = []
+        for ok, value in self.imap(func, items):
+            if not ok:
+                raise value
+            results.append(value)
+        return results
+
+    def imap(self, func, items):
+        """
+        Apply `func(fpga, item)` to every item and yield results in input order.
+
+        Errors raised by `func` fail only their item. Board errors (timeouts,
+        serial errors) put the item back in the queue for another board, up to
+        `max_attempts` boards.
+
+        Args:
+            func (callable): Work function, called with an FPGA and one item
+            items (iterable): Work items
+
+        Yields:
+            tuple: (True, result) or (False, exception) for each item, in input order
+        """
+        items = list(items)
+        if not items:
+            # No item would ever release the worker threads
+            return
+        work = queue.Queue()
+        done = queue.Queue()
+        for index, item in enumerate(items):
+            work.put((index, item, 0))
+
+        workers = self.healthy_workers()
+        if not workers:
+            raise PoolExhaustedError("No healthy board in the pool")
+
+        remaining = [len(items)]
+        lock = threading.Lock()
+
+        def finish(index, ok, value):
+            done.put((index, ok, value))
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    for _ in workers:
+                        work.put(None)
+
+        def run(worker):
+            while True:
+                entry = work.get()
+                if entry is None:
+                    return
+                index, item, attempts = entry
+                try:
+                    result = func(worker.fpga, item)
+                except BOARD_ERRORS as e:
+                    worker.failures += 1
+                    attempts += 1
+                    if attempts >= self.max_attempts:
+                        finish(index, False, e)
+                    else:
+                        self.logger.warning(f"Board {worker.port} failed on item {index}, redistributing: {e}")
+                        work.put((index, item, attempts))
+                    if not worker.probe(self.probe_timeout):
+                        self.logger.error(f"Board {worker.port} retired from the pool")
+                        self._retire(worker, workers, work, finish)
+                        return
+                    continue
+                except Exception as e:
+                    finish(index, False, e)
+                else:
+                    worker.completed += 1
+                    finish(index, True, result)
+
+        threads = [threading.Thread(target=run, args=(worker,), daemon=True) for worker in workers]
+        for thread in threads:
+            thread.start()
+
+        # Re-order completions into input order
+        pending = {}
+        next_index = 0
+        while next_index < len(items):
+            index, ok, value = done.get()
+            pending[index] = (ok, value)
+            while next_index in pending:
+                yield pending.pop(next_index)
+                next_index += 1
+
+        for thread in threads:
+            thread.join()
+
+    def _retire(self, worker, workers, work, finish):
+        # Called by the worker thread of a board that failed its health check
+        worker.healthy = False
+        if any(other.healthy for other in workers):
+            return
+        # Last board gone: fail everything still queued
+        error = PoolExhaustedError("No healthy board left in the pool")
+        while True:
+            try:
+                entry = work.get_nowait()
+            except queue.Empty:
+                return
+            if entry is not None:
+                finish(entry[0], False, error)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Per-port health, completed items and board failures
+        """
+        return {worker.port: {'healthy': worker.healthy, 'completed': worker.completed,
+                              'failures': worker.failures}
+                for worker in self.workers}
+
+
+def write_verify_range(fpga, item):
+    """
+    Example work function: write a block of memory and read it back.
+
+    Args:
+        fpga (FPGA): Board to use
+        item (tuple): (start address, bytes to write)
+
+    Returns:
+        bool: True if the data read back matches
+    """
+    start_addr, data = item
+    fpga.write_block(start_addr, data)
+    return fpga.read_block(start_addr, len(data)) == bytes(data)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Spread memory write/verify work over several FPGAs')
+    parser.add_argument('--port', '-p', type=str, action='append', required=True,
+                        help='Serial port, may be given several times')
+    parser.add_argument('--baud', '-b', type=int, default=115200,
+                        help='Baud rate (default: 115200)')
+    parser.add_argument('--timeout', '-t', type=float, default=1.0,
+                        help='Per-command response deadline in seconds (default: 1.0)')
+    parser.add_argument('--items', '-n', type=int, default=64,
+                        help='Number of 32-byte work items (default: 64)')
+
+    args = parser.parse_args()
+
+    work_items = [((i * 32) % 256, bytes((i + j) % 256 for j in range(32))) for i in range(args.items)]
+    with FPGAPool(args.port, baud_rate=args.baud, timeout=args.timeout,
+                  log_level=logging.WARNING) as pool:
+        start = time.perf_counter()
+        outcomes = list(pool.imap(write_verify_range, work_items))
+        elapsed = time.perf_counter() - start
+        verified = sum(1 for ok, value in outcomes if ok and value)
+        print(f"{verified}/{len(work_items)} items verified in {elapsed:.3f} s")
+        for port, stat in pool.stats().items():
+            print(f"  {port}: {stat}")
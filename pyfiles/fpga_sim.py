@@ -0,0 +1,516 @@
+"""
+Virtual FPGA speaking the A/W/G/R UART protocol over a Linux pseudo-terminal.
+
+The simulated device exposes a serial port path that the FPGA class in
+uart_improv3.py opens through its normal `port=` argument, so the client can
+be tested and benchmarked without a board.
+"""
+
+import os
+import queue
+import random
+import select
+import sys
+import threading
+import time
+import tty
+
+import ascon_mailbox
+from ascon128 import AsconState
+from uart_improv3 import (BINARY_MODE_COMMAND, OP_ADDR, OP_DISPLAY, OP_READ, OP_RELIABLE, OP_TEXT,
+                          OP_WRITE, RELIABLE_MAX_WINDOW, STATUS_BAD_LENGTH, STATUS_BAD_OPCODE,
+                          STATUS_OK)
+from uart_reliable import FRAME_DELIMITER, NAK_BODY, SEQUENCE_SPACE, decode_frame, encode_frame
+
+# Size of the simulated memory
+MEMORY_SIZE = 256
+
+# Reply to every successful command
+OK_REPLY = b'OK \n'
+
+# Reply to a command the simulator does not understand
+ERROR_REPLY = b'ERR \n'
+
+# First byte of an 'R' reply; the client skips it and reads the value byte after it
+READ_REPLY_LEAD = b'x'
+
+# Bits on the wire per byte with 8 data bits, no parity and 1 stop bit
+BITS_PER_BYTE = 10
+
+
+class FPGAModel:
+    """
+    Protocol state machine of the FPGA UART interface.
+
+    The model holds the 256-byte memory, the address register and the LED
+    value. It consumes raw command bytes and produces the replies, without
+    any timing or transport concerns. It also implements the binary framing
+    mode of uart_improv3.py, entered with the ASCII 'B' command, and the
+    reliable mode of uart_reliable.py on top of it.
+    """
+
+    def __init__(self, binary_capable=True):
+        """
+        Args:
+            binary_capable (bool): Accept the binary framing mode; False
+                answers 'B' with an error, like the current hardware
+        """
+        self.memory = bytearray(MEMORY_SIZE)
+        self.address = 0
+        self.leds = 0
+        self.commands = 0
+        self.binary_capable = binary_capable
+        self.binary = False
+        self._pending = bytearray()
+
+        # Reliable mode: frames held after a gap, and the replies of the
+        # last `window` frames, sent again when a frame is repeated
+        self.reliable = False
+        self.crc_errors = 0
+        self._window = 0
+        self._expected = 0
+        self._held = {}
+        self._reply_cache = {}
+        self._nak_for = None
+
+    def feed(self, data):
+        """
+        Consume received bytes and execute every complete command.
+
+        Args:
+            data (bytes): Bytes received from the host
+
+        Returns:
+            list of tuple: (index in `data` of the last byte of the command,
+                reply bytes) for each command completed by this chunk
+        """
+        replies = []
+        start = 0
+        # One command per iteration, since a command may switch the protocol mode
+        while start < len(data):
+            if self.reliable:
+                start = self._feed_reliable(data, start, replies)
+                continue
+            if self.binary:
+                start = self._feed_frame(data, start, replies)
+                continue
+            end = data.find(b'\n', start)
+            if end < 0:
+                self._pending += data[start:]
+                break
+            self._pending += data[start:end]
+            replies.append((end, self.execute(bytes(self._pending))))
+            self._pending.clear()
+            start = end + 1
+        return replies
+
+    def _feed_frame(self, data, start, replies):
+        # Accumulate bytes of the current binary frame; returns the index of
+        # the first byte not consumed
+        pending = self._pending
+        while start < len(data):
+            needed = (2 if len(pending) < 2 else 2 + pending[1]) - len(pending)
+            pending += data[start:start + needed]
+            start += min(needed, len(data) - start)
+            if len(pending) >= 2 and len(pending) == 2 + pending[1]:
+                replies.append((start - 1, self.execute_frame(pending[0], bytes(pending[2:]))))
+                pending.clear()
+                break
+        return start
+
+    def _feed_reliable(self, data, start, replies):
+        # Accumulate bytes up to the next frame delimiter; returns the index
+        # of the first byte not consumed
+        end = data.find(FRAME_DELIMITER, start)
+        if end < 0:
+            self._pending += data[start:]
+            return len(data)
+        self._pending += data[start:end]
+        encoded = bytes(self._pending)
+        self._pending.clear()
+        for reply in self.receive_reliable(encoded):
+            replies.append((end, reply))
+        return end + 1
+
+    def start_reliable(self, window, expected=0):
+        """
+        Enter (or reset) the reliable mode.
+
+        Args:
+            window (int): Frames the host may leave unacknowledged
+            expected (int): Sequence number of the next frame
+        """
+        self.reliable = True
+        self._window = window
+        self._expected = expected
+        self._held.clear()
+        self._reply_cache.clear()
+        self._nak_for = None
+
+    def receive_reliable(self, encoded):
+        """
+        Handle one reliable-mode frame.
+
+        Frames are executed in sequence order: a frame after a gap is held
+        and the gap is answered with a NAK, a repeated frame gets its cached
+        reply without being executed again.
+
+        Args:
+            encoded (bytes): Frame as received, without the delimiter
+
+        Returns:
+            list of bytes: Frames to send back
+        """
+        decoded = decode_frame(encoded)
+        if decoded is None or not decoded[1]:
+            self.crc_errors += 1
+            return []
+        seq, body = decoded
+        if body[0] == OP_RELIABLE:
+            self.start_reliable(self._window, (seq + 1) % SEQUENCE_SPACE)
+            return [encode_frame(seq, bytes([STATUS_OK]))]
+
+        ahead = (seq - self._expected) % SEQUENCE_SPACE
+        if ahead >= SEQUENCE_SPACE - self._window:
+            cached = self._reply_cache.get(seq)
+            return [cached] if cached is not None else []
+        if ahead >= self._window:
+            return []
+
+        self._held[seq] = body
+        replies = []
+        while self.reliable and self._expected in self._held:
+            seq = self._expected
+            body = self._held.pop(seq)
+            reply = encode_frame(seq, self.execute_frame(body[0], bytes(body[1:])))
+            self._reply_cache[seq] = reply
+            self._reply_cache.pop((seq - self._window) % SEQUENCE_SPACE, None)
+            replies.append(reply)
+            self._expected = (seq + 1) % SEQUENCE_SPACE
+            if body[0] == OP_TEXT and not self.binary:
+                self.reliable = False
+        if self.reliable and self._held and self._nak_for != self._expected:
+            self._nak_for = self._expected
+            replies.append(encode_frame(self._expected, NAK_BODY))
+        return replies
+
+    def execute(self, command):
+        """
+        Execute one command line (without its line feed).
+
+        Args:
+            command (bytes): Command, e.g. b'AF5', b'W10', b'G', b'R'
+
+        Returns:
+            bytes: Reply to send back
+        """
+        self.commands += 1
+        command = command.strip()
+        opcode, argument = command[:1], command[1:]
+
+        if opcode in (b'A', b'W') and len(argument) == 2:
+            try:
+                value = int(argument, 16)
+            except ValueError:
+                return ERROR_REPLY
+            if opcode == b'A':
+                self.address = value
+            else:
+                self.memory[self.address] = value
+                self.on_write(self.address, value)
+            return OK_REPLY
+
+        if command == b'G':
+            self.leds = self.memory[self.address]
+            return OK_REPLY
+
+        if command == b'R':
+            return READ_REPLY_LEAD + bytes([self.memory[self.address]]) + b' ' + OK_REPLY
+
+        if command == BINARY_MODE_COMMAND.encode() and self.binary_capable:
+            self.binary = True
+            return OK_REPLY
+
+        return ERROR_REPLY
+
+    def execute_frame(self, opcode, payload):
+        """
+        Execute one binary frame.
+
+        Args:
+            opcode (int): Opcode byte
+            payload (bytes): Frame payload
+
+        Returns:
+            bytes: Reply to send back (read bytes, if any, then the status byte)
+        """
+        self.commands += 1
+        if opcode == OP_ADDR and len(payload) == 1:
+            self.address = payload[0]
+        elif opcode == OP_WRITE and payload:
+            for offset, value in enumerate(payload):
+                address = (self.address + offset) % MEMORY_SIZE
+                self.memory[address] = value
+                self.on_write(address, value)
+        elif opcode == OP_DISPLAY and not payload:
+            self.leds = self.memory[self.address]
+        elif opcode == OP_READ and len(payload) == 1:
+            values = bytes(self.memory[(self.address + offset) % MEMORY_SIZE]
+                           for offset in range(payload[0]))
+            return values + bytes([STATUS_OK])
+        elif opcode == OP_TEXT and not payload:
+            self.binary = False
+        elif opcode == OP_RELIABLE and len(payload) == 1 and 0 < payload[0] <= RELIABLE_MAX_WINDOW \
+                and not self.reliable:
+            self.start_reliable(payload[0])
+        elif opcode in (OP_ADDR, OP_WRITE, OP_DISPLAY, OP_READ, OP_TEXT, OP_RELIABLE):
+            return bytes([STATUS_BAD_LENGTH])
+        else:
+            return bytes([STATUS_BAD_OPCODE])
+        return bytes([STATUS_OK])
+
+    def on_write(self, address, value):
+        """
+        Hook called after every memory write, for models with registers.
+
+        Args:
+            address (int): Address written
+            value (int): Value written
+        """
+
+
+class AsconMailboxModel(FPGAModel):
+    """
+    FPGAModel with the ASCON-128 core mapped in memory (see ascon_mailbox.py).
+
+    Writing the control register runs the matching phase of the core
+    immediately, using the ascon128 reference model.
+    """
+
+    def __init__(self, binary_capable=True):
+        super().__init__(binary_capable)
+        self.ascon = None
+        self._in_associated_data = False
+
+    def on_write(self, address, value):
+        if address != ascon_mailbox.CONTROL_ADDR:
+            return
+        memory = self.memory
+        data = int.from_bytes(memory[ascon_mailbox.DATA_ADDR:ascon_mailbox.DATA_ADDR + 8], 'big')
+
+        if value == ascon_mailbox.CONTROL_INIT:
+            key = bytes(memory[ascon_mailbox.KEY_ADDR:ascon_mailbox.KEY_ADDR + 16])
+            nonce = bytes(memory[ascon_mailbox.NONCE_ADDR:ascon_mailbox.NONCE_ADDR + 16])
+            self.ascon = AsconState(key, nonce)
+            self._in_associated_data = True
+        elif self.ascon is None:
+            return
+        elif value == ascon_mailbox.CONTROL_ASSOCIATED:
+            self.ascon.absorb_block(data)
+        elif value in (ascon_mailbox.CONTROL_DATA, ascon_mailbox.CONTROL_FINAL):
+            if self._in_associated_data:
+                self.ascon.end_associated_data()
+                self._in_associated_data = False
+            if value == ascon_mailbox.CONTROL_DATA:
+                cipher = self.ascon.encrypt_block(data)
+            else:
+                cipher, tag = self.ascon.finalize(data)
+                memory[ascon_mailbox.TAG_ADDR:ascon_mailbox.TAG_ADDR + 16] = tag.to_bytes(16, 'big')
+                self.ascon = None
+            memory[ascon_mailbox.CIPHER_ADDR:ascon_mailbox.CIPHER_ADDR + 8] = cipher.to_bytes(8, 'big')
+
+
+class VirtualFPGA:
+    """
+    Simulated FPGA serving an FPGAModel on a pseudo-terminal.
+
+    Replies are delayed to reproduce the link: each command is only complete
+    once its bytes have crossed the wire at `baud_rate`, the device then takes
+    `latency` (plus up to `jitter`) seconds to answer, and the reply is
+    serialised at `baud_rate` behind the previous ones. Replies can be
+    corrupted, dropped or held back, and command bytes corrupted, at random
+    to exercise error handling.
+    """
+
+    def __init__(self, baud_rate=None, latency=0.0, jitter=0.0, corrupt_rate=0.0,
+                 drop_rate=0.0, seed=None, model=None, command_corrupt_rate=0.0,
+                 late_rate=0.0, late_delay=0.0):
+        """
+        Args:
+            baud_rate (int): Simulated baud rate, None for no wire pacing
+            latency (float): Processing time of a command in seconds
+            jitter (float): Maximum random extra latency in seconds
+            corrupt_rate (float): Probability of flipping a bit in each reply byte
+            drop_rate (float): Probability of dropping a whole reply
+            seed (int): Seed of the random generator, for reproducible runs
+            model (FPGAModel): Device model to serve (default: a new FPGAModel)
+            command_corrupt_rate (float): Probability of flipping a bit in
+                each command byte received
+            late_rate (float): Probability of holding a reply back by
+                `late_delay` seconds (the replies after it wait behind it)
+            late_delay (float): Extra latency of a late reply in seconds
+        """
+        self.baud_rate = baud_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.corrupt_rate = corrupt_rate
+        self.drop_rate = drop_rate
+        self.command_corrupt_rate = command_corrupt_rate
+        self.late_rate = late_rate
+        self.late_delay = late_delay
+        self.model = model if model is not None else FPGAModel()
+        self.port = None
+        self._random = random.Random(seed)
+        self._master = None
+        self._slave = None
+        self._running = False
+        self._threads = []
+        self._replies = queue.Queue()
+        self._rx_busy = 0.0
+        self._tx_busy = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def byte_time(self):
+        """
+        Returns:
+            float: Time to transfer one byte on the wire, 0 without pacing
+        """
+        return BITS_PER_BYTE / self.baud_rate if self.baud_rate else 0.0
+
+    def start(self):
+        """
+        Open the pseudo-terminal and start serving commands.
+
+        Returns:
+            str: Path of the serial port to open on the host side
+        """
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        self._threads = [threading.Thread(target=self._receive_loop, daemon=True),
+                         threading.Thread(target=self._transmit_loop, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self.port
+
+    def stop(self):
+        """
+        Stop serving and close the pseudo-terminal.
+        """
+        if not self._running:
+            return
+        self._running = False
+        self._replies.put(None)
+        for thread in self._threads:
+            thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def _receive_loop(self):
+        while self._running:
+            ready, _, _ = select.select([self._master], [], [], 0.05)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                break
+            if self.command_corrupt_rate:
+                data = self._corrupt(data, self.command_corrupt_rate)
+            now = time.monotonic()
+            rx_start = max(now, self._rx_busy)
+            self._rx_busy = rx_start + len(data) * self.byte_time
+
+            for end, reply in self.model.feed(data):
+                received = rx_start + (end + 1) * self.byte_time
+                self._schedule(received, reply)
+
+    def _schedule(self, received, reply):
+        if self.drop_rate and self._random.random() < self.drop_rate:
+            return
+        if self.corrupt_rate:
+            reply = self._corrupt(reply, self.corrupt_rate)
+
+        ready = received + self.latency
+        if self.jitter:
+            ready += self._random.uniform(0.0, self.jitter)
+        if self.late_rate and self._random.random() < self.late_rate:
+            ready += self.late_delay
+        tx_start = max(ready, self._tx_busy)
+        self._tx_busy = tx_start + len(reply) * self.byte_time
+        self._replies.put((self._tx_busy, reply))
+
+    def _corrupt(self, data, rate):
+        data = bytearray(data)
+        for i in range(len(data)):
+            if self._random.random() < rate:
+                data[i] ^= 1 << self._random.randrange(8)
+        return bytes(data)
+
+    def _transmit_loop(self):
+        while True:
+            item = self._replies.get()
+            if item is None:
+                break
+            due, reply = item
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                os.write(self._master, reply)
+            except OSError:
+                break
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Virtual FPGA on a pseudo-terminal')
+    parser.add_argument('--baud', '-b', type=int, default=None,
+                        help='Simulated baud rate (default: no wire pacing)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Command processing latency in seconds (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Maximum random extra latency in seconds (default: 0)')
+    parser.add_argument('--corrupt', type=float, default=0.0,
+                        help='Probability of flipping a bit in each reply byte (default: 0)')
+    parser.add_argument('--drop', type=float, default=0.0,
+                        help='Probability of dropping a reply (default: 0)')
+    parser.add_argument('--command-corrupt', type=float, default=0.0,
+                        help='Probability of flipping a bit in each command byte (default: 0)')
+    parser.add_argument('--late-rate', type=float, default=0.0,
+                        help='Probability of holding a reply back by --late-delay (default: 0)')
+    parser.add_argument('--late-delay', type=float, default=0.0,
+                        help='Extra latency of a late reply in seconds (default: 0)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Random seed for jitter and corruption')
+    parser.add_argument('--ascon', action='store_true',
+                        help='Map the ASCON-128 core in memory (see ascon_mailbox.py)')
+    parser.add_argument('--ascii-only', action='store_true',
+                        help='Refuse the binary framing mode, like the current hardware')
+
+    args = parser.parse_args()
+
+    model_class = AsconMailboxModel if args.ascon else FPGAModel
+    device = VirtualFPGA(baud_rate=args.baud, latency=args.latency, jitter=args.jitter,
+                         corrupt_rate=args.corrupt, drop_rate=args.drop, seed=args.seed,
+                         model=model_class(binary_capable=not args.ascii_only),
+                         command_corrupt_rate=args.command_corrupt, late_rate=args.late_rate,
+                         late_delay=args.late_delay)
+    print(f"Virtual FPGA listening on {device.start()}")
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nStopping virtual FPGA")
+    finally:
+        device.stop()
@@ -0,0 +1,45 @@
+"""
+WFDB format 212 decoding in ecg_ingest.
+
+    python -m pytest test_ecg_ingest.py
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from ecg_ingest import Recording, unpack_212
+
+
+def _pack_212(samples):
+    packed = bytearray()
+    for i in range(0, len(samples), 2):
+        first = samples[i] & 0xFFF
+        if i + 1 < len(samples):
+            second = samples[i + 1] & 0xFFF
+            packed += bytes([first & 0xFF, ((second >> 4) & 0xF0) | (first >> 8), second & 0xFF])
+        else:
+            packed += bytes([first & 0xFF, first >> 8])
+    return bytes(packed)
+
+
+@pytest.mark.parametrize('count', [0, 1, 2, 3, 1001])
+def test_unpack_212(count):
+    rng = random.Random(count)
+    samples = [-2048, 2047, 0, -1][:count] + [rng.randrange(-2048, 2048) for _ in range(count - 4)]
+    assert unpack_212(_pack_212(samples)).tolist() == samples
+
+
+def test_mit_bih_style_record(tmp_path):
+    rng = random.Random(100)
+    samples = [rng.randrange(-2048, 2048) for _ in range(2 * 500)]
+    (tmp_path / '100.dat').write_bytes(_pack_212(samples))
+    (tmp_path / '100.hea').write_text("100 2 360 500\n"
+                                      "100.dat 212 200 11 1024 995 -22131 0 MLII\n"
+                                      "100.dat 212 200 11 1024 1011 20052 0 V5\n")
+    recording = Recording.from_header(str(tmp_path / '100.hea'))
+    assert len(recording) == 500 and recording.fs == 360
+    assert recording.lead(1).tolist() == samples[1::2]
+    windows = b''.join(bytes(window) for window in recording.block_windows(window_blocks=16))
+    assert windows == np.array(samples, dtype='<i2').tobytes()
@@ -0,0 +1,31 @@
+"""
+FPGAPool on in-process simulated boards.
+
+    python -m pytest test_fpga_pool.py
+"""
+
+import logging
+import os
+
+from fpga_pool import FPGAPool
+
+
+def _pool():
+    return FPGAPool(['loop://', 'loop://'], log_level=logging.CRITICAL, log_file=os.devnull)
+
+
+def _read_back(fpga, value):
+    fpga.set_memory_addr(value)
+    fpga.write_val_mem(value)
+    return fpga.read_mem_val()
+
+
+def test_map_of_no_items_returns_at_once():
+    with _pool() as pool:
+        assert pool.map(_read_back, []) == []
+        assert list(pool.imap(_read_back, iter(()))) == []
+
+
+def test_map_keeps_input_order():
+    with _pool() as pool:
+        assert pool.map(_read_back, range(32)) == [f"0x{value:02X}" for value in range(32)]
@@ -0,0 +1,79 @@
+"""
+Late replies on the virtual FPGA must never be taken as the answer to a later
+command: every read either returns the right value or raises.
+
+    python -m pytest test_late_replies.py
+"""
+
+import asyncio
+import logging
+import os
+
+import pytest
+
+from fpga_sim import VirtualFPGA
+from uart_async import AsyncFPGA
+from uart_improv3 import FPGA, MEMORY_SIZE
+from uart_recovery import RetryPolicy
+
+PAIRS = 300
+
+
+def _expected(address):
+    return (address * 37 + 11) & 0xFF
+
+
+@pytest.mark.parametrize('options', [
+    {'adaptive_timeout': True},
+    {'adaptive_timeout': True, 'retry': RetryPolicy(attempts=3)},
+    {'timeout': 0.05, 'retry': RetryPolicy(attempts=3)},
+], ids=['adaptive', 'adaptive-retry', 'fixed-retry'])
+def test_late_replies_are_not_misattributed(options):
+    with VirtualFPGA(baud_rate=115200, late_rate=0.05, late_delay=0.08, seed=7) as device:
+        for address in range(MEMORY_SIZE):
+            device.model.memory[address] = _expected(address)
+        fpga = FPGA(port=device.port, log_level=logging.CRITICAL, log_file=os.devnull,
+                    trace_size=0, **options)
+        assert fpga.open_instrument()
+        wrong = []
+        try:
+            for i in range(PAIRS):
+                address = (i * 7) % MEMORY_SIZE
+                try:
+                    fpga.set_memory_addr(address)
+                    value = fpga.read_mem_val()
+                except (TimeoutError, ValueError):
+                    continue
+                if value != f"0x{_expected(address):02X}":
+                    wrong.append((address, value))
+        finally:
+            fpga.close_instrument()
+    assert not wrong
+
+
+def test_async_late_replies_are_not_misattributed():
+    async def run(port):
+        wrong = []
+        async with AsyncFPGA(port, timeout=0.2, log_level=logging.CRITICAL, log_file=os.devnull) as fpga:
+            for i in range(PAIRS):
+                address = (i * 7) % MEMORY_SIZE
+                try:
+                    await fpga.set_memory_addr(address)
+                    if i % 25 == 3:
+                        # Cancelled before its response arrives
+                        read = asyncio.ensure_future(fpga.read_mem_val())
+                        await asyncio.sleep(0)
+                        read.cancel()
+                        await asyncio.gather(read, return_exceptions=True)
+                        continue
+                    response = await fpga.send_command('R', timeout=0.03)
+                except (TimeoutError, ValueError):
+                    continue
+                if response[1] != _expected(address):
+                    wrong.append((address, response))
+        return wrong
+
+    with VirtualFPGA(baud_rate=115200, late_rate=0.05, late_delay=0.08, seed=7) as device:
+        for address in range(MEMORY_SIZE):
+            device.model.memory[address] = _expected(address)
+        assert not asyncio.run(run(device.port))
@@ -0,0 +1,464 @@
+"""
+asyncio client for the FPGA UART interface.
+
+AsyncFPGA offers coroutine versions of the FPGA operations of uart_improv3.py.
+The serial port is put in non-blocking mode and driven by the event loop
+(loop.add_reader / loop.add_writer), so a single process can interleave
+several boards with other I/O. Requires a POSIX serial device (Linux, macOS).
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+
+import serial
+
+from uart_improv3 import (READ_POLL_INTERVAL, FPGATimeoutError, parse_response,
+                          response_prefix_len, setup_logger)
+from uart_parser import RESPONSE_TERMINATOR
+
+
+def _hex_argument(value, what, example):
+    """
+    Normalise an address or value argument to its two hex digits.
+
+    Args:
+        value (str or int): Hex string (e.g. '0xF5') or integer
+        what (str): Argument name used in the error message
+        example (str): Example value used in the error message
+
+    Returns:
+        str: Upper-case hex digits without the '0x' prefix
+
+    Raises:
+        ValueError: If the argument format is invalid
+    """
+    if isinstance(value, int):
+        value = f"0x{value:02X}"
+    if not isinstance(value, str) or not value.startswith('0x'):
+        raise ValueError(f"{what} must be a hex string (e.g., '{example}'), got {value}")
+    return value[2:].upper()
+
+
+class AsyncFPGA:
+    """
+    Coroutine-based UART communication with an FPGA.
+
+    Commands on one AsyncFPGA are serialised by a lock, so concurrent tasks can
+    share it safely; different AsyncFPGA objects run fully concurrently.
+    """
+
+    def __init__(self, port, baud_rate=115200, parity=serial.PARITY_NONE,
+                 stop_bits=serial.STOPBITS_ONE, timeout=1, log_level=logging.INFO,
+                 log_file=None):
+        """
+        Initialize the asynchronous FPGA connection with specified parameters.
+
+        Args:
+            port (str): Serial port name (e.g., '/dev/ttyUSB0')
+            baud_rate (int): Baud rate for UART communication (default: 115200)
+            parity (str): Parity bit setting (default: PARITY_NONE)
+            stop_bits (float): Number of stop bits (default: STOPBITS_ONE)
+            timeout (float): Per-command response deadline in seconds (default: 1)
+            log_level (int): Logging level (default: logging.INFO)
+            log_file (str): Path to log file (default: None, generates timestamp-based filename)
+        """
+        self.port = port
+        self.baud_rate = baud_rate
+        self.parity = parity
+        self.stop_bits = stop_bits
+        self.timeout = timeout
+        self.uart = None
+        self.current_addr = None
+        self.logger = setup_logger(f"AsyncFPGA_{port}", log_level, log_file)
+
+        self._loop = None
+        self._lock = None
+        self._rx_buffer = bytearray()
+        self._rx_event = None
+        self._rx_error = None
+        # Prefix lengths of responses owed to cancelled commands
+        self._orphans = deque()
+        # Write of a cancelled command, still putting its bytes on the wire
+        self._unfinished_write = None
+
+    async def __aenter__(self):
+        if not await self.open_instrument():
+            raise RuntimeError(f"Could not open UART port {self.port}")
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close_instrument()
+
+    async def open_instrument(self):
+        """
+        Open the UART connection and register it with the running event loop.
+
+        Returns:
+            bool: True if connection was successful, False otherwise
+        """
+        try:
+            self.uart = serial.Serial(
+                port=self.port,
+                baudrate=self.baud_rate,
+                parity=self.parity,
+                stopbits=self.stop_bits,
+                timeout=0,
+                write_timeout=0
+            )
+        except serial.SerialException as e:
+            self.logger.error(f"Error opening UART port: {e}")
+            return False
+
+        self._loop = asyncio.get_running_loop()
+        self._lock = asyncio.Lock()
+        self._rx_event = asyncio.Event()
+        self._rx_buffer.clear()
+        self._rx_error = None
+        self._orphans.clear()
+        self._unfinished_write = None
+        self.current_addr = None
+        self._loop.add_reader(self.uart.fileno(), self._on_readable)
+        self.logger.info(f"UART port {self.port} opened successfully")
+        return True
+
+    async def close_instrument(self):
+        """
+        Unregister and close the UART connection.
+        """
+        if self.uart and self.uart.is_open:
+            if self._unfinished_write is not None:
+                self._unfinished_write.cancel()
+            self._loop.remove_reader(self.uart.fileno())
+            self.uart.close()
+            self.logger.info("UART port closed")
+        else:
+            self.logger.debug("No open UART connection to close")
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.uart.fileno(), 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            data = b''
+            self._rx_error = e
+        if not data and self._rx_error is None:
+            self._rx_error = ConnectionError(f"UART port {self.port} closed by the device")
+        if self._rx_error is not None:
+            self._loop.remove_reader(self.uart.fileno())
+        self._rx_buffer += data
+        self._rx_event.set()
+
+    def _write_nowait(self, view):
+        # Write what the port accepts now; returns the bytes left
+        try:
+            written = os.write(self.uart.fileno(), view)
+        except BlockingIOError:
+            written = 0
+        return view[written:]
+
+    async def _write(self, view):
+        fd = self.uart.fileno()
+        while view:
+            writable = self._loop.create_future()
+            self._loop.add_writer(fd, writable.set_result, None)
+            try:
+                await writable
+            finally:
+                self._loop.remove_writer(fd)
+            view = self._write_nowait(view)
+
+    async def _send_bytes(self, data, prefix_len):
+        if self._unfinished_write is not None:
+            # Let the command of a cancelled task reach the wire first
+            await asyncio.wait({self._unfinished_write})
+            error = self._unfinished_write.exception()
+            self._unfinished_write = None
+            if error is not None:
+                raise error
+        view = self._write_nowait(memoryview(data))
+        if not view:
+            return
+        write = self._loop.create_task(self._write(view))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # Half a command would garble the next one: the write carries on
+            # and the response it causes is skipped
+            self._unfinished_write = write
+            self._orphans.append(prefix_len)
+            raise
+
+    async def _read_frame(self, prefix_len):
+        while True:
+            end = self._rx_buffer.find(RESPONSE_TERMINATOR, prefix_len)
+            if end >= 0:
+                response = bytes(self._rx_buffer[:end + 1])
+                del self._rx_buffer[:end + 1]
+                return response
+            if self._rx_error is not None:
+                raise self._rx_error
+            self._rx_event.clear()
+            await self._rx_event.wait()
+
+    async def _skip_orphans(self):
+        while self._orphans:
+            await self._read_frame(self._orphans[0])
+            self._orphans.popleft()
+
+    async def resync(self, quiet=READ_POLL_INTERVAL):
+        """
+        Drop received bytes until the line has been quiet for `quiet` seconds,
+        waiting at most self.timeout.
+
+        Args:
+            quiet (float): Silence that ends the drain, in seconds
+
+        Returns:
+            int: Number of bytes dropped
+        """
+        deadline = self._loop.time() + max(self.timeout, quiet)
+        dropped = 0
+        while self._rx_error is None:
+            dropped += len(self._rx_buffer)
+            self._rx_buffer.clear()
+            self._rx_event.clear()
+            remaining = min(quiet, deadline - self._loop.time())
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._rx_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+        if dropped:
+            self.logger.warning("Resynchronised: dropped %d bytes", dropped)
+        return dropped
+
+    async def _settle_after_timeout(self, prefix_len):
+        # Wait up to self.timeout for the responses still owed, including the
+        # late one of the command that timed out, so none of them is taken as
+        # the answer to a later command; a response later than that is lost
+        self._orphans.append(prefix_len)
+        try:
+            await asyncio.wait_for(self._skip_orphans(), self.timeout)
+            self.logger.warning("Late response dropped")
+        except asyncio.TimeoutError:
+            self._orphans.clear()
+        except OSError:
+            return
+        await self.resync()
+
+    async def read_response(self, prefix_len=0, timeout=None):
+        """
+        Wait for one terminator-framed response from the FPGA.
+
+        Responses still owed to cancelled commands are skipped first; if the
+        calling task is cancelled, this response is skipped in turn when it
+        arrives. After a timeout the late response is waited for (up to
+        self.timeout) and dropped before the error is raised.
+
+        Args:
+            prefix_len (int): Number of raw bytes at the start of the response
+                that must not be searched for the terminator
+            timeout (float): Response deadline in seconds (default: self.timeout)
+
+        Returns:
+            bytes: Raw response, including the terminator
+
+        Raises:
+            FPGATimeoutError: If no complete response arrives before the deadline
+        """
+        if timeout is None:
+            timeout = self.timeout
+
+        async def next_response():
+            await self._skip_orphans()
+            return await self._read_frame(prefix_len)
+
+        try:
+            return await asyncio.wait_for(next_response(), timeout)
+        except asyncio.CancelledError:
+            self._orphans.append(prefix_len)
+            raise
+        except asyncio.TimeoutError:
+            partial = bytes(self._rx_buffer)
+            error_msg = f"No complete response within {timeout:.3f} s (received {partial!r})"
+            self.logger.error(error_msg)
+        await self._settle_after_timeout(prefix_len)
+        raise FPGATimeoutError(error_msg)
+
+    async def send_command(self, command, timeout=None):
+        """
+        Send a command to the FPGA and wait for its response.
+
+        If the calling task is cancelled while the command is written or
+        waiting for its response, the command is still written in full and its
+        response is skipped when it arrives, so later commands stay in sync.
+
+        Args:
+            command (str): Command to send
+            timeout (float): Response deadline in seconds (default: self.timeout)
+
+        Returns:
+            bytes: Raw response from the FPGA, including the terminator
+
+        Raises:
+            ValueError: If command is not a string
+            RuntimeError: If UART connection is not open
+            FPGATimeoutError: If no complete response arrives before the deadline
+        """
+        if not isinstance(command, str):
+            error_msg = "Command must be a string"
+            self.logger.error(error_msg)
+            raise ValueError(error_msg)
+
+        if not self.uart or not self.uart.is_open:
+            error_msg = "UART connection is not open"
+            self.logger.error(error_msg)
+            raise RuntimeError(error_msg)
+
+        command = command.rstrip('\n')
+        prefix_len = response_prefix_len(command)
+        async with self._lock:
+            self.logger.debug("Sending command: %s", command)
+            await self._send_bytes((command + '\n').encode('utf-8'), prefix_len)
+            raw_response = await self.read_response(prefix_len, timeout)
+        self.logger.debug("Received response: %r", raw_response)
+        return raw_response
+
+    async def _checked_command(self, command, what):
+        response = await self.send_command(command)
+        try:
+            return parse_response(command, response)
+        except ValueError as e:
+            error_msg = f"Unexpected response when {what}: {response!r}"
+            self.logger.error(error_msg)
+            raise type(e)(error_msg) from None
+
+    async def set_memory_addr(self, addr):
+        """
+        Set the memory address on the FPGA.
+
+        Args:
+            addr (str or int): Memory address as hex string (e.g., '0x00') or integer
+
+        Returns:
+            bool: True if operation was successful
+
+        Raises:
+            ValueError: If address format is invalid or response is unexpected
+        """
+        digits = _hex_argument(addr, "Address", "0x00")
+        self.logger.info("Setting memory address to: 0x%s", digits)
+        await self._checked_command(f"A{digits}", "setting address")
+        self.current_addr = int(digits, 16)
+        self.logger.info("Memory address successfully set to: 0x%s", digits)
+        return True
+
+    async def write_val_mem(self, value):
+        """
+        Write a value to the assigned memory address.
+
+        Args:
+            value (str or int): Value to write as hex string (e.g., '0xF5') or integer
+
+        Returns:
+            bool: True if operation was successful
+
+        Raises:
+            ValueError: If value format is invalid or response is unexpected
+        """
+        digits = _hex_argument(value, "Value", "0xF5")
+        self.logger.info("Writing value 0x%s to memory", digits)
+        await self._checked_command(f"W{digits}", "writing value")
+        self.logger.info("Value 0x%s successfully written to memory", digits)
+        return True
+
+    async def display_mem_vals_leds(self):
+        """
+        Display the stored value on the FPGA LEDs.
+
+        Returns:
+            bool: True if operation was successful
+
+        Raises:
+            ValueError: If response is unexpected
+        """
+        self.logger.info("Displaying memory value on LEDs")
+        await self._checked_command("G", "displaying on LEDs")
+        self.logger.info("Memory value successfully displayed on LEDs")
+        return True
+
+    async def read_mem_val(self):
+        """
+        Read the stored value from the assigned memory address.
+
+        Returns:
+            str: Value read from memory (hex string)
+
+        Raises:
+            ValueError: If response format is unexpected
+        """
+        self.logger.info("Reading value from memory")
+        value = await self._checked_command("R", "reading value")
+        value_hex = f"0x{value:02X}"
+        self.logger.info("Value %s successfully read from memory", value_hex)
+        return value_hex
+
+
+async def run_test_cycles(fpga, cycles=5):
+    """
+    Run read/write verification cycles on one board.
+
+    Args:
+        fpga (AsyncFPGA): Open asynchronous FPGA connection
+        cycles (int): Number of test cycles to run
+
+    Returns:
+        int: Number of cycles whose read-back value did not match
+    """
+    failures = 0
+    for i in range(cycles):
+        addr = i % 256
+        value = f"0x{(i * 16) % 256:02X}"
+        await fpga.set_memory_addr(addr)
+        await fpga.write_val_mem(value)
+        await fpga.display_mem_vals_leds()
+        if await fpga.read_mem_val() != value:
+            failures += 1
+    return failures
+
+
+async def _main(ports, baud_rate, timeout, cycles, log_level):
+    async def run_one(port):
+        async with AsyncFPGA(port, baud_rate=baud_rate, timeout=timeout, log_level=log_level) as fpga:
+            return await run_test_cycles(fpga, cycles)
+
+    results = await asyncio.gather(*(run_one(port) for port in ports), return_exceptions=True)
+    for port, result in zip(ports, results):
+        if isinstance(result, Exception):
+            print(f"{port}: error: {result}")
+        else:
+            print(f"{port}: {cycles - result}/{cycles} cycles verified")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run test cycles on several FPGAs concurrently')
+    parser.add_argument('--port', '-p', type=str, action='append', required=True,
+                        help='Serial port, may be given several times')
+    parser.add_argument('--baud', '-b', type=int, default=115200,
+                        help='Baud rate (default: 115200)')
+    parser.add_argument('--timeout', '-t', type=float, default=1.0,
+                        help='Per-command response deadline in seconds (default: 1.0)')
+    parser.add_argument('--cycles', '-n', type=int, default=5,
+                        help='Number of test cycles per board (default: 5)')
+    parser.add_argument('--debug', '-d', action='store_true',
+                        help='Enable debug logging')
+
+    args = parser.parse_args()
+    asyncio.run(_main(args.port, args.baud, args.timeout, args.cycles,
+                      logging.DEBUG if args.debug else logging.WARNING))
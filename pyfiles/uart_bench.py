@@ -0,0 +1,355 @@
+"""
+Throughput and latency benchmarks for the host-side FPGA UART client.
+
+Runs standard workloads against a real port or a local VirtualFPGA and
+reports commands/s, bytes/s, latency percentiles and host CPU per command as
+JSON. Each workload is run several times and the median of each metric is
+reported with its spread; a previous report can be given as a baseline to
+flag regressions larger than the tolerance plus that spread.
+"""
+
+import json
+import logging
+import platform
+import sys
+import time
+from datetime import datetime
+
+from ascon128 import ECG_ASSOCIATED_DATA, ECG_KEY, ECG_NONCE, ECG_PLAINTEXT, encrypt
+from ascon_mailbox import BoardEncryptor
+from ecg_stream import encrypt_stream
+from uart_improv3 import FPGA, MEMORY_SIZE
+
+# Default relative slowdown tolerated before a metric counts as a regression
+DEFAULT_TOLERANCE = 0.10
+
+# Default number of runs of each workload; the report keeps the median
+DEFAULT_REPEAT = 5
+
+# Metrics compared to a baseline, and whether a higher value is better
+COMPARED_METRICS = {'commands_per_s': True, 'latency_p99_ms': False, 'cpu_us_per_command': False}
+
+# Cipher and tag of the ECG trace, to check the ecg workload
+ECG_EXPECTED = encrypt(ECG_KEY, ECG_NONCE, ECG_ASSOCIATED_DATA, ECG_PLAINTEXT)
+
+# Default number of measured operations per workload
+DEFAULT_ITERATIONS = {'rtt': 500, 'cycles': 200, 'fill': 10, 'dump': 10, 'ecg': 10}
+
+
+def workload_rtt(fpga, iteration):
+    """
+    Single-command round trip: one 'A' command.
+
+    Returns:
+        int: Payload bytes moved
+    """
+    fpga.set_memory_addr(iteration % MEMORY_SIZE)
+    return 0
+
+
+def workload_cycles(fpga, iteration):
+    """
+    Address + write + display + read cycle, as in run_test_cycles.
+
+    Returns:
+        int: Payload bytes moved
+    """
+    addr = iteration % MEMORY_SIZE
+    value = (iteration * 16) % 256
+    fpga.set_memory_addr(addr)
+    fpga.write_val_mem(value)
+    fpga.display_mem_vals_leds()
+    if fpga.read_mem_val() != f"0x{value:02X}":
+        raise ValueError(f"Read back mismatch at 0x{addr:02X}")
+    return 2
+
+
+def workload_fill(fpga, iteration):
+    """
+    Fill the whole memory with write_block.
+
+    Returns:
+        int: Payload bytes moved
+    """
+    data = bytes((iteration + i) % 256 for i in range(MEMORY_SIZE))
+    fpga.write_block(0, data)
+    return MEMORY_SIZE
+
+
+def workload_dump(fpga, iteration):
+    """
+    Read the whole memory back with read_block.
+
+    Returns:
+        int: Payload bytes moved
+    """
+    fpga.read_block(0, MEMORY_SIZE)
+    return MEMORY_SIZE
+
+
+def workload_ecg(fpga, iteration):
+    """
+    Encrypt the ascon_tb.sv ECG trace with the FPGA's ASCON core through the
+    mailbox, as ecg_stream.py does (needs the mailbox bitstream, or --sim).
+
+    Returns:
+        int: Payload bytes moved
+    """
+    cipher = bytearray()
+    for record in encrypt_stream([ECG_PLAINTEXT], BoardEncryptor(fpga), ECG_KEY, ECG_NONCE,
+                                 ECG_ASSOCIATED_DATA, sample_bytes=None):
+        cipher += record.cipher
+        tag = record.tag
+    if (bytes(cipher), tag) != ECG_EXPECTED:
+        raise ValueError("ECG cipher or tag differs from the reference model")
+    return len(ECG_PLAINTEXT)
+
+
+WORKLOADS = {
+    'rtt': workload_rtt,
+    'cycles': workload_cycles,
+    'fill': workload_fill,
+    'dump': workload_dump,
+    'ecg': workload_ecg,
+}
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list.
+
+    Args:
+        sorted_values (list of float): Values in ascending order
+        fraction (float): Percentile as a fraction (e.g. 0.99)
+
+    Returns:
+        float: Percentile value, 0.0 for an empty list
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def median(values):
+    """
+    Median of a non-empty list.
+
+    Args:
+        values (list of float): Values
+
+    Returns:
+        float: Median value
+    """
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def run_workload(fpga, name, iterations, warmup=2, repeat=DEFAULT_REPEAT):
+    """
+    Run one workload several times and measure it.
+
+    Args:
+        fpga (FPGA): Open FPGA connection
+        name (str): Workload name (key of WORKLOADS)
+        iterations (int): Number of measured operations per run
+        warmup (int): Number of unmeasured operations run first
+        repeat (int): Number of measured runs
+
+    Returns:
+        dict: Median of each metric over the runs, the number of runs, and
+            'spread': for each compared metric, (max - min) / median
+    """
+    workload = WORKLOADS[name]
+    for i in range(warmup):
+        workload(fpga, i)
+
+    runs = [_measure(fpga, workload, iterations) for _ in range(repeat)]
+    result = {metric: median([run[metric] for run in runs]) for metric in runs[0]}
+    result['runs'] = repeat
+    result['spread'] = {}
+    for metric in COMPARED_METRICS:
+        values = [run[metric] for run in runs]
+        result['spread'][metric] = (max(values) - min(values)) / result[metric] if result[metric] else 0.0
+    return result
+
+
+def _measure(fpga, workload, iterations):
+    latencies = []
+    payload = 0
+    commands_start = fpga.commands_sent
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for i in range(iterations):
+        start = time.perf_counter()
+        payload += workload(fpga, i)
+        latencies.append(time.perf_counter() - start)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    commands = fpga.commands_sent - commands_start
+
+    latencies.sort()
+    return {
+        'operations': iterations,
+        'commands': commands,
+        'payload_bytes': payload,
+        'seconds': wall,
+        'commands_per_operation': commands / iterations if iterations else 0.0,
+        'commands_per_s': commands / wall if wall else 0.0,
+        'bytes_per_s': payload / wall if wall else 0.0,
+        'latency_p50_ms': percentile(latencies, 0.50) * 1e3,
+        'latency_p95_ms': percentile(latencies, 0.95) * 1e3,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1e3,
+        'cpu_us_per_command': cpu / commands * 1e6 if commands else 0.0,
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare a report to a baseline report.
+
+    A workload regresses when the median of its command rate drops, or of its
+    p99 latency or host CPU per command grows, by more than `tolerance` plus
+    the larger run-to-run spread of that metric in the two reports, so a
+    noisy short run does not count as a regression.
+
+    Args:
+        report (dict): Report produced by run_benchmarks
+        baseline (dict): Earlier report to compare against
+        tolerance (float): Allowed relative degradation (e.g. 0.10 for 10 %)
+
+    Returns:
+        list of str: One message per regression, empty if there is none
+    """
+    regressions = []
+    for name, current in report['workloads'].items():
+        previous = baseline.get('workloads', {}).get(name)
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            allowed = tolerance + max(current.get('spread', {}).get(metric, 0.0),
+                                      previous.get('spread', {}).get(metric, 0.0))
+            if higher_is_better and current[metric] < previous[metric] * (1 - allowed):
+                regressions.append(f"{name}: {metric} {current[metric]:.3f} "
+                                   f"< baseline {previous[metric]:.3f} (allowed {allowed:.0%})")
+            elif not higher_is_better and current[metric] > previous[metric] * (1 + allowed):
+                regressions.append(f"{name}: {metric} {current[metric]:.3f} "
+                                   f"> baseline {previous[metric]:.3f} (allowed {allowed:.0%})")
+    return regressions
+
+
+def run_benchmarks(fpga, workloads, iterations, repeat=DEFAULT_REPEAT):
+    """
+    Run several workloads on an open FPGA connection.
+
+    Args:
+        fpga (FPGA): Open FPGA connection
+        workloads (list of str): Workload names to run, in order
+        iterations (dict): Number of measured operations per workload name
+        repeat (int): Number of measured runs of each workload
+
+    Returns:
+        dict: Report with run metadata and per-workload metrics
+    """
+    report = {
+        'meta': {
+            'port': fpga.port,
+            'baud_rate': fpga.baud_rate,
+            'binary': fpga.binary,
+            'shadow': fpga.shadow.policy if fpga.shadow is not None else None,
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'host': platform.node(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+        },
+        'workloads': {},
+    }
+    for name in workloads:
+        report['workloads'][name] = run_workload(fpga, name, iterations[name], repeat=repeat)
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='FPGA UART client benchmarks')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--port', '-p', type=str,
+                        help='Serial port of a real FPGA (e.g. COM3, /dev/ttyUSB0)')
+    target.add_argument('--sim', action='store_true',
+                        help='Run against a local virtual FPGA')
+    parser.add_argument('--baud', '-b', type=int, default=115200,
+                        help='Baud rate (default: 115200)')
+    parser.add_argument('--sim-latency', type=float, default=0.0,
+                        help='Virtual FPGA command latency in seconds (default: 0)')
+    parser.add_argument('--workloads', '-w', type=str, default=','.join(WORKLOADS),
+                        help=f"Comma-separated workloads (default: {','.join(WORKLOADS)})")
+    parser.add_argument('--iterations', '-n', type=int, default=None,
+                        help='Measured operations per workload (default: per-workload)')
+    parser.add_argument('--repeat', '-r', type=int, default=DEFAULT_REPEAT,
+                        help=f'Measured runs of each workload, reported as medians (default: {DEFAULT_REPEAT})')
+    parser.add_argument('--output', '-o', type=str, default=None,
+                        help='Write the JSON report to this file (default: stdout)')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='Earlier JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Allowed relative degradation (default: {DEFAULT_TOLERANCE})')
+    parser.add_argument('--binary', action='store_true',
+                        help='Use the binary framing mode if the FPGA supports it')
+    parser.add_argument('--reliable', action='store_true',
+                        help='Use the reliable mode (CRC and retransmission) if the FPGA supports it')
+    parser.add_argument('--shadow', type=str, choices=['cached', 'verify'], default=None,
+                        help='Keep a shadow copy of the FPGA memory with this policy')
+    parser.add_argument('--low-latency', action='store_true',
+                        help='Enable the Linux low-latency serial mode (see uart_latency.py)')
+    parser.add_argument('--log-level', type=str, choices=['debug', 'info', 'warning'],
+                        default='warning', help='FPGA client log level (default: warning)')
+
+    args = parser.parse_args()
+
+    workloads = [name.strip() for name in args.workloads.split(',') if name.strip()]
+    unknown = [name for name in workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"Unknown workloads: {', '.join(unknown)}")
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    iterations = {name: args.iterations or DEFAULT_ITERATIONS[name] for name in workloads}
+
+    device = None
+    if args.sim:
+        from fpga_sim import AsconMailboxModel, VirtualFPGA
+        # The ecg workload needs the ASCON mailbox; the other ones only use memory
+        device = VirtualFPGA(baud_rate=args.baud, latency=args.sim_latency, model=AsconMailboxModel())
+        port = device.start()
+    else:
+        port = args.port
+
+    fpga = FPGA(port=port, baud_rate=args.baud, binary=args.binary, shadow=args.shadow,
+                reliable=args.reliable, low_latency=args.low_latency,
+                log_level=getattr(logging, args.log_level.upper()))
+    try:
+        if not fpga.open_instrument():
+            sys.exit(f"Failed to connect to FPGA on port {port}")
+        report = run_benchmarks(fpga, workloads, iterations, args.repeat)
+        report['meta']['simulated'] = args.sim
+        if fpga.latency_tuning is not None:
+            report['meta']['low_latency'] = [change._asdict() for change in fpga.latency_tuning.changes]
+    finally:
+        fpga.close_instrument()
+        if device is not None:
+            device.stop()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
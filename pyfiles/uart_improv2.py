@@ -1,5 +1,4 @@
 import serial
-import time
 
 class FPGA:
     def __init__(self, port, baud_rate=115200, timeout=1):
@@ -47,12 +46,12 @@ class FPGA:
         command += '\n'
         self.uart.write(command.encode('utf-8'))
         
-        # Wait 
-        time.sleep(0.1)
-        #response = self.uart.read_all().decode('utf-8', errors='ignore').strip()
+        # lecture jusqu'au '\n' final de la reponse (le timeout du port sert de delai max)
+        raw_response = self.uart.read_until(b'\n')
+        if not raw_response.endswith(b'\n'):
+            raise TimeoutError(f"Incomplete response within {self.timeout} s: {raw_response!r}")
 
-        #response = self.uart.read_all().decode('utf-8').strip()
-        response = self.uart.read_all().decode('latin-1').strip()
+        response = raw_response.decode('latin-1').strip()
 
         return response
 
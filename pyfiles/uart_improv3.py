@@ -3,8 +3,540 @@ import time
 import sys
 import logging
 import os
+import itertools
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 
+from uart_latency import DEFAULT_LATENCY_TIMER_MS, LowLatencyTuning
+from uart_logging import attach_handlers, file_handler, sink_handlers
+from uart_metrics import READ_BLOCK, WRITE_BLOCK, FPGAMetrics
+from uart_parser import READ_RESPONSE_PREFIX_LEN, BadReply, ReplyParser, reply_kind
+from uart_recovery import RttEstimator, backoff_delays, retry_schedule
+from uart_trace import DEFAULT_TRACE_SIZE, TRACE_BINARY, TRACE_ERROR, TRACE_RELIABLE, TraceBuffer
+from uart_transport import SerialTransport, open_transport
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for read_block(..., as_array=True)
+    np = None
+
+# Upper bound on a single blocking read, so per-command deadlines are honoured
+READ_POLL_INTERVAL = 0.01
+
+# Size of the FPGA memory addressed by the 'A' command
+MEMORY_SIZE = 256
+
+# Pre-formatted commands used to build bulk command streams
+ADDR_COMMANDS = [f"A{i:02X}" for i in range(MEMORY_SIZE)]
+WRITE_COMMANDS = [f"W{i:02X}" for i in range(256)]
+
+# ASCII command that switches the FPGA to the binary framing mode
+BINARY_MODE_COMMAND = "B"
+
+# Shadow memory policies (see ShadowMemory)
+SHADOW_CACHED = 'cached'
+SHADOW_VERIFY = 'verify'
+
+# Commands sent again after a lost or garbled response, with a RetryPolicy
+RETRY_COMMANDS = ('A', 'W', 'R', 'G')
+
+# Commands per round when a failed batch is resumed
+BATCH_RETRY_ROUND = 16
+
+# Longest drain after a timeout with several commands in flight, in timeouts
+SETTLE_MAX_QUIET_PERIODS = 4
+
+# Bits on the wire per byte with 8 data bits, no parity and 1 stop bit
+BITS_PER_BYTE = 10
+
+# Binary frames are <opcode> <payload length> <payload>. Every frame is answered
+# by one status byte, preceded for OP_READ by the bytes read. OP_WRITE and
+# OP_READ work on consecutive addresses from the address register on, without
+# changing it.
+OP_ADDR = 0x41      # payload: address
+OP_WRITE = 0x57     # payload: bytes to write
+OP_DISPLAY = 0x47   # no payload
+OP_READ = 0x52      # payload: number of bytes to read
+OP_TEXT = 0x54      # no payload, back to the ASCII protocol
+OP_RELIABLE = 0x43  # payload: window, on to the reliable mode (see uart_reliable.py)
+
+STATUS_OK = 0x00
+STATUS_BAD_OPCODE = 0x01
+STATUS_BAD_LENGTH = 0x02
+STATUS_NAK = 0x80   # reliable mode: the frame with this sequence number is missing
+
+# Largest window of unacknowledged frames the FPGA holds in reliable mode
+RELIABLE_MAX_WINDOW = 64
+
+# Largest payload of a binary frame (and largest OP_READ count)
+BINARY_MAX_PAYLOAD = 255
+
+# Binary frames equivalent to the single-byte ASCII commands
+BINARY_COMMANDS = {ADDR_COMMANDS[i]: bytes((OP_ADDR, 1, i)) for i in range(MEMORY_SIZE)}
+BINARY_COMMANDS.update({WRITE_COMMANDS[i]: bytes((OP_WRITE, 1, i)) for i in range(256)})
+BINARY_COMMANDS.update({"G": bytes((OP_DISPLAY, 0)), "R": bytes((OP_READ, 1, 1))})
+
+
+class FPGATimeoutError(TimeoutError):
+    """
+    Raised when the FPGA does not send a complete response before the deadline.
+    """
+
+
+class FPGAResponseError(ValueError):
+    """
+    Raised when the FPGA sends a complete but unexpected response.
+    """
+
+
+def response_prefix_len(command):
+    """
+    Number of raw bytes preceding the text part of the response to a command.
+    
+    Args:
+        command (str): Command as sent to the FPGA
+        
+    Returns:
+        int: READ_RESPONSE_PREFIX_LEN for 'R' commands, 0 otherwise
+    """
+    return READ_RESPONSE_PREFIX_LEN if command.startswith('R') else 0
+
+
+def parse_response(command, raw_response):
+    """
+    Check the response to a command and extract its result.
+    
+    Args:
+        command (str): Command the response belongs to
+        raw_response (bytes): Raw response, including the terminator
+        
+    Returns:
+        int or bool: Value byte for 'R' commands, True for the other commands
+        
+    Raises:
+        FPGAResponseError: If the response does not match the command
+    """
+    if command.startswith('R'):
+        if len(raw_response) < READ_RESPONSE_PREFIX_LEN or \
+                not raw_response[READ_RESPONSE_PREFIX_LEN:].strip().endswith(b'OK'):
+            raise FPGAResponseError(f"Unexpected response to {command.strip()}: {raw_response!r}")
+        return raw_response[1]
+    
+    if raw_response.strip() != b'OK':
+        raise FPGAResponseError(f"Unexpected response to {command.strip()}: {raw_response!r}")
+    return True
+
+
+def binary_reply_as_text(command, reply):
+    """
+    Rewrite a binary-mode reply as the equivalent ASCII response, so that
+    parse_response handles both protocols.
+    
+    Args:
+        command (str): Single-byte ASCII command the reply belongs to
+        reply (bytes): Binary reply, ending with the status byte
+        
+    Returns:
+        bytes: ASCII response ('OK \\n', '<lead><value> OK \\n' or an error text)
+    """
+    status = b'OK' if reply[-1] == STATUS_OK else b'ERR %02X' % reply[-1]
+    if command.startswith('R'):
+        return b'x' + reply[:1] + b' ' + status + b' \n'
+    return status + b' \n'
+
+
+class PendingResponse:
+    """
+    Result of a command submitted to a CommandPipeline.
+    
+    Calling result() on a response that has not arrived yet drives the
+    pipeline until it has.
+    """
+    
+    __slots__ = ('command', 'frame', 'sent', 'seq', '_pipeline', '_done', '_value', '_error')
+    
+    def __init__(self, pipeline, command, frame):
+        self.command = command
+        self.frame = frame
+        self.sent = None
+        # Sequence number in reliable mode, once handed to the link
+        self.seq = None
+        self._pipeline = pipeline
+        self._done = False
+        self._value = None
+        self._error = None
+
+    def _set_result(self, value):
+        self._value = value
+        self._done = True
+
+    def _set_exception(self, error):
+        self._error = error
+        self._done = True
+
+    def done(self):
+        """
+        Returns:
+            bool: True once the response has been received or has failed
+        """
+        return self._done
+
+    def exception(self):
+        """
+        Wait for the response and return the error it failed with.
+        
+        Returns:
+            Exception: Error raised for this command, or None on success
+        """
+        if not self._done:
+            self._pipeline.complete(self)
+        return self._error
+
+    def result(self):
+        """
+        Wait for the response and return its parsed value.
+        
+        Returns:
+            int or bool: Value byte for 'R' commands, True for the other commands
+            
+        Raises:
+            FPGAResponseError: If the FPGA answered with an unexpected response
+            FPGATimeoutError: If the response (or an earlier one) never arrived
+        """
+        if self.exception() is not None:
+            raise self._error
+        return self._value
+
+
+class CommandPipeline:
+    """
+    Keep up to `window` commands in flight and match their responses in order.
+    
+    The FPGA answers commands strictly in the order it receives them, so
+    responses are matched to commands first-in first-out. Commands are
+    buffered and written in a single call right before the pipeline has to
+    wait for a response. An unexpected response only fails its own command;
+    a missing response loses the framing, so every command still in flight
+    fails with the timeout and the input buffer is discarded.
+    """
+    
+    def __init__(self, fpga, window=8, timeout=None):
+        """
+        Args:
+            fpga (FPGA): Open FPGA connection
+            window (int): Maximum number of commands awaiting a response
+            timeout (float): Per-response deadline in seconds (default: fpga.response_timeout())
+        """
+        if window < 1:
+            raise ValueError(f"Pipeline window must be at least 1, got {window}")
+        self.fpga = fpga
+        self.window = window
+        self.timeout = timeout
+        self._in_flight = deque()
+        self._unsent = bytearray()
+        self._unsent_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.drain()
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    def submit(self, command):
+        """
+        Queue a command, waiting for the oldest response if the window is full.
+        
+        Args:
+            command (str): Command to send (e.g. 'A00', 'WF5', 'G', 'R')
+            
+        Returns:
+            PendingResponse: Handle on the command's result
+        """
+        while len(self._in_flight) >= self.window:
+            self._complete_oldest()
+        
+        frame = self.fpga._encode_command(command)
+        self._unsent += frame
+        self._unsent_count += 1
+        pending = PendingResponse(self, command, frame)
+        self._in_flight.append(pending)
+        return pending
+
+    def submit_many(self, commands):
+        """
+        Queue several commands.
+        
+        Args:
+            commands (iterable of str): Commands to send, in order
+            
+        Returns:
+            list of PendingResponse: One handle per command, in order
+        """
+        return [self.submit(command) for command in commands]
+
+    def flush(self):
+        """
+        Write every buffered command to the FPGA without waiting for responses.
+        """
+        if self._unsent and self.fpga.reliable:
+            # The link numbers the frames and writes them in a single call
+            link = self.fpga.link
+            first = len(self._in_flight) - self._unsent_count
+            for pending in itertools.islice(self._in_flight, first, None):
+                pending.seq = link.send(pending.frame)
+            link.flush(self.timeout)
+            if self.fpga.trace is not None or self.fpga.metrics is not None:
+                sent = time.perf_counter()
+                for pending in itertools.islice(self._in_flight, first, None):
+                    pending.sent = sent
+            self._unsent.clear()
+            self._unsent_count = 0
+        elif self._unsent:
+            self.fpga._write(self._unsent)
+            if self.fpga.trace is not None or self.fpga.metrics is not None:
+                sent = time.perf_counter()
+                for pending in itertools.islice(reversed(self._in_flight), self._unsent_count):
+                    pending.sent = sent
+            self._unsent.clear()
+            self._unsent_count = 0
+
+    def complete(self, pending):
+        """
+        Receive responses until the given command has completed.
+        
+        Args:
+            pending (PendingResponse): Handle returned by submit()
+        """
+        while not pending.done():
+            self._complete_oldest()
+
+    def drain(self):
+        """
+        Receive the responses to every command in flight.
+        """
+        while self._in_flight:
+            self._complete_oldest()
+
+    def _complete_oldest(self):
+        fpga = self.fpga
+        pending = self._in_flight[0]
+        if fpga.reliable:
+            # The link keeps replies that arrive before they are claimed
+            if pending.seq is None:
+                self.flush()
+            result = None
+        else:
+            # Responses already received are parsed without writing, so buffered
+            # commands go out together rather than one per completed response
+            result = fpga._rx.next_reply(reply_kind(pending.command, fpga.binary))
+            if result is None:
+                self.flush()
+        self._in_flight.popleft()
+        try:
+            if fpga.reliable:
+                result = fpga.link.parse(fpga.link.result(pending.seq, self.timeout))
+            elif result is None:
+                result = fpga.read_result(pending.command, self.timeout)
+        except FPGATimeoutError as e:
+            fpga._trace(pending.sent, pending.frame, b'', TRACE_ERROR)
+            pending._set_exception(e)
+            self._abort(e, pending.command)
+            fpga._dump_trace_on_error()
+            return
+        
+        if isinstance(result, BadReply):
+            e = fpga._reply_error(pending.command, result)
+            fpga.logger.error(str(e))
+            pending._set_exception(e)
+            fpga._trace(pending.sent, pending.frame, result.raw, TRACE_ERROR)
+            fpga._dump_trace_on_error()
+        else:
+            pending._set_result(result)
+            fpga._trace(pending.sent, pending.frame, fpga._rx.last_reply)
+        
+        # Keep track of the FPGA address register and memory
+        if pending.command.startswith('A'):
+            fpga.current_addr = None if pending._error else int(pending.command[1:].strip(), 16)
+        elif fpga.shadow is not None and fpga.current_addr is not None:
+            if pending._error:
+                fpga.shadow.invalidate(fpga.current_addr, 1)
+            elif pending.command.startswith('W'):
+                fpga.shadow.store(fpga.current_addr, int(pending.command[1:].strip(), 16))
+            elif pending.command.startswith('R'):
+                fpga.shadow.observe_read(fpga.current_addr, pending._value)
+
+    def _abort(self, error, command):
+        # Responses can no longer be matched to commands: fail them all, and
+        # wait for the late responses of `command` and of those still in flight
+        settle = None if self._in_flight else command
+        metrics = self.fpga.metrics
+        while self._in_flight:
+            pending = self._in_flight.popleft()
+            pending._set_exception(error)
+            if metrics is not None:
+                metrics.record_frame(pending.frame, 0.0, error=True)
+        self.fpga.current_addr = None
+        if self.fpga.shadow is not None:
+            # Writes in flight may or may not have been executed
+            self.fpga.shadow.invalidate()
+        self.fpga._settle_after_timeout(settle)
+
+
+def _hex_or_none(digits):
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return None
+
+
+class ShadowMemory:
+    """
+    Host-side copy of the FPGA memory, filled by the writes and reads that
+    go through the FPGA client.
+    
+    With the SHADOW_CACHED policy, reads of known bytes are answered from the
+    copy and writes of the value a byte already holds are skipped. With
+    SHADOW_VERIFY, every read still goes to the FPGA and is compared with the
+    copy, and mismatches are logged. Both policies skip 'A' commands for the
+    address that is already selected.
+    
+    The copy is only coherent as long as nothing else changes the memory:
+    addresses the hardware writes itself (e.g. the ASCON mailbox outputs)
+    must be declared volatile, and invalidate() must be called after any
+    change made behind the client's back.
+    """
+    
+    def __init__(self, policy=SHADOW_CACHED, volatile=()):
+        """
+        Args:
+            policy (str): SHADOW_CACHED or SHADOW_VERIFY
+            volatile (iterable of int): Addresses never answered from the copy
+        """
+        if policy not in (SHADOW_CACHED, SHADOW_VERIFY):
+            raise ValueError(f"Unknown shadow memory policy: {policy}")
+        self.policy = policy
+        self.volatile = set(volatile)
+        self.values = [None] * MEMORY_SIZE
+        self.hits = 0
+        self.elided = 0
+        self.mismatches = 0
+        self.logger = None
+
+    @property
+    def cached(self):
+        """
+        Returns:
+            bool: True if reads and redundant writes may be served from the copy
+        """
+        return self.policy == SHADOW_CACHED
+
+    def get(self, addr):
+        """
+        Value of a byte, if it can be answered from the copy.
+        
+        Args:
+            addr (int): Address
+            
+        Returns:
+            int: Known value, None if unknown, volatile or not cached
+        """
+        if not self.cached or addr in self.volatile:
+            return None
+        return self.values[addr]
+
+    def store(self, addr, value):
+        """
+        Record a value written to the FPGA.
+        """
+        self.values[addr] = None if addr in self.volatile else value
+
+    def observe_read(self, addr, value):
+        """
+        Record a value read from the FPGA, checking it against the copy.
+        """
+        known = self.values[addr]
+        if known is not None and known != value:
+            self.mismatches += 1
+            if self.logger is not None:
+                self.logger.warning("Shadow memory mismatch at 0x%02X: expected 0x%02X, read 0x%02X",
+                                    addr, known, value)
+        self.store(addr, value)
+
+    def mark_volatile(self, addrs):
+        """
+        Never answer these addresses from the copy.
+        
+        Args:
+            addrs (iterable of int): Addresses changed by the hardware itself
+        """
+        for addr in addrs:
+            self.volatile.add(addr)
+            self.values[addr] = None
+
+    def invalidate(self, start_addr=0, length=MEMORY_SIZE):
+        """
+        Forget the contents of a range of memory.
+        
+        Args:
+            start_addr (int): First address (default: 0)
+            length (int): Number of bytes (default: the whole memory)
+        """
+        self.values[start_addr:start_addr + length] = [None] * length
+
+
+def setup_logger(name, log_level, log_file, log_config=None):
+    """
+    Create a logger with file and console handlers.
+    
+    Args:
+        name (str): Logger name
+        log_level (int): Logging level (e.g., logging.INFO, logging.DEBUG)
+        log_file (str): Path to log file or None for auto-generated name
+        log_config (LogConfig): Queued writing, rotation and disk cap settings
+            (default: None, synchronous writes to a single file; see uart_logging.py)
+        
+    Returns:
+        logging.Logger: Configured logger
+    """
+    # Create logger
+    logger = logging.getLogger(name)
+    logger.setLevel(log_level)
+    logger.handlers.clear()  # Clear any existing handlers
+    
+    # Create formatter
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    # Create file handler
+    if log_file is None:
+        # Create logs directory if it doesn't exist
+        os.makedirs('logs', exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        log_file = f"logs/fpga_uart_{timestamp}.log"
+    
+    if log_config is None:
+        log_file_handler = logging.FileHandler(log_file)
+    else:
+        # The disk cap only covers this log file and its rotated backups:
+        # the files of other sessions may still be in use
+        log_file_handler = file_handler(log_file, log_config)
+    log_file_handler.setLevel(log_level)
+    log_file_handler.setFormatter(formatter)
+    
+    # Create console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)  # Only INFO and above goes to console
+    console_handler.setFormatter(formatter)
+    
+    attach_handlers(logger, [log_file_handler, console_handler], log_config)
+    
+    logger.debug(f"Logging initialized at level {log_level} to file: {log_file}")
+    return logger
+
+
 class FPGA:
     """
     Class for UART communication with an FPGA.
@@ -16,68 +548,114 @@ class FPGA:
     
     def __init__(self, port, baud_rate=115200, parity=serial.PARITY_NONE, 
                  stop_bits=serial.STOPBITS_ONE, timeout=1, log_level=logging.INFO,
-                 log_file=None):
+                 log_file=None, binary=False, trace_size=DEFAULT_TRACE_SIZE, trace_file=None,
+                 log_config=None, shadow=None, retry=None, adaptive_timeout=False,
+                 reliable=False, metrics=False, transport=None, low_latency=False):
         """
         Initialize the FPGA UART connection with specified parameters.
         
         Args:
-            port (str): Serial port name (e.g., 'COM3', '/dev/ttyUSB0')
+            port (str): Serial port name (e.g., 'COM3', '/dev/ttyUSB0'),
+                'tcp://host:port' for a serial-over-network bridge or 'loop://'
+                for an in-process simulated FPGA (see uart_transport.py)
             baud_rate (int): Baud rate for UART communication (default: 115200)
             parity (str): Parity bit setting (default: PARITY_NONE)
             stop_bits (float): Number of stop bits (default: STOPBITS_ONE)
-            timeout (float): Read timeout in seconds (default: 1)
+            timeout (float): Per-command response deadline in seconds (default: 1)
             log_level (int): Logging level (default: logging.INFO)
             log_file (str): Path to log file (default: None, generates timestamp-based filename)
+            binary (bool): Negotiate the binary framing mode when the port is
+                opened, keeping the ASCII protocol if the FPGA does not support it
+            trace_size (int): Number of transactions kept in the trace ring
+                buffer, 0 to disable tracing (default: DEFAULT_TRACE_SIZE)
+            trace_file (str): File the trace is dumped to when a command fails
+                (default: None, no automatic dump)
+            log_config (LogConfig): Queued logging, rotation and disk cap
+                settings (default: None, synchronous writes to a single file)
+            shadow (str): Keep a ShadowMemory copy of the FPGA memory with this
+                policy, SHADOW_CACHED or SHADOW_VERIFY (default: None, no copy)
+            retry (RetryPolicy): Send commands again after a lost or garbled
+                response (default: None, fail at once)
+            adaptive_timeout (bool): Derive the response deadline from the
+                measured round trips, with `timeout` as the upper bound
+            reliable (bool): Negotiate the reliable mode (CRC-checked frames
+                with retransmission, see uart_reliable.py) on top of the
+                binary mode when the port is opened
+            metrics (bool): Keep per-command counters and latency histograms
+                (see uart_metrics.py)
+            transport (Transport): Open transport to use instead of opening
+                `port`, which then only names the board in logs
+            low_latency (bool): Enable the Linux low-latency serial mode and
+                lower the USB adapter's latency timer when the port is opened,
+                restoring them when it is closed (see uart_latency.py)
         """
         self.port = port
         self.baud_rate = baud_rate
         self.parity = parity
         self.stop_bits = stop_bits
         self.timeout = timeout
+        # Transport to the board while open, see uart_transport.py
         self.uart = None
+        self._transport = transport
+        self.binary_requested = binary
+        
+        # Low-latency settings applied to the port, see uart_latency.py
+        self.low_latency_requested = low_latency
+        self.latency_tuning = None
+        
+        # True while the FPGA is in binary framing mode
+        self.binary = False
+        
+        # ReliableLink while the FPGA is in reliable mode (which is also binary)
+        self.reliable_requested = reliable
+        self.reliable = False
+        self.link = None
+        
+        # Last address set on the FPGA, None when unknown
+        self.current_addr = None
+        
+        # Receive buffer and reply parser, see uart_parser.py
+        self._rx = ReplyParser()
+        
+        # Last transactions, see uart_trace.py
+        self.trace = TraceBuffer(trace_size) if trace_size else None
+        self.trace_file = trace_file
+        
+        # Commands (or binary frames) written to the FPGA, and bytes on the wire
+        self.commands_sent = 0
+        self.bytes_sent = 0
+        
+        # Per-command counters and latency histograms, see uart_metrics.py
+        self.metrics = FPGAMetrics(self) if metrics else None
+        
+        # Recovery from bad responses, see uart_recovery.py
+        self.retry = retry
+        self.rtt = RttEstimator(timeout) if adaptive_timeout else None
+        self.retries = 0
+        self.resyncs = 0
         
         # Setup logging
-        self._setup_logging(log_level, log_file)
+        self._setup_logging(log_level, log_file, log_config)
+        
+        # Host-side copy of the FPGA memory
+        self.shadow = ShadowMemory(shadow) if shadow else None
+        if self.shadow is not None:
+            self.shadow.logger = self.logger
         
         self.logger.info(f"FPGA initialized with parameters: port={port}, "
                          f"baud_rate={baud_rate}, parity={parity}, "
                          f"stop_bits={stop_bits}, timeout={timeout}")
 
-    def _setup_logging(self, log_level, log_file):
+    def _setup_logging(self, log_level, log_file, log_config=None):
         """
         Set up the logging system with file and console handlers.
         
         Args:
             log_level (int): Logging level (e.g., logging.INFO, logging.DEBUG)
             log_file (str): Path to log file or None for auto-generated name
+            log_config (LogConfig): Queued logging, rotation and disk cap settings
         """
-        # Create logger
-        self.logger = logging.getLogger(f"FPGA_{self.port}")
-        self.logger.setLevel(log_level)
-        self.logger.handlers.clear()  # Clear any existing handlers
-        
-        # Create formatter
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        
-        # Create file handler
-        if log_file is None:
-            # Create logs directory if it doesn't exist
-            os.makedirs('logs', exist_ok=True)
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            log_file = f"logs/fpga_uart_{timestamp}.log"
-        
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(log_level)
-        file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
-        
-        # Create console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)  # Only INFO and above goes to console
-        console_handler.setFormatter(formatter)
-        self.logger.addHandler(console_handler)
-        
-        self.logger.debug(f"Logging initialized at level {log_level} to file: {log_file}")
+        self.logger = setup_logger(f"FPGA_{self.port}", log_level, log_file, log_config)
 
     def open_instrument(self):
         """
@@ -87,42 +665,184 @@ class FPGA:
             bool: True if connection was successful, False otherwise
         """
         try:
-            self.uart = serial.Serial(
-                port=self.port,
-                baudrate=self.baud_rate,
-                parity=self.parity,
-                stopbits=self.stop_bits,
-                timeout=self.timeout
-            )
+            if self._transport is not None:
+                self.uart = self._transport
+            else:
+                self.uart = open_transport(
+                    self.port,
+                    baudrate=self.baud_rate,
+                    parity=self.parity,
+                    stopbits=self.stop_bits,
+                    timeout=min(self.timeout, READ_POLL_INTERVAL)
+                )
+            self._rx.clear()
+            self.current_addr = None
+            self.binary = False
+            self.reliable = False
+            self.link = None
+            if self.shadow is not None:
+                self.shadow.invalidate()
             self.logger.info(f"UART port {self.port} opened successfully")
-            return True
-        except serial.SerialException as e:
+        except (serial.SerialException, OSError, ValueError) as e:
             self.logger.error(f"Error opening UART port: {e}")
             return False
+        
+        if self.low_latency_requested:
+            self.enable_low_latency()
+        if self.binary_requested or self.reliable_requested:
+            self.enable_binary()
+        if self.reliable_requested and self.binary:
+            self.enable_reliable()
+        return True
 
     def close_instrument(self):
         """
-        Close the UART connection to the FPGA.
+        Close the UART connection to the FPGA, leaving it in ASCII mode.
         """
         if self.uart and self.uart.is_open:
+            if self.binary:
+                try:
+                    if self.reliable:
+                        self.disable_reliable()
+                    else:
+                        self.disable_binary()
+                except (FPGATimeoutError, FPGAResponseError) as e:
+                    self.logger.warning(f"Could not switch the FPGA back to ASCII mode: {e}")
+            self.disable_low_latency()
             self.uart.close()
             self.logger.info("UART port closed")
         else:
             self.logger.debug("No open UART connection to close")
 
-    def send_command(self, command):
+    def send_command(self, command, timeout=None):
         """
         Send a command to the FPGA and wait for a response.
         
+        The call returns as soon as the response terminator has been received.
+        After a lost or garbled response the link is resynchronised and, with
+        a retry policy, A/W/R/G commands are sent again (after restoring the
+        address register) until the policy's attempts are used up.
+        
         Args:
             command (str): Command to send
+            timeout (float): Response deadline in seconds (default: response_timeout())
             
         Returns:
-            bytes: Raw response from the FPGA
+            bytes: Raw response from the FPGA, including the terminator; the
+                last (unexpected) response if every attempt failed
             
         Raises:
             ValueError: If command is not a string
             RuntimeError: If UART connection is not open
+            FPGATimeoutError: If no complete response arrives before the deadline
+        """
+        self._send(command, timeout)
+        reply = self._rx.last_reply
+        return binary_reply_as_text(command, reply) if self.binary else reply
+
+    def _send(self, command, timeout=None):
+        """
+        Send a command with the retry policy and return its parsed result
+        (see send_command).
+        
+        Returns:
+            int, bool or BadReply: Value byte for 'R' commands, True for the
+                other commands, BadReply if every attempt got a bad response
+        """
+        retryable = self.retry is not None and isinstance(command, str) and \
+            command.lstrip()[:1] in RETRY_COMMANDS
+        addr = None if not retryable or command.lstrip().startswith('A') else self.current_addr
+        error = None
+        for attempt, delay in retry_schedule(self.retry if retryable else None):
+            if attempt:
+                self.retries += 1
+                self.logger.warning("Retrying %s (attempt %d) after: %s", command.strip(), attempt + 1, error)
+            response = None
+            try:
+                if attempt and addr is not None:
+                    # The failed command may have reached the FPGA as an address change
+                    self.current_addr = None
+                    result = self._send_once(ADDR_COMMANDS[addr], timeout)
+                    if isinstance(result, BadReply):
+                        raise self._reply_error(ADDR_COMMANDS[addr], result)
+                    self.current_addr = addr
+                response = self._send_once(command, timeout)
+                if isinstance(response, BadReply):
+                    raise self._reply_error(command, response)
+                return response
+            except (FPGATimeoutError, FPGAResponseError) as e:
+                error = e
+                if isinstance(e, FPGAResponseError):
+                    # Drop whatever follows the garbled response
+                    self.resync()
+            if delay is None:
+                if response is None:
+                    raise error
+                return response
+            time.sleep(delay)
+
+    def _send_once(self, command, timeout=None):
+        """
+        Send a command once and return its parsed result (see _send).
+        """
+        data = self._encode_command(command)
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        
+        if debug:
+            self.logger.debug("Sending command: %s", command.strip())
+        
+        # Send command
+        sent = time.perf_counter()
+        if not self.reliable:
+            self._write(data)
+        
+        # Parse the response up to the terminator (or the status byte)
+        try:
+            if self.reliable:
+                # The link retransmits and measures the round trips itself
+                result = self.link.execute(data, timeout)
+            else:
+                result = self.read_result(command, timeout)
+        except FPGATimeoutError:
+            self._trace(sent, data, b'', TRACE_ERROR)
+            self._settle_after_timeout(command)
+            self._dump_trace_on_error()
+            raise
+        reply = self._rx.last_reply
+        self._trace(sent, data, reply, TRACE_ERROR if isinstance(result, BadReply) else 0)
+        if self.rtt is not None and not self.reliable:
+            self.rtt.observe(time.perf_counter() - sent)
+        
+        # For debug logging, show both raw bytes and decoded string
+        if debug:
+            self.logger.debug("Received raw bytes: %s", ' '.join(f'0x{b:02X}' for b in reply))
+            self.logger.debug("Decoded response: %r", reply.decode('latin-1'))
+        
+        return result
+
+    def _reply_error(self, command, bad_reply):
+        """
+        Returns:
+            FPGAResponseError: Error for a bad response to a command
+        """
+        raw = binary_reply_as_text(command, bad_reply.raw) if self.binary else bad_reply.raw
+        return FPGAResponseError(f"Unexpected response to {command.strip()}: {raw!r}")
+
+    def _encode_command(self, command):
+        """
+        Validate a command and encode it for the wire.
+        
+        In binary mode the command is encoded as the equivalent binary frame.
+        
+        Args:
+            command (str): Command to encode, with or without the trailing line feed
+            
+        Returns:
+            bytes: Encoded command, terminated by a line feed (or binary frame)
+            
+        Raises:
+            ValueError: If command is not a string, or has no binary equivalent
+            RuntimeError: If UART connection is not open
         """
         if not isinstance(command, str):
             error_msg = "Command must be a string"
@@ -134,34 +854,810 @@ class FPGA:
             self.logger.error(error_msg)
             raise RuntimeError(error_msg)
         
+        self.commands_sent += 1
+        if self.binary:
+            return self._binary_frame(command)
+        
         # Add line feed to command if not already present
         if not command.endswith('\n'):
             command += '\n'
         
-        self.logger.debug(f"Sending command: {command.strip()}")
+        return command.encode('utf-8')
+
+    def _binary_frame(self, command):
+        """
+        Encode a single-byte ASCII command as a binary frame.
+        
+        Raises:
+            ValueError: If the command has no binary equivalent
+        """
+        command = command.strip()
+        frame = BINARY_COMMANDS.get(command)
+        if frame is not None:
+            return frame
         
-        # Send command
-        self.uart.write(command.encode('utf-8'))
+        # Commands not in the table, e.g. lower-case or single-digit hex
+        opcode = {'A': OP_ADDR, 'W': OP_WRITE}.get(command[:1].upper())
+        try:
+            if opcode is not None and 0 < len(command) <= 3:
+                return bytes((opcode, 1, int(command[1:], 16)))
+        except ValueError:
+            pass
+        error_msg = f"Command {command!r} has no binary-mode equivalent"
+        self.logger.error(error_msg)
+        raise ValueError(error_msg)
+
+    def enable_low_latency(self, latency_timer=DEFAULT_LATENCY_TIMER_MS):
+        """
+        Enable the low-latency mode of a local serial port (Linux only).
         
-        # Wait for response
-        time.sleep(0.1)
+        Sets the tty's ASYNC_LOW_LATENCY flag and lowers the USB adapter's
+        latency timer as far as the permissions allow, logging what changed
+        and what could not be changed. close_instrument() puts the previous
+        settings back.
         
-        # Read raw response
-        raw_response = self.uart.read_all()
+        Args:
+            latency_timer (int): Latency timer to set in milliseconds, None to leave it
+            
+        Returns:
+            list of LatencyChange: Settings changed (see uart_latency.py)
+        """
+        if self.latency_tuning is not None:
+            return self.latency_tuning.changes
+        if not isinstance(self.uart, SerialTransport) or self.uart.fd is None:
+            self.logger.warning("The low-latency mode only applies to local serial ports")
+            return []
+        self.latency_tuning = LowLatencyTuning(self.port, self.uart.fd, self.logger)
+        return self.latency_tuning.apply(latency_timer)
+
+    def disable_low_latency(self):
+        """
+        Restore the serial port settings changed by enable_low_latency().
         
-        # For debug logging, show both raw bytes and decoded string
-        if raw_response:
-            hex_bytes = ' '.join([f'0x{b:02X}' for b in raw_response])
+        Returns:
+            list of LatencyChange: Settings restored
+        """
+        if self.latency_tuning is None:
+            return []
+        restored = self.latency_tuning.restore()
+        self.latency_tuning = None
+        return restored
+
+    def enable_binary(self, timeout=None):
+        """
+        Switch the FPGA to the binary framing mode.
+        
+        The FPGA is asked with the ASCII 'B' command. If it does not acknowledge
+        it, the connection stays in ASCII mode.
+        
+        Args:
+            timeout (float): Response deadline in seconds (default: self.response_timeout())
+            
+        Returns:
+            bool: True if binary mode is active
+        """
+        if self.binary:
+            return True
+        try:
+            parse_response(BINARY_MODE_COMMAND, self.send_command(BINARY_MODE_COMMAND, timeout))
+        except (FPGATimeoutError, FPGAResponseError) as e:
+            self.discard_input()
+            self.logger.warning(f"Binary mode not supported, keeping the ASCII protocol: {e}")
+            return False
+        
+        self.binary = True
+        self.logger.info("Binary framing mode enabled")
+        return True
+
+    def disable_binary(self, timeout=None):
+        """
+        Switch the FPGA back to the ASCII protocol.
+        
+        Args:
+            timeout (float): Response deadline in seconds (default: self.response_timeout())
+            
+        Raises:
+            FPGAResponseError: If the FPGA rejects the frame
+            FPGATimeoutError: If the status byte does not arrive in time
+        """
+        if not self.binary:
+            return
+        self.commands_sent += 1
+        self._write(bytes((OP_TEXT, 0)))
+        status = self.read_frame(1, timeout)[0]
+        if status != STATUS_OK:
+            raise FPGAResponseError(f"FPGA refused to leave binary mode (status 0x{status:02X})")
+        self.binary = False
+        self.logger.info("ASCII protocol restored")
+
+    def enable_reliable(self, window=None, timeout=None):
+        """
+        Switch the FPGA from the binary mode to the reliable mode.
+        
+        Every frame then carries a sequence number and a CRC, and lost or
+        corrupted frames are retransmitted by a ReliableLink (see
+        uart_reliable.py). If the FPGA does not acknowledge the switch, the
+        connection stays in binary mode.
+        
+        Args:
+            window (int): Frames in flight (default: DEFAULT_RELIABLE_WINDOW)
+            timeout (float): Response deadline in seconds (default: self.response_timeout())
+            
+        Returns:
+            bool: True if the reliable mode is active
+        """
+        from uart_reliable import DEFAULT_RELIABLE_WINDOW, ReliableLink
+        
+        if self.reliable:
+            return True
+        if not self.binary:
+            self.logger.warning("The reliable mode needs the binary framing mode")
+            return False
+        window = window or DEFAULT_RELIABLE_WINDOW
+        link = ReliableLink(self, window)
+        self.commands_sent += 1
+        self._write(bytes((OP_RELIABLE, 1, window)))
+        try:
+            status = self.read_frame(1, timeout)[0]
+        except FPGATimeoutError as e:
+            self.resync()
+            self.logger.warning(f"Reliable mode not supported, keeping the binary mode: {e}")
+            return False
+        if status != STATUS_OK:
+            self.logger.warning(f"Reliable mode not supported, keeping the binary mode (status 0x{status:02X})")
+            return False
+        
+        self.link = link
+        self.reliable = True
+        self.logger.info("Reliable mode enabled with a window of %d frames", window)
+        return True
+
+    def disable_reliable(self, timeout=None):
+        """
+        Switch the FPGA from the reliable mode back to the ASCII protocol.
+        
+        Args:
+            timeout (float): Response deadline in seconds (default: self.response_timeout())
+            
+        Raises:
+            FPGAResponseError: If the FPGA rejects the frame
+            FPGATimeoutError: If the FPGA does not answer
+        """
+        if not self.reliable:
+            return
+        self.commands_sent += 1
+        reply = self.link.execute(bytes((OP_TEXT, 0)), timeout)
+        if isinstance(reply, BadReply):
+            raise FPGAResponseError(f"FPGA refused to leave the reliable mode (status 0x{reply.raw[-1]:02X})")
+        self.reliable = False
+        self.binary = False
+        self.link = None
+        self.logger.info("ASCII protocol restored")
+
+    def _trace(self, sent, command, response, flags=0):
+        """
+        Record a transaction in the trace ring buffer and the metrics, if
+        enabled.
+        
+        Args:
+            sent (float): time.perf_counter() when the command was written
+            command (bytes): Bytes sent
+            response (bytes): Bytes received
+            flags (int): TRACE_ERROR if the transaction failed
+        """
+        if self.trace is None and self.metrics is None:
+            return
+        received = time.perf_counter()
+        if sent is None:
+            sent = received
+        if self.metrics is not None:
+            self.metrics.record_frame(command, received - sent, flags & TRACE_ERROR)
+        if self.trace is None:
+            return
+        if self.binary:
+            flags |= TRACE_BINARY
+        if self.reliable:
+            flags |= TRACE_RELIABLE
+        self.trace.record(sent, received, command, response, flags)
+
+    def dump_trace(self, path=None):
+        """
+        Write the trace ring buffer to a binary trace file (see uart_trace.py).
+        
+        Args:
+            path (str): File to write (default: self.trace_file)
+            
+        Returns:
+            int: Number of transactions written
+        """
+        path = path or self.trace_file
+        if self.trace is None or path is None:
+            return 0
+        count = self.trace.dump(path)
+        self.logger.info("Trace of the last %d transactions written to %s", count, path)
+        return count
+
+    def _dump_trace_on_error(self):
+        if self.trace_file is not None:
             try:
-                str_repr = raw_response.decode('latin-1')
-                self.logger.debug(f"Received raw bytes: {hex_bytes}")
-                self.logger.debug(f"Decoded response: {str_repr}")
-            except Exception as e:
-                self.logger.debug(f"Received raw bytes: {hex_bytes} (decoding failed: {e})")
+                self.dump_trace()
+            except OSError as e:
+                self.logger.error("Could not write the trace file: %s", e)
+
+    def pipeline(self, window=8, timeout=None):
+        """
+        Create a pipeline that keeps several commands in flight on this FPGA.
+        
+        Args:
+            window (int): Maximum number of commands awaiting a response (default: 8)
+            timeout (float): Per-response deadline in seconds (default: self.response_timeout())
+            
+        Returns:
+            CommandPipeline: Pipeline bound to this FPGA
+        """
+        return CommandPipeline(self, window, timeout)
+
+    def write_block(self, start_addr, data, window=None, timeout=None):
+        """
+        Write consecutive bytes to FPGA memory starting at a given address.
+        
+        The whole command stream is built up front and written in a single call
+        (or `window` commands at a time), then the responses are collected. The
+        'A' command for the first address is skipped if it is already selected.
+        With a SHADOW_CACHED shadow memory, bytes that already hold their value
+        are not written. In binary mode the block is sent as OP_WRITE frames of
+        up to BINARY_MAX_PAYLOAD bytes and `window` is ignored.
+        
+        Args:
+            start_addr (int): First address to write
+            data (bytes-like or iterable of int): Values to write
+            window (int): Maximum number of commands in flight (default: all of them)
+            timeout (float): Per-response deadline in seconds (default: self.response_timeout())
+            
+        Returns:
+            bool: True if every byte was written
+            
+        Raises:
+            ValueError: If the block does not fit in memory or a response is unexpected
+            FPGATimeoutError: If a response does not arrive in time
+        """
+        data = bytes(data)
+        self._check_block(start_addr, len(data))
+        
+        self.logger.info("Writing %d bytes to memory at 0x%02X", len(data), start_addr)
+        with self._measured(WRITE_BLOCK):
+            if self.binary:
+                self._retry_block(OP_WRITE, start_addr, len(data), data, timeout)
+            else:
+                shadow = self.shadow
+                commands = []
+                addr = self.current_addr
+                for offset, value in enumerate(data):
+                    target = start_addr + offset
+                    if shadow is not None and shadow.get(target) == value:
+                        # The byte already holds this value
+                        shadow.elided += 1
+                        continue
+                    if target != addr:
+                        commands.append(ADDR_COMMANDS[target])
+                        addr = target
+                    commands.append(WRITE_COMMANDS[value])
+                self._run_batch(commands, window, timeout)
+        self.logger.info("%d bytes successfully written at 0x%02X", len(data), start_addr)
+        return True
+
+    def read_block(self, start_addr, length, as_array=False, window=None, timeout=None):
+        """
+        Read consecutive bytes from FPGA memory starting at a given address.
+        
+        With a SHADOW_CACHED shadow memory, only the bytes not known on the
+        host are read. In binary mode the block is read with OP_READ frames of
+        up to BINARY_MAX_PAYLOAD bytes and `window` is ignored.
+        
+        Args:
+            start_addr (int): First address to read
+            length (int): Number of bytes to read
+            as_array (bool): Return a NumPy uint8 array instead of bytes
+            window (int): Maximum number of commands in flight (default: all of them)
+            timeout (float): Per-response deadline in seconds (default: self.response_timeout())
+            
+        Returns:
+            bytes or numpy.ndarray: Values read from memory
+            
+        Raises:
+            ValueError: If the block does not fit in memory or a response is unexpected
+            FPGATimeoutError: If a response does not arrive in time
+            ImportError: If as_array is set and NumPy is not installed
+        """
+        if as_array and np is None:
+            raise ImportError("NumPy is required for read_block(..., as_array=True)")
+        self._check_block(start_addr, length)
+        
+        self.logger.info("Reading %d bytes from memory at 0x%02X", length, start_addr)
+        shadow = self.shadow
+        if shadow is None:
+            known = [None] * length
         else:
-            self.logger.debug("Received empty response")
+            known = [shadow.get(start_addr + offset) for offset in range(length)]
+        missing = [offset for offset, value in enumerate(known) if value is None]
+        if shadow is not None:
+            shadow.hits += length - len(missing)
         
-        return raw_response
+        with self._measured(READ_BLOCK):
+            if not missing:
+                values = bytes(known)
+            elif self.binary:
+                values = self._retry_block(OP_READ, start_addr, length, None, timeout)
+            else:
+                commands = []
+                addr = self.current_addr
+                for offset in missing:
+                    if start_addr + offset != addr:
+                        addr = start_addr + offset
+                        commands.append(ADDR_COMMANDS[addr])
+                    commands.append('R')
+                results = self._run_batch(commands, window, timeout)
+                read = (result for command, result in zip(commands, results) if command == 'R')
+                for offset, value in zip(missing, read):
+                    known[offset] = value
+                values = bytes(known)
+        self.logger.info("%d bytes successfully read at 0x%02X", length, start_addr)
+        
+        if as_array:
+            return np.frombuffer(values, dtype=np.uint8)
+        return values
+
+    @contextmanager
+    def _measured(self, kind):
+        """
+        Record the duration of a block operation in the metrics, if enabled.
+        """
+        if self.metrics is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        except (FPGATimeoutError, FPGAResponseError):
+            self.metrics.record(kind, time.perf_counter() - started, error=True)
+            raise
+        self.metrics.record(kind, time.perf_counter() - started)
+
+    def _check_block(self, start_addr, length):
+        """
+        Validate that a block of memory lies within the address space.
+        
+        Raises:
+            ValueError: If the block does not fit in memory
+        """
+        if not isinstance(start_addr, int) or not isinstance(length, int) or \
+                start_addr < 0 or length < 0 or start_addr + length > MEMORY_SIZE:
+            error_msg = f"Block of {length} bytes at {start_addr} does not fit in {MEMORY_SIZE} bytes of memory"
+            self.logger.error(error_msg)
+            raise ValueError(error_msg)
+
+    def _run_batch(self, commands, window, timeout):
+        """
+        Send a list of commands through a pipeline and return their results.
+        
+        Every response is received before an error is raised, so the link stays
+        in sync after a failure. With a retry policy, the rest of the batch is
+        sent again in rounds of BATCH_RETRY_ROUND commands: a round of writes
+        resumes from its last address selection before the failure, a round
+        with reads is sent again whole, because replies lost back to back can
+        shift the values read without any response error. The policy's
+        attempts apply to each round.
+        
+        Args:
+            commands (list of str): Commands to send
+            window (int): Maximum number of commands in flight, None for all of them
+            timeout (float): Per-response deadline in seconds
+            
+        Returns:
+            list: Parsed result of each command
+            
+        Raises:
+            FPGAResponseError: Error of the first command that failed
+            FPGATimeoutError: If a response does not arrive in time
+        """
+        results = []
+        remaining = list(commands)
+        size = max(len(remaining), 1)
+        # Address the next command relies on, restored after a failure
+        addr = self.current_addr
+        restore = False
+        delays = iter(backoff_delays(self.retry))
+        while True:
+            chunk = remaining[:size]
+            prefix = [ADDR_COMMANDS[addr]] if restore and chunk and not chunk[0].startswith('A') else []
+            with self.pipeline(window or max(len(prefix) + len(chunk), 1), timeout) as pipe:
+                pending = pipe.submit_many(prefix + chunk)
+            
+            failed = next((i for i, response in enumerate(pending) if response.exception() is not None), None)
+            if failed is None:
+                keep = len(chunk)
+            else:
+                error = pending[failed].exception()
+                keep = max(failed - len(prefix), 0)
+                if any(command.startswith('R') for command in chunk):
+                    keep = 0
+                while keep > 0 and not chunk[keep].startswith('A'):
+                    keep -= 1
+            
+            if keep:
+                # Progress: accept the results and start a new retry budget
+                accepted = pending[len(prefix):len(prefix) + keep]
+                results += [response.result() for response in accepted]
+                for command in chunk[:keep]:
+                    if command.startswith('A'):
+                        addr = int(command[1:].strip(), 16)
+                remaining = remaining[keep:]
+                restore = False
+                delays = iter(backoff_delays(self.retry))
+            if failed is None:
+                if not remaining:
+                    return results
+                continue
+            
+            delay = next(delays, None)
+            if delay is None or (remaining and not remaining[0].startswith('A') and addr is None):
+                raise error
+            size = min(size, BATCH_RETRY_ROUND)
+            restore = True
+            if not isinstance(error, FPGATimeoutError):
+                self.resync()
+            self.retries += 1
+            self.logger.warning("Resuming a batch at command %d of %d after: %s",
+                                len(results) + 1, len(commands), error)
+            time.sleep(delay)
+
+    def _retry_block(self, opcode, start_addr, length, data, timeout):
+        """
+        Run _run_binary_block, again from the start after a failure if a retry
+        policy allows it (block transfers are idempotent).
+        """
+        for attempt, delay in retry_schedule(self.retry):
+            try:
+                return self._run_binary_block(opcode, start_addr, length, data, timeout)
+            except (FPGATimeoutError, FPGAResponseError) as e:
+                if delay is None:
+                    raise
+                if isinstance(e, FPGAResponseError):
+                    self.resync()
+                self.retries += 1
+                self.logger.warning("Retrying a %d-byte block transfer at 0x%02X after: %s",
+                                    length, start_addr, e)
+                time.sleep(delay)
+
+    def _run_binary_block(self, opcode, start_addr, length, data, timeout):
+        """
+        Transfer a block with binary frames, written in a single call.
+        
+        Every status byte is received before an error is raised, so the link
+        stays in sync after a failure. In reliable mode the frames go through
+        the ReliableLink window instead.
+        
+        Args:
+            opcode (int): OP_WRITE or OP_READ
+            start_addr (int): First address of the block
+            length (int): Number of bytes to transfer
+            data (bytes): Values to write, None for OP_READ
+            timeout (float): Per-frame deadline in seconds
+            
+        Returns:
+            bytes: Values read (empty for OP_WRITE)
+            
+        Raises:
+            FPGAResponseError: If the FPGA rejects a frame
+            FPGATimeoutError: If a reply does not arrive in time
+        """
+        frames = []
+        reply_lengths = []
+        addr = self.current_addr
+        for offset in range(0, length, BINARY_MAX_PAYLOAD):
+            count = min(BINARY_MAX_PAYLOAD, length - offset)
+            if start_addr + offset != addr:
+                addr = start_addr + offset
+                frames.append(bytes((OP_ADDR, 1, addr)))
+                reply_lengths.append(1)
+            if opcode == OP_WRITE:
+                frames.append(bytes((OP_WRITE, count)) + data[offset:offset + count])
+                reply_lengths.append(1)
+            else:
+                frames.append(bytes((OP_READ, 1, count)))
+                reply_lengths.append(count + 1)
+        
+        self.current_addr = None
+        self.commands_sent += len(frames)
+        sent = time.perf_counter()
+        if self.reliable:
+            seqs = [self.link.send(frame) for frame in frames]
+        else:
+            self._write(b''.join(frames))
+        values = bytearray()
+        failed = None
+        for index, (frame, reply_length) in enumerate(zip(frames, reply_lengths)):
+            try:
+                if self.reliable:
+                    reply = self.link.result(seqs[index], timeout)
+                else:
+                    reply = self.read_frame(reply_length, timeout)
+            except FPGATimeoutError:
+                self._trace(sent, frame, b'', TRACE_ERROR)
+                if self.shadow is not None:
+                    self.shadow.invalidate(start_addr, length)
+                self._settle_after_timeout()
+                self._dump_trace_on_error()
+                raise
+            status = reply[-1]
+            self._trace(sent, frame, reply, TRACE_ERROR if status != STATUS_OK else 0)
+            if status != STATUS_OK and failed is None:
+                failed = status
+            values += reply[:-1]
+        
+        if failed is not None:
+            error_msg = f"FPGA rejected a binary frame (status 0x{failed:02X})"
+            self.logger.error(error_msg)
+            if self.shadow is not None:
+                self.shadow.invalidate(start_addr, length)
+            self._dump_trace_on_error()
+            raise FPGAResponseError(error_msg)
+        self.current_addr = addr
+        
+        if self.shadow is not None:
+            for offset, value in enumerate(data if opcode == OP_WRITE else values):
+                if opcode == OP_WRITE:
+                    self.shadow.store(start_addr + offset, value)
+                else:
+                    self.shadow.observe_read(start_addr + offset, value)
+        return bytes(values)
+
+    def _write(self, data):
+        """
+        Write bytes to the FPGA, counting them.
+        """
+        self.uart.write(data)
+        self.bytes_sent += len(data)
+
+    @property
+    def bytes_received(self):
+        """
+        Returns:
+            int: Bytes read from the port, including the bytes dropped
+        """
+        return self._rx.bytes_read
+
+    def discard_input(self):
+        """
+        Drop every byte received but not yet consumed by a response.
+        """
+        self._rx.clear()
+        if self.uart and self.uart.is_open:
+            self.uart.reset_input_buffer()
+
+    def resync(self, max_wait=None, quiet=READ_POLL_INTERVAL):
+        """
+        Drop received bytes until the line has been quiet for `quiet` seconds.
+        
+        Unlike discard_input, this also drops the late bytes of a response
+        that was still arriving, so they cannot be taken for the response to
+        the next command.
+        
+        Args:
+            max_wait (float): Give up waiting for a quiet line after this many
+                seconds (default: self.timeout, or `quiet` if longer)
+            quiet (float): Silence that ends the resynchronisation (default:
+                one read poll)
+            
+        Returns:
+            int: Number of bytes dropped
+        """
+        dropped = len(self._rx.clear())
+        self.resyncs += 1
+        if not self.uart or not self.uart.is_open:
+            return dropped
+        now = time.monotonic()
+        deadline = now + max(self.timeout if max_wait is None else max_wait, quiet)
+        quiet_until = now + quiet
+        while now < deadline:
+            # Blocks for at most READ_POLL_INTERVAL when nothing arrives
+            if self._rx.fill(self.uart):
+                dropped += len(self._rx.clear())
+                quiet_until = time.monotonic() + quiet
+            elif time.monotonic() >= quiet_until:
+                break
+            now = time.monotonic()
+        if dropped:
+            self.logger.warning("Resynchronised: dropped %d stray bytes", dropped)
+        return dropped
+
+    def _settle_after_timeout(self, command=None):
+        """
+        Drop the late responses of commands that timed out, so they cannot be
+        taken for the responses to the commands sent next (or to a retry).
+        
+        A response may arrive after an adaptive deadline, or after
+        self.timeout on a link with more jitter than that; the ASCII protocol
+        cannot tell it from the next response. For a single command, this
+        waits up to self.timeout for its late response; with several commands
+        in flight (command None), until the line has been quiet for
+        self.timeout. A response later than that is taken as lost.
+        
+        Args:
+            command (str): The only command awaiting a response, or None
+            
+        Returns:
+            int: Number of bytes dropped
+        """
+        if self.reliable:
+            # The link numbers its frames: late replies are recognised
+            return self.resync()
+        if command is None:
+            return self.resync(max_wait=SETTLE_MAX_QUIET_PERIODS * self.timeout, quiet=self.timeout)
+        rx = self._rx
+        kind = reply_kind(command, self.binary)
+        deadline = time.monotonic() + self.timeout
+        dropped = len(rx.clear())
+        while self.uart and self.uart.is_open and time.monotonic() < deadline:
+            if rx.fill(self.uart) and rx.next_reply(kind) is not None:
+                # The late response is accounted for
+                dropped += len(rx.last_reply)
+                self.logger.warning("Late response to %s dropped", command.strip())
+                break
+        return dropped + self.resync()
+
+    def response_timeout(self, length=0):
+        """
+        Deadline for a response, from the measured round trips if adaptive
+        timeouts are enabled.
+        
+        Args:
+            length (int): Bytes expected beyond a single-command response,
+                whose transfer time is added
+            
+        Returns:
+            float: Deadline in seconds
+        """
+        if self.rtt is None:
+            return self.timeout
+        return self.rtt.timeout() + length * BITS_PER_BYTE / self.baud_rate
+
+    def read_response(self, prefix_len=0, timeout=None):
+        """
+        Read one terminator-framed response from the FPGA.
+        
+        Bytes received past the terminator are kept for the next response.
+        
+        Args:
+            prefix_len (int): Number of raw bytes at the start of the response
+                that must not be searched for the terminator
+            timeout (float): Response deadline in seconds (default: self.response_timeout())
+            
+        Returns:
+            bytes: Raw response, including the terminator
+            
+        Raises:
+            FPGATimeoutError: If no complete response arrives before the deadline
+        """
+        if timeout is None:
+            timeout = self.response_timeout()
+        deadline = time.monotonic() + timeout
+        rx = self._rx
+        
+        while True:
+            response = rx.take_line(prefix_len)
+            if response is not None:
+                return response
+            
+            if time.monotonic() >= deadline:
+                # Bytes may have arrived while this thread was not running
+                if rx.fill(self.uart, wait=False):
+                    response = rx.take_line(prefix_len)
+                    if response is not None:
+                        return response
+                # Drop the partial response so it cannot corrupt the next one
+                partial = rx.clear()
+                error_msg = f"No complete response within {timeout:.3f} s (received {partial!r})"
+                self.logger.error(error_msg)
+                raise FPGATimeoutError(error_msg)
+            
+            rx.fill(self.uart)
+
+    def read_result(self, command, timeout=None):
+        """
+        Read and parse the response to a command in the current protocol mode.
+        
+        The response is parsed in the receive buffer (see uart_parser.py), so
+        no bytes or str object is created for a well-formed response; its raw
+        bytes are left in self._rx.last_reply.
+        
+        Args:
+            command (str): Command the response belongs to
+            timeout (float): Response deadline in seconds (default: self.response_timeout())
+            
+        Returns:
+            int, bool or BadReply: Value byte for 'R' commands, True for the
+                other commands, BadReply for an unexpected response
+            
+        Raises:
+            FPGATimeoutError: If no complete response arrives before the deadline
+        """
+        rx = self._rx
+        kind = reply_kind(command, self.binary)
+        result = rx.next_reply(kind)
+        if result is not None:
+            return result
+        
+        if timeout is None:
+            timeout = self.response_timeout()
+        deadline = time.monotonic() + timeout
+        while True:
+            if time.monotonic() >= deadline:
+                # Bytes may have arrived while this thread was not running
+                if rx.fill(self.uart, wait=False):
+                    result = rx.next_reply(kind)
+                    if result is not None:
+                        return result
+                # Drop the partial response so it cannot corrupt the next one
+                partial = rx.clear()
+                error_msg = f"No complete response within {timeout:.3f} s (received {partial!r})"
+                self.logger.error(error_msg)
+                raise FPGATimeoutError(error_msg)
+            
+            rx.fill(self.uart)
+            result = rx.next_reply(kind)
+            if result is not None:
+                return result
+
+    def read_reply(self, command, timeout=None):
+        """
+        Read the response to a command in the current protocol mode.
+        
+        Args:
+            command (str): Command the response belongs to
+            timeout (float): Response deadline in seconds (default: self.response_timeout())
+            
+        Returns:
+            bytes: Raw response as received: ASCII text, or in binary mode the
+                reply frame (see binary_reply_as_text)
+            
+        Raises:
+            FPGATimeoutError: If no complete response arrives before the deadline
+        """
+        if not self.binary:
+            return self.read_response(response_prefix_len(command), timeout)
+        return self.read_frame(2 if command.startswith('R') else 1, timeout)
+
+    def read_frame(self, length, timeout=None):
+        """
+        Read a fixed number of bytes from the FPGA.
+        
+        Args:
+            length (int): Number of bytes to read
+            timeout (float): Deadline in seconds (default: self.response_timeout())
+            
+        Returns:
+            bytes: Bytes received
+            
+        Raises:
+            FPGATimeoutError: If fewer bytes arrive before the deadline
+        """
+        if timeout is None:
+            timeout = self.response_timeout(length)
+        deadline = time.monotonic() + timeout
+        rx = self._rx
+        
+        while len(rx) < length:
+            if time.monotonic() >= deadline:
+                if rx.fill(self.uart, wait=False) and len(rx) >= length:
+                    break
+                partial = rx.clear()
+                error_msg = f"Only {len(partial)} of {length} bytes within {timeout:.3f} s (received {partial!r})"
+                self.logger.error(error_msg)
+                raise FPGATimeoutError(error_msg)
+            rx.fill(self.uart)
+        
+        return rx.take(length)
 
     def set_memory_addr(self, addr):
         """
@@ -190,17 +1686,24 @@ class FPGA:
         addr_value = addr[2:].upper()
         command = f"A{addr_value}"
         
-        self.logger.info(f"Setting memory address to: {addr}")
-        response = self.send_command(command)
+        self.logger.info("Setting memory address to: %s", addr)
+        if self.shadow is not None and self.current_addr is not None and \
+                _hex_or_none(addr_value) == self.current_addr:
+            # The address is already selected
+            self.shadow.elided += 1
+            self.logger.info("Memory address already set to: %s", addr)
+            return True
+        result = self._send(command)
         
         # Check for "OK" response
-        decoded_response = response.decode('latin-1').strip()
-        if decoded_response != "OK":
-            error_msg = f"Unexpected response when setting address: {decoded_response}"
+        if isinstance(result, BadReply):
+            error_msg = f"Unexpected response when setting address: {result.raw.decode('latin-1').strip()}"
             self.logger.error(error_msg)
+            self._dump_trace_on_error()
             raise ValueError(error_msg)
         
-        self.logger.info(f"Memory address successfully set to: {addr}")
+        self.current_addr = int(addr, 16)
+        self.logger.info("Memory address successfully set to: %s", addr)
         return True
 
     def write_val_mem(self, value):
@@ -230,17 +1733,29 @@ class FPGA:
         val = value[2:].upper()
         command = f"W{val}"
         
-        self.logger.info(f"Writing value {value} to memory")
-        response = self.send_command(command)
+        self.logger.info("Writing value %s to memory", value)
+        shadow = self.shadow if self.current_addr is not None else None
+        if shadow is not None and shadow.get(self.current_addr) is not None and \
+                shadow.get(self.current_addr) == _hex_or_none(val):
+            # The byte already holds this value
+            shadow.elided += 1
+            self.logger.info("Value %s already in memory", value)
+            return True
+        result = self._send(command)
         
         # Check for "OK" response
-        decoded_response = response.decode('latin-1').strip()
-        if decoded_response != "OK":
-            error_msg = f"Unexpected response when writing value: {decoded_response}"
+        if isinstance(result, BadReply):
+            error_msg = f"Unexpected response when writing value: {result.raw.decode('latin-1').strip()}"
             self.logger.error(error_msg)
+            if shadow is not None:
+                shadow.invalidate(self.current_addr, 1)
+            self._dump_trace_on_error()
             raise ValueError(error_msg)
         
-        self.logger.info(f"Value {value} successfully written to memory")
+        if shadow is not None:
+            shadow.store(self.current_addr, _hex_or_none(val))
+        
+        self.logger.info("Value %s successfully written to memory", value)
         return True
 
     def display_mem_vals_leds(self):
@@ -256,13 +1771,13 @@ class FPGA:
         command = "G"
         
         self.logger.info("Displaying memory value on LEDs")
-        response = self.send_command(command)
+        result = self._send(command)
         
         # Check for "OK" response
-        decoded_response = response.decode('latin-1').strip()
-        if decoded_response != "OK":
-            error_msg = f"Unexpected response when displaying on LEDs: {decoded_response}"
+        if isinstance(result, BadReply):
+            error_msg = f"Unexpected response when displaying on LEDs: {result.raw.decode('latin-1').strip()}"
             self.logger.error(error_msg)
+            self._dump_trace_on_error()
             raise ValueError(error_msg)
         
         self.logger.info("Memory value successfully displayed on LEDs")
@@ -281,27 +1796,28 @@ class FPGA:
         command = "R"
         
         self.logger.info("Reading value from memory")
-        raw_response = self.send_command(command)
+        shadow = self.shadow if self.current_addr is not None else None
+        if shadow is not None and shadow.get(self.current_addr) is not None:
+            shadow.hits += 1
+            shadow.elided += 1
+            value_hex = f"0x{shadow.get(self.current_addr):02X}"
+            self.logger.info("Value %s read from shadow memory", value_hex)
+            return value_hex
+        # The value byte, parsed in the receive buffer
+        value_byte = self._send(command)
         
-        # Analyze the raw bytes
-        if len(raw_response) < 2:
-            error_msg = f"Response too short: {raw_response}"
+        if isinstance(value_byte, BadReply):
+            error_msg = f"Unexpected response format: {value_byte.raw!r}"
             self.logger.error(error_msg)
+            self._dump_trace_on_error()
             raise ValueError(error_msg)
         
-        # Extract the first byte which should be the value
-        value_byte = raw_response[1]
-        
-        # Check if the rest of the response contains 'OK'
-        rest_of_response = raw_response[1:].decode('latin-1').strip()
-        if not rest_of_response.endswith("OK"):
-            error_msg = f"Unexpected response format: first byte = 0x{value_byte:02X}, rest = '{rest_of_response}'"
-            self.logger.error(error_msg)
-            raise ValueError(error_msg)
+        if shadow is not None:
+            shadow.observe_read(self.current_addr, value_byte)
         
         # Format the value as a hex string
         value_hex = f"0x{value_byte:02X}"
-        self.logger.info(f"Value {value_hex} successfully read from memory")
+        self.logger.info("Value %s successfully read from memory", value_hex)
         return value_hex
 
 
@@ -315,7 +1831,9 @@ def print_help():
     print("  write <hex>    - Write value to memory (e.g., write 0xF5)")
     print("  read           - Read value from current memory address")
     print("  display        - Display memory value on FPGA LEDs")
-    print("  test           - Run a series of test read/write cycles")
+    print("  test           - Run the memory test patterns over the whole memory")
+    print("  cycles         - Run a series of test read/write cycles")
+    print("  stats          - Show command counts and latencies (with --metrics)")
     print("  debug <on/off> - Turn debug logging on or off")
     print("  help           - Show this help message")
     print("  exit           - Exit the program")
@@ -421,6 +1939,26 @@ def interactive_mode(fpga):
                     print(f"Error: {e}")
                     
             elif cmd.lower() == 'test':
+                from uart_memtest import PATTERNS, run_memtest
+                try:
+                    names = input(f"Enter patterns ({', '.join(PATTERNS)}; default: all): ").split()
+                    unknown = [name for name in names if name not in PATTERNS]
+                    if unknown:
+                        raise ValueError(f"Unknown pattern(s): {', '.join(unknown)}")
+                    seed = input("Enter random seed (default: time-based): ").strip()
+                    seed = int(seed, 0) if seed else None
+                    print("\nRunning memory test (memory contents will be lost)...")
+                    if isinstance(fpga, FPGA):
+                        summaries = [result.summary() for result in run_memtest(fpga, names, seed)]
+                    else:
+                        # DaemonClient: the daemon runs the test on its board
+                        summaries = fpga.memtest(names or None, seed)
+                    for summary in summaries:
+                        print(f"  {summary}")
+                except ValueError as e:
+                    print(f"Error: {e}")
+                    
+            elif cmd.lower() == 'cycles':
                 try:
                     cycles = input("Enter number of test cycles (default: 5): ").strip()
                     cycles = int(cycles) if cycles else 5
@@ -428,17 +1966,32 @@ def interactive_mode(fpga):
                 except ValueError as e:
                     print(f"Error: {e}")
                 
+            elif cmd.lower() == 'stats':
+                metrics = getattr(fpga, 'metrics', None)
+                if metrics is None:
+                    print("Metrics are not enabled (start with --metrics)")
+                    continue
+                snapshot = metrics.snapshot()
+                print(f"Bytes sent: {snapshot['bytes_sent']}, received: {snapshot['bytes_received']}")
+                for kind, entry in snapshot['commands'].items():
+                    latency = entry.get('latency', {})
+                    line = f"  {kind:<12} {entry['count']:>8} sent {entry['errors']:>5} errors"
+                    if latency.get('count'):
+                        line += (f"  p50 {latency['p50_ms']:.3f} ms  p99 {latency['p99_ms']:.3f} ms"
+                                 f"  max {latency['max_ms']:.3f} ms")
+                    print(line)
+                    
             elif cmd.lower().startswith('debug '):
                 mode = cmd.split(' ')[1].lower()
                 if mode == 'on':
                     # Set logger level to DEBUG
-                    for handler in fpga.logger.handlers:
+                    for handler in sink_handlers(fpga.logger):
                         handler.setLevel(logging.DEBUG)
                     fpga.logger.setLevel(logging.DEBUG)
                     print("Debug logging enabled")
                 elif mode == 'off':
                     # Reset console handler to INFO
-                    for handler in fpga.logger.handlers:
+                    for handler in sink_handlers(fpga.logger):
                         if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler):
                             handler.setLevel(logging.INFO)
                     print("Debug logging disabled (file logging continues at original level)")
@@ -458,11 +2011,17 @@ def interactive_mode(fpga):
 
 if __name__ == '__main__':
     import argparse
+    import json
+    from uart_logging import STREAMING_LOG_CONFIG
+    from uart_recovery import RetryPolicy
     
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='FPGA UART Communication Interface')
-    parser.add_argument('--port', '-p', type=str, required=True, 
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--port', '-p', type=str,
                         help='Serial port (e.g., COM3, /dev/ttyUSB0)')
+    target.add_argument('--daemon', type=str, default=None, metavar='SOCKET',
+                        help='Use the board served by fpga_daemon.py on this socket')
     parser.add_argument('--baud', '-b', type=int, default=115200, 
                         help='Baud rate (default: 115200)')
     parser.add_argument('--parity', type=str, choices=['none', 'odd', 'even'], default='none',
@@ -470,14 +2029,59 @@ if __name__ == '__main__':
     parser.add_argument('--stop', type=int, choices=[1, 2], default=1,
                         help='Stop bits (default: 1)')
     parser.add_argument('--timeout', '-t', type=float, default=1.0,
-                        help='Read timeout in seconds (default: 1.0)')
+                        help='Per-command response deadline in seconds (default: 1.0)')
     parser.add_argument('--debug', '-d', action='store_true',
                         help='Enable debug logging')
     parser.add_argument('--logfile', '-l', type=str, default=None,
                         help='Log file path (default: auto-generated)')
+    parser.add_argument('--binary', action='store_true',
+                        help='Use the binary framing mode if the FPGA supports it')
+    parser.add_argument('--shadow', type=str, choices=[SHADOW_CACHED, SHADOW_VERIFY], default=None,
+                        help='Keep a host-side copy of the FPGA memory with this policy')
+    parser.add_argument('--queued-log', action='store_true',
+                        help='Write logs from a background thread, with size/time rotation')
+    parser.add_argument('--log-cap-mb', type=float, default=None,
+                        help='Cap on the total size of the session log file and its backups in MB (implies --queued-log)')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='Dump the last transactions to this file when a command fails')
+    parser.add_argument('--retries', type=int, default=0,
+                        help='Send a command again up to this many times after a bad response (default: 0)')
+    parser.add_argument('--adaptive-timeout', action='store_true',
+                        help='Derive response deadlines from the measured round trips (--timeout is the maximum)')
+    parser.add_argument('--reliable', action='store_true',
+                        help='Use CRC-checked frames with retransmission if the FPGA supports it (implies --binary)')
+    parser.add_argument('--low-latency', action='store_true',
+                        help='Enable the Linux low-latency serial mode and a 1 ms USB latency timer, restored at exit')
+    parser.add_argument('--metrics', action='store_true',
+                        help='Keep per-command counters and latency histograms (see the stats command)')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='Serve the metrics in the Prometheus format on this local port (implies --metrics)')
+    parser.add_argument('--script', type=str, default=None, metavar='FILE',
+                        help="Run the commands of this file ('-' for stdin) as one batch and print JSON results")
+    parser.add_argument('--script-window', type=int, default=None,
+                        help='Commands in flight while a script runs (default: 64)')
     
     args = parser.parse_args()
     
+    script = None
+    if args.script:
+        from uart_script import DEFAULT_WINDOW, parse_script, run_script
+        try:
+            if args.script == '-':
+                script = parse_script(sys.stdin)
+            else:
+                with open(args.script) as f:
+                    script = parse_script(f)
+        except (OSError, ValueError) as e:
+            parser.error(f"--script: {e}")
+    
+    def run_batch(target, port):
+        # Print the results of the script as JSON; exit status 1 if any command failed
+        report = {'port': port}
+        report.update(run_script(target, script, args.script_window or DEFAULT_WINDOW))
+        print(json.dumps(report, indent=2))
+        return 1 if report['errors'] else 0
+    
     # Map parity string to serial constants
     parity_map = {
         'none': serial.PARITY_NONE,
@@ -494,6 +2098,26 @@ if __name__ == '__main__':
     # Set logging level based on debug flag
     log_level = logging.DEBUG if args.debug else logging.INFO
     
+    log_config = None
+    if args.queued_log or args.log_cap_mb:
+        log_config = STREAMING_LOG_CONFIG
+        if args.log_cap_mb:
+            log_config = log_config._replace(max_total_bytes=int(args.log_cap_mb * 1024 * 1024))
+    
+    if args.daemon:
+        from fpga_daemon import DaemonClient
+        try:
+            with DaemonClient(args.daemon) as client:
+                if script is not None:
+                    sys.exit(run_batch(client, args.daemon))
+                print(f"Connected to FPGA daemon on {args.daemon}")
+                interactive_mode(client)
+        except OSError as e:
+            print(f"Failed to connect to the FPGA daemon on {args.daemon}: {e}")
+            sys.exit(1)
+        sys.exit(0)
+    
+    status = 0
     try:
         # Initialize FPGA with command line parameters
         fpga = FPGA(
@@ -503,21 +2127,43 @@ if __name__ == '__main__':
             stop_bits=stop_map[args.stop],
             timeout=args.timeout,
             log_level=log_level,
-            log_file=args.logfile
+            log_file=args.logfile,
+            binary=args.binary,
+            trace_file=args.trace,
+            log_config=log_config,
+            shadow=args.shadow,
+            retry=RetryPolicy(attempts=args.retries + 1) if args.retries else None,
+            adaptive_timeout=args.adaptive_timeout,
+            reliable=args.reliable,
+            metrics=args.metrics or args.metrics_port is not None,
+            low_latency=args.low_latency
         )
         
+        if args.metrics_port is not None:
+            from uart_metrics import MetricsServer
+            metrics_server = MetricsServer([fpga], port=args.metrics_port).start()
+            # Keep stdout for the JSON results of a script
+            print(f"Metrics served on {metrics_server.url}", file=sys.stderr if script is not None else sys.stdout)
+        
         # Open the UART connection
-        if fpga.open_instrument():
+        if not fpga.open_instrument():
+            print(f"Failed to connect to FPGA on port {args.port}")
+            status = 1
+        elif script is not None:
+            status = run_batch(fpga, args.port)
+        else:
             print(f"Connected to FPGA on port {args.port}")
             # Start interactive mode
             interactive_mode(fpga)
-        else:
-            print(f"Failed to connect to FPGA on port {args.port}")
             
     except Exception as e:
         print(f"An error occurred: {e}")
+        status = 1
         
     finally:
         # Close the UART connection if it was opened
         if 'fpga' in locals():
-            fpga.close_instrument()
\ No newline at end of file
+            fpga.close_instrument()
+        if 'metrics_server' in locals():
+            metrics_server.stop()
+    sys.exit(status)
\ No newline at end of file
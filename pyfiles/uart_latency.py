@@ -0,0 +1,296 @@
+"""
+Low-latency tuning of Linux serial ports, restored when the port is closed.
+
+USB-UART adapters such as FTDI chips hold received bytes for up to their
+latency timer (16 ms by default) before sending them to the host, which
+dominates the round trip of a short command. Two settings shorten it:
+
+- the ASYNC_LOW_LATENCY flag of the tty (TIOCGSERIAL/TIOCSSERIAL ioctls),
+  which also makes the kernel push received bytes to the reader at once;
+- the adapter's latency timer in sysfs
+  (/sys/bus/usb-serial/devices/ttyUSB0/latency_timer), writable by root or
+  through a udev rule.
+
+LowLatencyTuning applies whichever of them the port supports, reports what it
+changed and puts the previous values back on restore(). Running this module
+measures the single-command round trip before and after:
+
+    python uart_latency.py --port /dev/ttyUSB0
+"""
+
+import logging
+import os
+import struct
+from collections import namedtuple
+
+try:
+    import fcntl
+    import termios
+except ImportError:  # Not available on Windows, where nothing is tuned
+    fcntl = termios = None
+
+# Flag of struct serial_struct (linux/serial.h)
+ASYNC_LOW_LATENCY = 1 << 13
+
+# Offset of the flags field in struct serial_struct (after type, line, port, irq)
+SERIAL_FLAGS_OFFSET = 16
+
+# Buffer for struct serial_struct (72 bytes on 64-bit Linux)
+SERIAL_STRUCT_SIZE = 128
+
+# Directory of the USB serial devices in sysfs
+SYSFS_USB_SERIAL = '/sys/bus/usb-serial/devices'
+
+# Latency timer set by default, in milliseconds (the adapters accept 1-255)
+DEFAULT_LATENCY_TIMER_MS = 1
+
+# Round trips measured by default before and after tuning
+DEFAULT_RTT_SAMPLES = 200
+
+# One setting changed: name, value before and value after
+LatencyChange = namedtuple('LatencyChange', ['setting', 'before', 'after'])
+
+
+def latency_timer_path(port):
+    """
+    Path of the sysfs latency timer of a USB serial port.
+
+    Symbolic links such as /dev/serial/by-id/usb-FTDI_... are resolved first.
+
+    Args:
+        port (str): Serial port path
+
+    Returns:
+        str: Path of the latency_timer file, None if the port has none
+    """
+    path = os.path.join(SYSFS_USB_SERIAL, os.path.basename(os.path.realpath(port)), 'latency_timer')
+    return path if os.path.exists(path) else None
+
+
+def _serial_flags(fd):
+    buffer = bytearray(SERIAL_STRUCT_SIZE)
+    fcntl.ioctl(fd, termios.TIOCGSERIAL, buffer, True)
+    return buffer, struct.unpack_from('i', buffer, SERIAL_FLAGS_OFFSET)[0]
+
+
+def set_low_latency(fd, enabled):
+    """
+    Set or clear the ASYNC_LOW_LATENCY flag of a tty.
+
+    Args:
+        fd (int): File descriptor of the open port
+        enabled (bool): New state of the flag
+
+    Returns:
+        bool: Previous state of the flag
+
+    Raises:
+        OSError: If the port does not support the ioctls (e.g. a
+            pseudo-terminal) or the change is not permitted
+    """
+    buffer, flags = _serial_flags(fd)
+    previous = bool(flags & ASYNC_LOW_LATENCY)
+    if previous != enabled:
+        flags = flags | ASYNC_LOW_LATENCY if enabled else flags & ~ASYNC_LOW_LATENCY
+        struct.pack_into('i', buffer, SERIAL_FLAGS_OFFSET, flags)
+        fcntl.ioctl(fd, termios.TIOCSSERIAL, buffer)
+    return previous
+
+
+def read_latency_timer(path):
+    """
+    Returns:
+        int: Latency timer in milliseconds
+    """
+    with open(path) as f:
+        return int(f.read().strip())
+
+
+def write_latency_timer(path, milliseconds):
+    """
+    Raises:
+        OSError: If the file is not writable (PermissionError without root or a udev rule)
+    """
+    with open(path, 'w') as f:
+        f.write(f'{milliseconds}\n')
+
+
+class LowLatencyTuning:
+    """
+    Low-latency settings applied to one open serial port.
+    """
+
+    def __init__(self, port, fd, logger=None):
+        """
+        Args:
+            port (str): Serial port path, used to find its sysfs entry
+            fd (int): File descriptor of the open port
+            logger (logging.Logger): Where to report the changes (default: none)
+        """
+        self.port = port
+        self.fd = fd
+        self.logger = logger
+        # Settings changed by apply(), as LatencyChange
+        self.changes = []
+        # Settings that could not be changed: (setting, reason)
+        self.skipped = []
+
+    def _log(self, level, message, *args):
+        if self.logger is not None:
+            self.logger.log(level, message, *args)
+
+    def apply(self, latency_timer=DEFAULT_LATENCY_TIMER_MS):
+        """
+        Enable ASYNC_LOW_LATENCY and lower the adapter's latency timer, as far
+        as the port and the permissions allow.
+
+        Args:
+            latency_timer (int): Latency timer to set in milliseconds, None to
+                leave it
+
+        Returns:
+            list of LatencyChange: Settings changed
+        """
+        if fcntl is None or not hasattr(termios, 'TIOCGSERIAL'):
+            self.skipped.append(('low_latency', "not supported on this platform"))
+            self._log(logging.WARNING, "Low-latency tuning is only supported on Linux")
+            return self.changes
+
+        try:
+            if not set_low_latency(self.fd, True):
+                self.changes.append(LatencyChange('ASYNC_LOW_LATENCY', False, True))
+        except OSError as e:
+            self.skipped.append(('ASYNC_LOW_LATENCY', e.strerror or str(e)))
+
+        path = latency_timer_path(self.port)
+        if latency_timer is not None and path is not None:
+            try:
+                before = read_latency_timer(path)
+                if before > latency_timer:
+                    write_latency_timer(path, latency_timer)
+                    self.changes.append(LatencyChange('latency_timer_ms', before, latency_timer))
+            except OSError as e:
+                self.skipped.append(('latency_timer_ms', e.strerror or str(e)))
+        elif latency_timer is not None:
+            self.skipped.append(('latency_timer_ms', "not a USB serial adapter"))
+
+        for change in self.changes:
+            self._log(logging.INFO, "%s on %s: %s -> %s", change.setting, self.port, change.before, change.after)
+        for setting, reason in self.skipped:
+            self._log(logging.WARNING, "%s on %s left unchanged: %s", setting, self.port, reason)
+        return self.changes
+
+    def restore(self):
+        """
+        Put back the settings changed by apply().
+
+        Returns:
+            list of LatencyChange: Settings restored
+        """
+        restored = []
+        for change in reversed(self.changes):
+            try:
+                if change.setting == 'ASYNC_LOW_LATENCY':
+                    set_low_latency(self.fd, change.before)
+                else:
+                    write_latency_timer(latency_timer_path(self.port), change.before)
+            except (OSError, TypeError) as e:
+                self._log(logging.WARNING, "Could not restore %s on %s: %s", change.setting, self.port, e)
+                continue
+            restored.append(LatencyChange(change.setting, change.after, change.before))
+            self._log(logging.INFO, "%s on %s restored to %s", change.setting, self.port, change.before)
+        self.changes = []
+        return restored
+
+
+def measure_rtt(fpga, count=DEFAULT_RTT_SAMPLES):
+    """
+    Measure the single-command round trip of an open FPGA connection.
+
+    Args:
+        fpga (FPGA): Open FPGA connection
+        count (int): Number of 'A' commands timed
+
+    Returns:
+        dict: p50, p95 and p99 latency in milliseconds and commands/s (see
+            uart_bench.run_workload)
+    """
+    from uart_bench import run_workload
+
+    result = run_workload(fpga, 'rtt', count)
+    return {key: result[key] for key in ('latency_p50_ms', 'latency_p95_ms', 'latency_p99_ms',
+                                          'commands_per_s')}
+
+
+def compare_low_latency(fpga, count=DEFAULT_RTT_SAMPLES, latency_timer=DEFAULT_LATENCY_TIMER_MS):
+    """
+    Measure the round trip, enable the low-latency mode and measure it again.
+
+    The mode stays enabled; fpga.close_instrument() (or
+    fpga.disable_low_latency()) restores the previous settings.
+
+    Args:
+        fpga (FPGA): Open FPGA connection without the low-latency mode
+        count (int): Round trips measured each time
+        latency_timer (int): Latency timer to set in milliseconds
+
+    Returns:
+        dict: 'before' and 'after' measurements (see measure_rtt), 'changes'
+            and 'skipped' settings
+    """
+    before = measure_rtt(fpga, count)
+    fpga.enable_low_latency(latency_timer)
+    after = measure_rtt(fpga, count)
+    tuning = fpga.latency_tuning
+    return {
+        'port': fpga.port,
+        'before': before,
+        'after': after,
+        'changes': [change._asdict() for change in tuning.changes] if tuning is not None else [],
+        'skipped': [{'setting': setting, 'reason': reason} for setting, reason in tuning.skipped]
+                   if tuning is not None else [],
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import sys
+
+    from uart_improv3 import FPGA
+
+    parser = argparse.ArgumentParser(description='Measure the FPGA round trip before and after low-latency tuning')
+    parser.add_argument('--port', '-p', type=str, required=True,
+                        help='Serial port of the FPGA (e.g. /dev/ttyUSB0)')
+    parser.add_argument('--baud', '-b', type=int, default=115200,
+                        help='Baud rate (default: 115200)')
+    parser.add_argument('--count', '-n', type=int, default=DEFAULT_RTT_SAMPLES,
+                        help=f'Round trips measured before and after (default: {DEFAULT_RTT_SAMPLES})')
+    parser.add_argument('--latency-timer', type=int, default=DEFAULT_LATENCY_TIMER_MS,
+                        help=f'USB adapter latency timer to set in ms (default: {DEFAULT_LATENCY_TIMER_MS})')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the report as JSON')
+
+    args = parser.parse_args()
+
+    fpga = FPGA(port=args.port, baud_rate=args.baud, log_level=logging.WARNING)
+    if not fpga.open_instrument():
+        sys.exit(f"Failed to connect to FPGA on port {args.port}")
+    try:
+        report = compare_low_latency(fpga, args.count, args.latency_timer)
+    finally:
+        # Puts the previous settings back
+        fpga.close_instrument()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for change in report['changes']:
+            print(f"Changed {change['setting']}: {change['before']} -> {change['after']}")
+        for skipped in report['skipped']:
+            print(f"Left {skipped['setting']}: {skipped['reason']}")
+        print(f"{'':8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'cmd/s':>10}")
+        for label in ('before', 'after'):
+            m = report[label]
+            print(f"{label:8}{m['latency_p50_ms']:10.3f}{m['latency_p95_ms']:10.3f}"
+                  f"{m['latency_p99_ms']:10.3f}{m['commands_per_s']:10.0f}")
@@ -0,0 +1,186 @@
+"""
+Log sinks for long-running FPGA sessions.
+
+With a LogConfig, setup_logger (uart_improv3.py) can hand log records to a
+background thread through a queue, so the serial I/O thread never waits on
+the disk or the terminal, and rotate its log file by size and age while
+keeping the log directory under a total size.
+"""
+
+import atexit
+import glob
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from collections import namedtuple
+
+# How setup_logger builds its handlers:
+#   queued           hand records to a background writer thread
+#   max_bytes        rotate the log file when it reaches this size (0: never)
+#   rotate_interval  rotate the log file after this many seconds (0: never)
+#   backup_count     rotated files kept per log file
+#   max_total_bytes  delete the oldest backups of the log file beyond this total (0: no cap)
+LogConfig = namedtuple('LogConfig', ['queued', 'max_bytes', 'rotate_interval', 'backup_count',
+                                     'max_total_bytes'],
+                       defaults=[True, 0, 0, 5, 0])
+
+# Suggested configuration for multi-hour streaming sessions
+STREAMING_LOG_CONFIG = LogConfig(queued=True, max_bytes=10 * 1024 * 1024, rotate_interval=3600,
+                                 backup_count=20, max_total_bytes=200 * 1024 * 1024)
+
+# Running queue listeners, by logger name
+_listeners = {}
+
+
+class CappedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    File handler rotating by size and age, with a cap on the disk space used
+    by every log file matching `pattern`.
+    """
+
+    def __init__(self, filename, max_bytes=0, rotate_interval=0, backup_count=5,
+                 max_total_bytes=0, pattern=None):
+        """
+        Args:
+            filename (str): Log file
+            max_bytes (int): Rotate when the file reaches this size (0: never)
+            rotate_interval (float): Rotate after this many seconds (0: never)
+            backup_count (int): Rotated files kept
+            max_total_bytes (int): Total size allowed for the files matching
+                `pattern` (0: no cap)
+            pattern (str): Glob of the files counted against the cap
+                (default: this log file and its backups)
+        """
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+        self.rotate_interval = rotate_interval
+        self.max_total_bytes = max_total_bytes
+        self.pattern = pattern or self.baseFilename + '*'
+        self._opened_at = time.monotonic()
+        self.enforce_cap()
+
+    def shouldRollover(self, record):
+        if self.rotate_interval and time.monotonic() - self._opened_at >= self.rotate_interval:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self._opened_at = time.monotonic()
+        self.enforce_cap()
+
+    def enforce_cap(self):
+        """
+        Delete the oldest files matching the pattern until the total size fits
+        the cap. The active log file is never deleted.
+        """
+        if not self.max_total_bytes:
+            return
+        files = []
+        for path in glob.glob(self.pattern):
+            if os.path.abspath(path) == self.baseFilename:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        try:
+            total = os.path.getsize(self.baseFilename)
+        except OSError:
+            total = 0
+        total += sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_total_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that leaves message formatting to the listener thread.
+
+    The standard QueueHandler formats each record before queuing it, which
+    puts the formatting cost back on the caller. Records stay in-process
+    here, so they can be queued as they are.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def file_handler(log_file, config, pattern=None):
+    """
+    Create the file handler described by a LogConfig.
+
+    Args:
+        log_file (str): Log file
+        config (LogConfig): Rotation and cap settings
+        pattern (str): Glob of the files counted against the cap
+
+    Returns:
+        logging.FileHandler: Plain file handler if no rotation or cap is configured
+    """
+    if not (config.max_bytes or config.rotate_interval or config.max_total_bytes):
+        return logging.FileHandler(log_file)
+    return CappedRotatingFileHandler(log_file, config.max_bytes, config.rotate_interval,
+                                     config.backup_count, config.max_total_bytes, pattern)
+
+
+def attach_handlers(logger, handlers, config):
+    """
+    Attach handlers to a logger, behind a queue if the configuration asks for it.
+
+    Args:
+        logger (logging.Logger): Logger without handlers
+        handlers (list of logging.Handler): Handlers writing the records
+        config (LogConfig): Logging configuration, None to attach them directly
+    """
+    stop_queue_logging(logger.name)
+    if config is None or not config.queued:
+        for handler in handlers:
+            logger.addHandler(handler)
+        return
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners[logger.name] = listener
+    logger.addHandler(DeferredQueueHandler(records))
+
+
+def sink_handlers(logger):
+    """
+    Handlers that actually write the records of a logger.
+
+    Returns:
+        list of logging.Handler: The listener's handlers for a queued logger,
+            the logger's own handlers otherwise
+    """
+    listener = _listeners.get(logger.name)
+    return list(listener.handlers) if listener is not None else list(logger.handlers)
+
+
+def stop_queue_logging(name=None):
+    """
+    Write out every queued record and stop the background writer.
+
+    Args:
+        name (str): Logger name, None for every queued logger
+    """
+    names = list(_listeners) if name is None else [name]
+    for logger_name in names:
+        listener = _listeners.pop(logger_name, None)
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+
+
+atexit.register(stop_queue_logging)
@@ -0,0 +1,295 @@
+"""
+Memory test engine for the FPGA memory.
+
+Runs standard memory test patterns over the whole address space with batched
+commands: walking ones and zeros, march C-, address-in-address and seeded
+random data. Each pattern yields a MemTestResult listing the failing
+addresses and bits, with a one-line summary.
+"""
+
+import random
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from uart_improv3 import ADDR_COMMANDS, MEMORY_SIZE, WRITE_COMMANDS
+
+# Commands in flight during a march element
+DEFAULT_WINDOW = 64
+
+# Faults kept per pattern; further faults are only counted
+MAX_FAULTS = 1024
+
+# March C-: (address order, operations). 'w0' writes the background, 'r1'
+# reads and expects its complement, and so on.
+MARCH_C_MINUS = [
+    ('up', ['w0']),
+    ('up', ['r0', 'w1']),
+    ('up', ['r1', 'w0']),
+    ('down', ['r0', 'w1']),
+    ('down', ['r1', 'w0']),
+    ('up', ['r0']),
+]
+
+# One wrong byte read back
+MemoryFault = namedtuple('MemoryFault', ['address', 'expected', 'actual', 'step'])
+
+
+class MemTestResult:
+    """
+    Outcome of one test pattern.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.faults = []
+        self.fault_count = 0
+        self.writes = 0
+        self.reads = 0
+        self.seconds = 0.0
+
+    @property
+    def passed(self):
+        return self.fault_count == 0
+
+    def check(self, step, start_addr, expected, actual):
+        """
+        Compare the bytes read back with the expected ones and record faults.
+
+        Args:
+            step (str): Step of the pattern, for the report
+            start_addr (int): Address of the first byte
+            expected (bytes): Expected values
+            actual (bytes): Values read
+        """
+        self.reads += len(actual)
+        if expected == actual:
+            return
+        for offset, (want, got) in enumerate(zip(expected, actual)):
+            if want != got:
+                self.fault_count += 1
+                if len(self.faults) < MAX_FAULTS:
+                    self.faults.append(MemoryFault(start_addr + offset, want, got, step))
+
+    def failing_bits(self):
+        """
+        Returns:
+            dict: Bits seen wrong at each failing address (OR of expected ^ actual)
+        """
+        bits = {}
+        for fault in self.faults:
+            bits[fault.address] = bits.get(fault.address, 0) | (fault.expected ^ fault.actual)
+        return bits
+
+    def summary(self, max_addresses=8):
+        """
+        One-line report of the pattern.
+
+        Args:
+            max_addresses (int): Failing addresses listed before abbreviating
+
+        Returns:
+            str: e.g. 'march_c-  PASS  1280 W / 1280 R in 2.31 s'
+        """
+        text = (f"{self.pattern:<14s} {'PASS' if self.passed else 'FAIL'}  "
+                f"{self.writes} W / {self.reads} R in {self.seconds:.2f} s")
+        if self.passed:
+            return text
+        bits = self.failing_bits()
+        listed = ', '.join(f"0x{addr:02X}:{mask:08b}" for addr, mask in sorted(bits.items())[:max_addresses])
+        more = f" +{len(bits) - max_addresses} more" if len(bits) > max_addresses else ""
+        return f"{text}  {self.fault_count} faults at {len(bits)} addresses [{listed}{more}]"
+
+
+@contextmanager
+def _raw_memory(fpga):
+    # Bypass the shadow memory: a test must not skip writes or answer reads
+    # from the host, and leaves the memory contents unknown
+    shadow, fpga.shadow = fpga.shadow, None
+    try:
+        yield
+    finally:
+        fpga.shadow = shadow
+        if shadow is not None:
+            shadow.invalidate()
+
+
+def _write_and_verify(fpga, result, step, data, timeout):
+    fpga.write_block(0, data, timeout=timeout)
+    result.writes += len(data)
+    result.check(step, 0, data, fpga.read_block(0, len(data), timeout=timeout))
+
+
+def walking_ones(fpga, result, seed=None, window=DEFAULT_WINDOW, timeout=None):
+    """
+    Fill the memory with each single-bit value in turn and read it back.
+    """
+    for bit in range(8):
+        _write_and_verify(fpga, result, f"bit {bit}", bytes([1 << bit]) * MEMORY_SIZE, timeout)
+
+
+def walking_zeros(fpga, result, seed=None, window=DEFAULT_WINDOW, timeout=None):
+    """
+    Fill the memory with each single-zero-bit value in turn and read it back.
+    """
+    for bit in range(8):
+        _write_and_verify(fpga, result, f"bit {bit}", bytes([0xFF ^ (1 << bit)]) * MEMORY_SIZE, timeout)
+
+
+def address_in_address(fpga, result, seed=None, window=DEFAULT_WINDOW, timeout=None):
+    """
+    Write each address into itself, then its complement, and read them back.
+
+    Catches address decoder faults that uniform patterns cannot see.
+    """
+    _write_and_verify(fpga, result, "address", bytes(range(MEMORY_SIZE)), timeout)
+    _write_and_verify(fpga, result, "~address", bytes(0xFF ^ a for a in range(MEMORY_SIZE)), timeout)
+
+
+def random_data(fpga, result, seed=None, window=DEFAULT_WINDOW, timeout=None):
+    """
+    Write seeded random bytes and read them back, twice.
+
+    The seed is part of the step name, so a failing run can be reproduced.
+    """
+    rng = random.Random(seed)
+    for run in range(2):
+        data = bytes(rng.getrandbits(8) for _ in range(MEMORY_SIZE))
+        _write_and_verify(fpga, result, f"seed {seed} pass {run}", data, timeout)
+
+
+def march(fpga, result, elements, background=0x00, window=DEFAULT_WINDOW, timeout=None):
+    """
+    Run a march test.
+
+    Each element visits every address in the given order and applies its
+    operations to that address before moving to the next one. The commands of
+    a whole element are pipelined; the FPGA executes them in order, so the
+    march sequence is preserved.
+
+    Args:
+        fpga (FPGA): Open FPGA connection
+        result (MemTestResult): Result to fill
+        elements (list of tuple): (order 'up' or 'down', list of 'w0'/'w1'/'r0'/'r1')
+        background (int): Byte written by 'w0' ('w1' writes its complement)
+        window (int): Maximum number of commands in flight
+        timeout (float): Per-response deadline in seconds
+    """
+    values = {'0': background, '1': 0xFF ^ background}
+    for index, (order, operations) in enumerate(elements):
+        addresses = range(MEMORY_SIZE) if order == 'up' else range(MEMORY_SIZE - 1, -1, -1)
+        step = f"M{index} {'⇑' if order == 'up' else '⇓'}({','.join(operations)})"
+
+        commands = []
+        reads = []
+        for addr in addresses:
+            commands.append(ADDR_COMMANDS[addr])
+            for operation in operations:
+                value = values[operation[1]]
+                if operation[0] == 'w':
+                    commands.append(WRITE_COMMANDS[value])
+                    result.writes += 1
+                else:
+                    commands.append('R')
+                    reads.append((len(commands) - 1, addr, value))
+
+        with fpga.pipeline(window, timeout) as pipe:
+            pending = pipe.submit_many(commands)
+        # A failed command is a link error, not a memory fault
+        for response in pending:
+            if response.exception() is not None:
+                raise response.exception()
+        for position, addr, value in reads:
+            result.check(step, addr, bytes([value]), bytes([pending[position].result()]))
+
+
+def march_c_minus(fpga, result, seed=None, window=DEFAULT_WINDOW, timeout=None):
+    """
+    March C- with a 0x00 background, then with a 0x55 background to cover
+    every bit with both neighbours.
+    """
+    march(fpga, result, MARCH_C_MINUS, 0x00, window, timeout)
+    march(fpga, result, MARCH_C_MINUS, 0x55, window, timeout)
+
+
+PATTERNS = {
+    'walking_ones': walking_ones,
+    'walking_zeros': walking_zeros,
+    'march_c-': march_c_minus,
+    'address': address_in_address,
+    'random': random_data,
+}
+
+
+def run_memtest(fpga, patterns=None, seed=None, window=DEFAULT_WINDOW, timeout=None):
+    """
+    Run memory test patterns on an open FPGA.
+
+    The memory contents are destroyed.
+
+    Args:
+        fpga (FPGA): Open FPGA connection
+        patterns (list of str): Names from PATTERNS (default: all of them)
+        seed (int): Seed of the random pattern (default: time-based, reported)
+        window (int): Maximum number of commands in flight for march tests
+        timeout (float): Per-response deadline in seconds (default: fpga.response_timeout())
+
+    Returns:
+        list of MemTestResult: One result per pattern, in order
+    """
+    if seed is None:
+        seed = int(time.time())
+    results = []
+    with _raw_memory(fpga):
+        for name in patterns or PATTERNS:
+            result = MemTestResult(name)
+            start = time.perf_counter()
+            PATTERNS[name](fpga, result, seed=seed, window=window, timeout=timeout)
+            result.seconds = time.perf_counter() - start
+            fpga.logger.info("Memory test %s", result.summary())
+            results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    import logging
+    import sys
+
+    from uart_improv3 import FPGA
+
+    parser = argparse.ArgumentParser(description='FPGA memory test')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--port', '-p', type=str, help='Serial port of the FPGA')
+    target.add_argument('--sim', action='store_true', help='Test a local virtual FPGA')
+    parser.add_argument('--baud', '-b', type=int, default=115200,
+                        help='Baud rate (default: 115200)')
+    parser.add_argument('--pattern', '-P', type=str, action='append', choices=list(PATTERNS),
+                        help='Pattern to run, may be given several times (default: all)')
+    parser.add_argument('--seed', '-s', type=int, default=None,
+                        help='Seed of the random pattern (default: time-based)')
+    parser.add_argument('--binary', action='store_true',
+                        help='Use the binary framing mode if the FPGA supports it')
+
+    args = parser.parse_args()
+
+    device = None
+    port = args.port
+    if args.sim:
+        from fpga_sim import VirtualFPGA
+        device = VirtualFPGA(baud_rate=args.baud)
+        port = device.start()
+
+    fpga = FPGA(port=port, baud_rate=args.baud, binary=args.binary, log_level=logging.WARNING)
+    try:
+        if not fpga.open_instrument():
+            sys.exit(f"Failed to connect to FPGA on port {port}")
+        results = run_memtest(fpga, args.pattern, args.seed)
+        for res in results:
+            print(res.summary())
+        failed = not all(res.passed for res in results)
+    finally:
+        fpga.close_instrument()
+        if device is not None:
+            device.stop()
+    sys.exit(1 if failed else 0)
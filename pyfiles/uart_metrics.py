@@ -0,0 +1,407 @@
+"""
+Counters and latency histograms of an FPGA connection, with a Prometheus endpoint.
+
+With FPGA(..., metrics=True) every transaction is counted per command type
+('A', 'W', 'G', 'R', 'other' for the mode switches) and its latency recorded
+in a LatencyHistogram; write_block and read_block are also recorded as whole
+operations ('write_block', 'read_block'). Together with the connection's own
+counters (bytes on the wire, transport writes, retries, resyncs, reliable-mode
+retransmissions) they are returned by FPGAMetrics.snapshot() and rendered in
+the Prometheus text format, which a MetricsServer serves over HTTP:
+
+    server = MetricsServer([fpga], port=9108).start()
+    # curl http://127.0.0.1:9108/metrics
+
+Recording is cheap enough for every command (an index computation and two
+list increments); snapshots may be taken from another thread.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram resolution: 2**SUB_BUCKET_BITS buckets below 64 us, then
+# 2**(SUB_BUCKET_BITS - 1) buckets per power of two, i.e. about 3 % precision
+SUB_BUCKET_BITS = 6
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT // 2
+
+# Highest latency tracked in microseconds (about 67 s); longer ones are clamped
+MAX_TRACKED_US = (1 << 26) - 1
+
+# Bucket boundaries of the Prometheus histograms, in seconds
+PROMETHEUS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                      0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Percentiles reported by snapshots
+SNAPSHOT_PERCENTILES = (50, 90, 99, 99.9)
+
+DEFAULT_METRICS_PORT = 9108
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Command type of a transaction, from the first byte of the command (the
+# binary opcodes are the ASCII command letters)
+COMMAND_KINDS = {ord(letter): letter for letter in 'AWGR'}
+OTHER_KIND = 'other'
+WRITE_BLOCK = 'write_block'
+READ_BLOCK = 'read_block'
+
+
+def _bucket_index(us):
+    if us < SUB_BUCKET_COUNT:
+        return us
+    exponent = us.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKET_COUNT + (exponent - 1) * SUB_BUCKET_HALF + (us >> exponent) - SUB_BUCKET_HALF
+
+
+def _bucket_upper(index):
+    # Highest value in microseconds counted in a bucket
+    if index < SUB_BUCKET_COUNT:
+        return index
+    exponent, sub = divmod(index - SUB_BUCKET_COUNT, SUB_BUCKET_HALF)
+    exponent += 1
+    return ((sub + SUB_BUCKET_HALF + 1) << exponent) - 1
+
+
+BUCKET_COUNT = _bucket_index(MAX_TRACKED_US) + 1
+
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram with microsecond resolution (HDR style).
+
+    Buckets are 1 us wide below 64 us and about 3 % of their value above, so
+    a percentile is reported within 3 % of the exact value whatever the
+    number of samples, in fixed memory.
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        # Sum of the latencies in seconds
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        """
+        Args:
+            seconds (float): Latency to add
+        """
+        us = int(seconds * 1e6)
+        self.counts[_bucket_index(min(max(us, 0), MAX_TRACKED_US))] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percentile):
+        """
+        Returns:
+            float: Latency in seconds at the given percentile (0-100), the
+                upper edge of its bucket, None without samples
+        """
+        if not self.count:
+            return None
+        rank = max(int(self.count * percentile / 100 + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(_bucket_upper(index) / 1e6, self.max)
+        return self.max
+
+    def count_at_or_below(self, seconds):
+        """
+        Returns:
+            int: Number of latencies recorded whose bucket ends at or below `seconds`
+        """
+        limit = seconds * 1e6
+        total = 0
+        for index, count in enumerate(self.counts):
+            if _bucket_upper(index) > limit:
+                break
+            total += count
+        return total
+
+    def merge(self, other):
+        """
+        Add the samples of another histogram to this one.
+        """
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        for attr, pick in (('min', min), ('max', max)):
+            theirs = getattr(other, attr)
+            if theirs is not None:
+                mine = getattr(self, attr)
+                setattr(self, attr, theirs if mine is None else pick(mine, theirs))
+
+    def copy(self):
+        """
+        Returns:
+            LatencyHistogram: Independent copy
+        """
+        histogram = LatencyHistogram()
+        histogram.merge(self)
+        return histogram
+
+    def summary(self):
+        """
+        Returns:
+            dict: count, mean, min, max and SNAPSHOT_PERCENTILES in milliseconds
+        """
+        summary = {'count': self.count}
+        if self.count:
+            summary['mean_ms'] = self.total / self.count * 1e3
+            summary['min_ms'] = self.min * 1e3
+            summary['max_ms'] = self.max * 1e3
+            for percentile in SNAPSHOT_PERCENTILES:
+                summary[f'p{percentile:g}_ms'] = self.percentile(percentile) * 1e3
+        return summary
+
+
+class FPGAMetrics:
+    """
+    Per-command-type counters and latency histograms of one FPGA connection.
+    """
+
+    def __init__(self, fpga=None):
+        """
+        Args:
+            fpga (FPGA): Connection whose own counters (bytes on the wire,
+                retries, resyncs, reliable link) are included in snapshots
+        """
+        self.fpga = fpga
+        self.started = time.time()
+        self.commands = {}
+        self.errors = {}
+        self.latency = {}
+
+    def record(self, kind, latency, error=False):
+        """
+        Count one transaction or operation.
+
+        Args:
+            kind (str): Command type, see COMMAND_KINDS, WRITE_BLOCK and READ_BLOCK
+            latency (float): Seconds from sending to the complete reply
+            error (bool): True if it failed; its latency is not recorded
+        """
+        self.commands[kind] = self.commands.get(kind, 0) + 1
+        if error:
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+            return
+        histogram = self.latency.get(kind)
+        if histogram is None:
+            histogram = self.latency[kind] = LatencyHistogram()
+        histogram.record(latency)
+
+    def record_frame(self, frame, latency, error=False):
+        """
+        Count one transaction by the command bytes sent (ASCII or binary).
+        """
+        self.record(COMMAND_KINDS.get(frame[0], OTHER_KIND) if frame else OTHER_KIND, latency, error)
+
+    def reset(self):
+        """
+        Forget every count and latency recorded.
+        """
+        self.started = time.time()
+        self.commands = {}
+        self.errors = {}
+        self.latency = {}
+
+    def connection_counters(self):
+        """
+        Returns:
+            dict: Counters kept by the FPGA connection itself (empty without one)
+        """
+        fpga = self.fpga
+        if fpga is None:
+            return {}
+        counters = {'bytes_sent': fpga.bytes_sent, 'bytes_received': fpga.bytes_received,
+                    'commands_sent': fpga.commands_sent, 'retries': fpga.retries,
+                    'resyncs': fpga.resyncs}
+        if fpga.uart is not None:
+            # Write calls and the sends they were coalesced into, see uart_transport.py
+            counters.update({f'transport_{name}': value for name, value in fpga.uart.stats().items()})
+        link = fpga.link
+        if link is not None:
+            counters.update({f'reliable_{name}': value for name, value in link.stats().items()})
+        return counters
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: JSON-serialisable copy of every counter, with a latency
+                summary (see LatencyHistogram.summary) per command type
+        """
+        commands = dict(self.commands)
+        errors = dict(self.errors)
+        latency = dict(self.latency)
+        snapshot = {'uptime_s': time.time() - self.started, 'commands': {}}
+        if self.fpga is not None:
+            snapshot['port'] = self.fpga.port
+            snapshot.update(self.connection_counters())
+        for kind in sorted(commands):
+            entry = {'count': commands[kind], 'errors': errors.get(kind, 0)}
+            if kind in latency:
+                entry['latency'] = latency[kind].copy().summary()
+            snapshot['commands'][kind] = entry
+        return snapshot
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def render_prometheus(metrics_list):
+    """
+    Render the metrics of several connections in the Prometheus text format.
+
+    Args:
+        metrics_list (list of FPGAMetrics): One per board, labelled by port
+
+    Returns:
+        str: Exposition text
+    """
+    families = {}
+
+    def add(name, kind, help_text, labels, value):
+        family = families.setdefault(name, (kind, help_text, []))
+        family[2].append(f'{name}{{{labels}}} {value}')
+
+    for metrics in metrics_list:
+        port = metrics.fpga.port if metrics.fpga is not None else ''
+        for name, value in metrics.connection_counters().items():
+            add(f'fpga_{name}_total', 'counter', f"FPGA connection counter {name}",
+                _labels(port=port), value)
+        errors = dict(metrics.errors)
+        latency = dict(metrics.latency)
+        for kind, count in sorted(dict(metrics.commands).items()):
+            labels = _labels(port=port, command=kind)
+            add('fpga_commands_total', 'counter', "Commands and block operations sent", labels, count)
+            add('fpga_command_errors_total', 'counter', "Commands and block operations that failed",
+                labels, errors.get(kind, 0))
+            histogram = latency.get(kind)
+            if histogram is None:
+                continue
+            histogram = histogram.copy()
+            name = 'fpga_command_latency_seconds'
+            help_text = "Latency of the successful commands and block operations"
+            for bound in PROMETHEUS_BUCKETS:
+                add(f'{name}_bucket', 'histogram', help_text, f'{labels},le="{bound:g}"',
+                    histogram.count_at_or_below(bound))
+            add(f'{name}_bucket', 'histogram', help_text, f'{labels},le="+Inf"', histogram.count)
+            add(f'{name}_sum', 'histogram', help_text, labels, repr(histogram.total))
+            add(f'{name}_count', 'histogram', help_text, labels, histogram.count)
+
+    lines = []
+    for name, (kind, help_text, samples) in families.items():
+        # The _bucket, _sum and _count series share the histogram's metadata
+        base = name.rsplit('_', 1)[0] if kind == 'histogram' else name
+        if kind != 'histogram' or name.endswith('_bucket'):
+            lines.append(f'# HELP {base} {help_text}')
+            lines.append(f'# TYPE {base} {kind}')
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        metrics_list = self.server.metrics_list()
+        if self.path.split('?')[0] == '/metrics':
+            body = render_prometheus(metrics_list).encode()
+            content_type = PROMETHEUS_CONTENT_TYPE
+        elif self.path.split('?')[0] == '/metrics.json':
+            body = json.dumps([metrics.snapshot() for metrics in metrics_list], indent=1).encode()
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """
+    HTTP server exposing the metrics of FPGA connections in a background thread.
+
+    GET /metrics returns the Prometheus text format, GET /metrics.json the
+    snapshots. Connections without metrics are skipped.
+    """
+
+    def __init__(self, fpgas, host='127.0.0.1', port=DEFAULT_METRICS_PORT):
+        """
+        Args:
+            fpgas (list of FPGA): Connections to expose
+            host (str): Address to listen on (default: local only)
+            port (int): TCP port, 0 for any free port
+        """
+        self.fpgas = list(fpgas)
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def metrics_list(self):
+        """
+        Returns:
+            list of FPGAMetrics: Metrics of the connections that keep them
+        """
+        return [fpga.metrics for fpga in self.fpgas if fpga.metrics is not None]
+
+    def start(self):
+        """
+        Start listening; `port` is updated if it was 0.
+
+        Returns:
+            MetricsServer: self
+        """
+        self._server = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+        self._server.daemon_threads = True
+        self._server.metrics_list = self.metrics_list
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fpga-metrics', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the server and wait for its thread.
+        """
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}/metrics'
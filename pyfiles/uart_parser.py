@@ -0,0 +1,263 @@
+"""
+Incremental parser for FPGA replies over a reusable receive buffer.
+
+Bytes are read from the port straight into a preallocated bytearray and
+replies are parsed where they stand: a reply split across several reads is
+resumed from the last byte scanned, and the canonical replies ('OK \\n',
+'x<value> OK \\n' and the binary status frames) are recognised without
+creating any bytes or str object. A reply parses to True (OK), to the value
+byte as an int ('R'), or to a BadReply holding its raw bytes.
+"""
+
+import os
+from collections import namedtuple
+
+# Every FPGA reply ends with a line feed ('OK \n' or '<lead><value> OK \n')
+RESPONSE_TERMINATOR = b'\n'
+
+# 'R' replies start with two raw bytes (lead byte + value byte) that may take
+# any value, including the terminator, so the terminator search skips them
+READ_RESPONSE_PREFIX_LEN = 2
+
+# Reply kinds
+REPLY_OK = 0        # ASCII 'OK \n'
+REPLY_VALUE = 1     # ASCII '<lead><value> OK \n'
+FRAME_STATUS = 2    # binary mode: status byte
+FRAME_VALUE = 3     # binary mode: value byte + status byte
+
+# Initial size of the receive buffer; it only grows for a reply longer than that
+DEFAULT_RX_BUFFER_SIZE = 4096
+
+# A reply that does not match its command, with its raw bytes
+BadReply = namedtuple('BadReply', ['raw'])
+
+_OK_REPLY = b'OK \n'
+_VALUE_LEAD = ord('x')
+_VALUE_SUFFIX = b' OK \n'
+_STATUS_OK = 0x00
+
+# Canonical replies, shared instead of copied out of the buffer
+_VALUE_REPLIES = [bytes((_VALUE_LEAD, value)) + _VALUE_SUFFIX for value in range(256)]
+_STATUS_FRAMES = [bytes((status,)) for status in range(256)]
+_VALUE_FRAMES = [bytes((value, _STATUS_OK)) for value in range(256)]
+
+_readv = getattr(os, 'readv', None)
+
+
+def reply_kind(command, binary=False):
+    """
+    Kind of reply a command gets.
+
+    Args:
+        command (str): Command as sent to the FPGA
+        binary (bool): True in binary framing mode
+
+    Returns:
+        int: REPLY_OK, REPLY_VALUE, FRAME_STATUS or FRAME_VALUE
+    """
+    if binary:
+        return FRAME_VALUE if command.startswith('R') else FRAME_STATUS
+    return REPLY_VALUE if command.startswith('R') else REPLY_OK
+
+
+class ReplyParser:
+    """
+    Receive buffer and incremental reply parser of one FPGA connection.
+
+    The unparsed bytes are buffer[start:end]. Reading appends at `end`;
+    parsing a reply advances `start`, and both go back to 0 once everything
+    has been parsed, so the buffer is only compacted when a partial reply
+    sits at its very end.
+    """
+
+    def __init__(self, size=DEFAULT_RX_BUFFER_SIZE):
+        """
+        Args:
+            size (int): Initial size of the receive buffer in bytes
+        """
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        # Where the terminator search of the reply at `start` resumes
+        self._scan = 0
+        # Raw bytes of the last reply parsed
+        self.last_reply = b''
+        # Bytes read from the port since creation
+        self.bytes_read = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def fill(self, uart, wait=True):
+        """
+        Read the bytes waiting on a port into the buffer.
+
+        On a POSIX serial port the bytes are read straight into the buffer
+        with os.readv; other ports go through their readinto method.
+
+        Args:
+            uart: Open serial.Serial (or any object with in_waiting and readinto)
+            wait (bool): Block for up to the port timeout for one byte when
+                nothing is waiting
+
+        Returns:
+            int: Number of bytes read
+        """
+        waiting = uart.in_waiting
+        if not waiting:
+            if not wait:
+                return 0
+            # Single-byte bytes objects are shared, so this allocates nothing
+            data = uart.read(1)
+            if not data:
+                return 0
+            self._make_room(1)
+            self._buffer[self._end] = data[0]
+            self._end += 1
+            self.bytes_read += 1
+            return 1
+        room = self._make_room(waiting)
+        target = self._view[self._end:self._end + min(waiting, room)]
+        fd = getattr(uart, 'fd', None)
+        if fd is not None and _readv is not None:
+            try:
+                count = _readv(fd, [target])
+            except BlockingIOError:
+                count = 0
+        else:
+            count = uart.readinto(target) or 0
+        target.release()
+        self._end += count
+        self.bytes_read += count
+        return count
+
+    def _make_room(self, wanted):
+        if self._start == self._end:
+            self._start = self._end = self._scan = 0
+        free = len(self._buffer) - self._end
+        if free < wanted and self._start:
+            # Move the partial reply to the front
+            count = self._end - self._start
+            self._buffer[:count] = self._buffer[self._start:self._end]
+            self._scan = max(self._scan - self._start, 0)
+            self._start, self._end = 0, count
+            free = len(self._buffer) - count
+        if not free:
+            # A single reply fills the buffer: only garbage does that
+            self._view.release()
+            self._buffer.extend(bytes(len(self._buffer)))
+            self._view = memoryview(self._buffer)
+            free = len(self._buffer) - self._end
+        return free
+
+    def next_reply(self, kind):
+        """
+        Parse the next reply if it is complete.
+
+        Call again with the same kind after more bytes have been read to
+        resume a partial reply.
+
+        Args:
+            kind (int): Reply kind expected, see reply_kind()
+
+        Returns:
+            True, int, BadReply or None: True for an OK reply, the value byte
+                for a value reply, BadReply for a malformed reply or an error
+                status, None if the reply is not complete yet
+        """
+        buffer = self._buffer
+        start = self._start
+        end = self._end
+
+        if kind >= FRAME_STATUS:
+            stop = start + (1 if kind == FRAME_STATUS else 2)
+            if stop > end:
+                return None
+            status = buffer[stop - 1]
+            self._consume(stop)
+            if status != _STATUS_OK:
+                self.last_reply = bytes(buffer[start:stop])
+                return BadReply(self.last_reply)
+            if kind == FRAME_STATUS:
+                self.last_reply = _STATUS_FRAMES[status]
+                return True
+            value = buffer[start]
+            self.last_reply = _VALUE_FRAMES[value]
+            return value
+
+        prefix = READ_RESPONSE_PREFIX_LEN if kind == REPLY_VALUE else 0
+        scan = max(self._scan, start + prefix)
+        if scan > end:
+            return None
+        stop = buffer.find(RESPONSE_TERMINATOR, scan, end)
+        if stop < 0:
+            self._scan = end
+            return None
+        stop += 1
+        self._consume(stop)
+
+        # Canonical replies
+        if kind == REPLY_OK:
+            if stop - start == len(_OK_REPLY) and buffer.startswith(_OK_REPLY, start):
+                self.last_reply = _OK_REPLY
+                return True
+        elif stop - start == prefix + len(_VALUE_SUFFIX) and buffer[start] == _VALUE_LEAD and \
+                buffer.startswith(_VALUE_SUFFIX, start + prefix):
+            value = buffer[start + 1]
+            self.last_reply = _VALUE_REPLIES[value]
+            return value
+
+        # Any other spacing or lead byte, as parse_response accepts it
+        raw = self.last_reply = bytes(buffer[start:stop])
+        text = raw[prefix:].strip()
+        if kind == REPLY_OK:
+            return True if text == b'OK' else BadReply(raw)
+        return raw[1] if text.endswith(b'OK') else BadReply(raw)
+
+    def _consume(self, stop):
+        self._start = self._scan = stop
+
+    def take(self, length):
+        """
+        Remove a fixed number of bytes from the buffer.
+
+        Returns:
+            bytes: The bytes, None if fewer are buffered
+        """
+        if self._end - self._start < length:
+            return None
+        data = bytes(self._view[self._start:self._start + length])
+        self._consume(self._start + length)
+        return data
+
+    def take_line(self, prefix_len=0, terminator=RESPONSE_TERMINATOR):
+        """
+        Remove one terminator-framed reply from the buffer.
+
+        Args:
+            prefix_len (int): Raw bytes at the start that are not searched
+            terminator (bytes): Byte ending the reply
+
+        Returns:
+            bytes: The reply, including the terminator, None if not complete
+        """
+        scan = max(self._scan, self._start + prefix_len)
+        if scan > self._end:
+            return None
+        stop = self._buffer.find(terminator, scan, self._end)
+        if stop < 0:
+            self._scan = self._end
+            return None
+        return self.take(stop + 1 - self._start)
+
+    def clear(self):
+        """
+        Drop every unparsed byte.
+
+        Returns:
+            bytes: The bytes dropped
+        """
+        dropped = bytes(self._view[self._start:self._end])
+        self._start = self._end = self._scan = 0
+        return dropped
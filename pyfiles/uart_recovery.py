@@ -0,0 +1,129 @@
+"""
+Retry and timeout policies for recovering from bad FPGA responses.
+
+A garbled or lost response makes the FPGA client resynchronise (drop every
+byte until the line is quiet) and, with a RetryPolicy, send the command
+again after a bounded exponential backoff. Every command of the protocol is
+idempotent once the address register is restored, so retrying is safe.
+
+An RttEstimator replaces the fixed per-response deadline with one derived
+from the measured round trips (a high percentile times a safety factor), so
+a lost response costs a few milliseconds instead of the full serial timeout.
+"""
+
+import itertools
+from collections import deque, namedtuple
+
+# How the FPGA client retries a failed command:
+#   attempts     total tries of a command, including the first one
+#   backoff      delay before the first retry in seconds
+#   max_backoff  cap on the delay, which doubles at every retry
+RetryPolicy = namedtuple('RetryPolicy', ['attempts', 'backoff', 'max_backoff'],
+                         defaults=[3, 0.002, 0.05])
+
+# Round trips kept to estimate the deadline
+DEFAULT_RTT_WINDOW = 256
+
+# Round trips measured before the estimate replaces the fixed timeout
+MIN_RTT_SAMPLES = 16
+
+# New round trips between two percentile computations
+RTT_RECOMPUTE_EVERY = 32
+
+
+def backoff_delays(policy):
+    """
+    Delays to wait before each retry allowed by a policy.
+
+    Args:
+        policy (RetryPolicy): Retry policy, None for no retry
+
+    Returns:
+        list of float: One delay per retry (empty without retries)
+    """
+    if policy is None:
+        return []
+    return [min(policy.backoff * 2 ** retry, policy.max_backoff)
+            for retry in range(policy.attempts - 1)]
+
+
+class RttEstimator:
+    """
+    Response deadline derived from the recent round-trip times.
+
+    The deadline is the `percentile` round trip times `factor`, clamped to
+    [min_timeout, max_timeout]. Until MIN_RTT_SAMPLES round trips have been
+    measured it is max_timeout.
+    """
+
+    def __init__(self, max_timeout, min_timeout=0.02, percentile=99, factor=3.0,
+                 window=DEFAULT_RTT_WINDOW):
+        """
+        Args:
+            max_timeout (float): Deadline before enough samples, and upper bound
+            min_timeout (float): Lower bound of the deadline in seconds
+            percentile (float): Percentile of the round trips used (0-100)
+            factor (float): Safety factor applied to the percentile
+            window (int): Number of recent round trips kept
+        """
+        self.max_timeout = max_timeout
+        self.min_timeout = min(min_timeout, max_timeout)
+        self.percentile = percentile
+        self.factor = factor
+        self._samples = deque(maxlen=window)
+        self._new_samples = 0
+        self._timeout = max_timeout
+
+    def __len__(self):
+        return len(self._samples)
+
+    def observe(self, rtt):
+        """
+        Record one round trip.
+
+        Args:
+            rtt (float): Seconds from writing a command to its complete response
+        """
+        self._samples.append(rtt)
+        self._new_samples += 1
+        if len(self._samples) >= MIN_RTT_SAMPLES and \
+                (self._new_samples >= RTT_RECOMPUTE_EVERY or self._timeout == self.max_timeout):
+            self._new_samples = 0
+            estimate = self.quantile(self.percentile) * self.factor
+            self._timeout = min(max(estimate, self.min_timeout), self.max_timeout)
+
+    def quantile(self, percentile):
+        """
+        Returns:
+            float: Round trip at the given percentile (0-100), None without samples
+        """
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(int(len(ordered) * percentile / 100), len(ordered) - 1)
+        return ordered[index]
+
+    def timeout(self):
+        """
+        Returns:
+            float: Current response deadline in seconds
+        """
+        return self._timeout
+
+    def reset(self):
+        """
+        Forget the measured round trips, e.g. after a baud rate change.
+        """
+        self._samples.clear()
+        self._new_samples = 0
+        self._timeout = self.max_timeout
+
+
+def retry_schedule(policy):
+    """
+    Pair every attempt allowed by a policy with the delay before the next one.
+
+    Yields:
+        tuple: (attempt number from 0, delay before the next attempt, None for the last attempt)
+    """
+    return enumerate(itertools.chain(backoff_delays(policy), [None]))
@@ -0,0 +1,425 @@
+"""
+Reliable transfer mode: CRC-checked frames with sliding-window retransmission.
+
+The reliable mode sits on top of the binary framing mode. The host enters it
+with the binary frame <OP_RELIABLE> <1> <window>; once the FPGA has answered
+with STATUS_OK, every frame in both directions is
+
+    COBS( <seq> <body> <crc16> ) 0x00
+
+The body of a command is <opcode> <payload> with the opcodes of the binary
+mode; the body of a reply is the binary-mode reply (bytes read, then the
+status byte). COBS removes every zero byte from the frame, so 0x00 only
+appears as the delimiter and a corrupted frame cannot desynchronise the
+next one. The CRC is CRC-16/CCITT-FALSE over <seq> <body>, and a frame that
+fails it is dropped.
+
+The FPGA executes commands strictly in sequence order. A frame that arrives
+after a gap is held until the missing frame comes, and the FPGA answers the
+gap with a NAK carrying the missing sequence number, once per gap. A frame
+that is received again is not executed again; its reply is sent again from
+a cache of the last `window` replies, so retransmitting a write is safe
+even for the registers of the ASCON mailbox.
+
+The host keeps up to `window` frames unacknowledged and retransmits only
+the frames that are missing. It resends a frame when its NAK arrives or
+when a later reply arrives without it, since replies are sent in order.
+Otherwise the frame is resent after a reply timeout. A frame with the
+opcode OP_RELIABLE resets the sequence numbers on both sides after an
+unrecoverable failure, and OP_TEXT goes back to the ASCII protocol.
+"""
+
+import binascii
+import time
+from collections import OrderedDict
+
+from uart_improv3 import (BITS_PER_BYTE, FPGATimeoutError, FPGAResponseError, OP_READ,
+                          OP_RELIABLE, RELIABLE_MAX_WINDOW, STATUS_NAK, STATUS_OK)
+from uart_parser import BadReply
+
+# Delimiter between COBS-encoded frames
+FRAME_DELIMITER = b'\x00'
+
+# Frames in flight by default
+DEFAULT_RELIABLE_WINDOW = 16
+
+# Transmissions of one frame, including the first, before the link gives up
+DEFAULT_MAX_TRANSMISSIONS = 8
+
+# Sequence numbers are one byte
+SEQUENCE_SPACE = 256
+
+# Body of a NAK reply
+NAK_BODY = bytes((STATUS_NAK,))
+
+# Reset attempts after an unrecoverable failure
+RESET_ATTEMPTS = 3
+
+# Bytes added to a body on the wire: sequence number, CRC, COBS code, delimiter
+FRAME_OVERHEAD = 5
+
+
+def crc16(data):
+    """
+    Returns:
+        int: CRC-16/CCITT-FALSE of data (polynomial 0x1021, initial value 0xFFFF)
+    """
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def cobs_encode(data):
+    """
+    Consistent overhead byte stuffing: encode data without any zero byte.
+
+    Args:
+        data (bytes): Data to encode
+
+    Returns:
+        bytes: Encoded data, one byte longer per 254 bytes (at least one)
+    """
+    out = bytearray()
+    for run in bytes(data).split(b'\x00'):
+        while len(run) >= 254:
+            out.append(255)
+            out += run[:254]
+            run = run[254:]
+        out.append(len(run) + 1)
+        out += run
+    return bytes(out)
+
+
+def cobs_decode(data):
+    """
+    Decode data encoded by cobs_encode.
+
+    Raises:
+        ValueError: If data is not a valid COBS encoding
+    """
+    out = bytearray()
+    index = 0
+    while index < len(data):
+        code = data[index]
+        if code == 0 or index + code > len(data):
+            raise ValueError("Invalid COBS encoding")
+        out += data[index + 1:index + code]
+        index += code
+        if code < 255 and index < len(data):
+            out.append(0)
+    return bytes(out)
+
+
+def encode_frame(seq, body):
+    """
+    Build a reliable-mode frame, delimiter included.
+
+    Args:
+        seq (int): Sequence number (0-255)
+        body (bytes): Command (opcode and payload) or reply (data and status)
+
+    Returns:
+        bytes: Frame to write to the wire
+    """
+    frame = bytes((seq,)) + body
+    return cobs_encode(frame + crc16(frame).to_bytes(2, 'big')) + FRAME_DELIMITER
+
+
+def decode_frame(encoded):
+    """
+    Check and open a reliable-mode frame.
+
+    Args:
+        encoded (bytes): Frame as received, with or without the delimiter
+
+    Returns:
+        tuple: (sequence number, body), None if the frame is corrupted
+    """
+    try:
+        frame = cobs_decode(encoded.rstrip(FRAME_DELIMITER))
+    except ValueError:
+        return None
+    if len(frame) < 3 or crc16(frame[:-2]) != int.from_bytes(frame[-2:], 'big'):
+        return None
+    return frame[0], frame[1:-2]
+
+
+class _Frame:
+    """
+    A frame sent and not answered yet.
+    """
+
+    __slots__ = ('seq', 'encoded', 'wire_len', 'queued', 'transmissions', 'deadline', 'sent',
+                 'gap_resent')
+
+    def __init__(self, seq, encoded, reply_len):
+        self.seq = seq
+        self.encoded = encoded
+        # Bytes of the frame and its expected reply on the wire
+        self.wire_len = len(encoded) + reply_len
+        # Wire bytes of the frames in flight up to this one when it was sent
+        self.queued = 0
+        self.transmissions = 0
+        self.deadline = None
+        self.sent = None
+        # Resent because a later reply arrived first
+        self.gap_resent = False
+
+
+class ReliableLink:
+    """
+    Host side of the reliable mode on an FPGA connection.
+
+    Frames are queued by send() and written together when the link has to
+    wait for a reply. Replies are kept by sequence number until result() or
+    transfer() claims them.
+    """
+
+    def __init__(self, fpga, window=DEFAULT_RELIABLE_WINDOW, max_transmissions=DEFAULT_MAX_TRANSMISSIONS):
+        """
+        Args:
+            fpga (FPGA): Connection already switched to the reliable mode
+            window (int): Maximum number of unacknowledged frames
+            max_transmissions (int): Transmissions of a frame before giving up
+        """
+        if not 1 <= window <= RELIABLE_MAX_WINDOW:
+            raise ValueError(f"Reliable window must be between 1 and {RELIABLE_MAX_WINDOW}, got {window}")
+        self.fpga = fpga
+        self.window = window
+        self.max_transmissions = max_transmissions
+        self._next_seq = 0
+        self._outstanding = OrderedDict()
+        self._replies = {}
+        self._unsent = []
+        # When a frame was last retransmitted
+        self._retransmitted_at = 0.0
+
+        # Counters
+        self.frames_sent = 0
+        self.retransmissions = 0
+        self.crc_errors = 0
+        self.naks = 0
+
+    def __len__(self):
+        return len(self._outstanding)
+
+    def send(self, frame):
+        """
+        Queue a command, waiting for the oldest reply if the window is full.
+
+        Args:
+            frame (bytes): Binary-mode frame <opcode> <length> <payload>
+
+        Returns:
+            int: Sequence number, to pass to result()
+        """
+        while len(self._outstanding) >= self.window:
+            self._wait(next(iter(self._outstanding)))
+        seq = self._next_seq
+        self._next_seq = (seq + 1) % SEQUENCE_SPACE
+        # A stale reply with the same number must not be claimed
+        self._replies.pop(seq, None)
+        reply_len = (frame[2] if frame[0] == OP_READ else 0) + 1 + FRAME_OVERHEAD
+        entry = _Frame(seq, encode_frame(seq, frame[:1] + frame[2:]), reply_len)
+        self._outstanding[seq] = entry
+        self._unsent.append(entry)
+        return seq
+
+    def flush(self, timeout=None):
+        """
+        Write every queued frame in a single call.
+
+        Args:
+            timeout (float): Reply deadline of each frame (default: from
+                fpga.response_timeout(), with the bytes queued before it)
+        """
+        if not self._unsent:
+            return
+        fpga = self.fpga
+        fpga._write(b''.join(entry.encoded for entry in self._unsent))
+        now = time.monotonic()
+        # Frames are serialised, so a frame's deadline includes the frames before it
+        queued = sum(entry.wire_len for entry in self._outstanding.values() if entry.sent is not None)
+        for entry in self._unsent:
+            queued += entry.wire_len
+            entry.queued = queued
+            entry.sent = now
+            entry.transmissions = 1
+            entry.deadline = now + (fpga.response_timeout(queued) if timeout is None else timeout)
+        self.frames_sent += len(self._unsent)
+        self._unsent.clear()
+
+    def result(self, seq, timeout=None):
+        """
+        Wait for the reply to a frame and return its body.
+
+        Args:
+            seq (int): Sequence number returned by send()
+            timeout (float): Reply deadline of each transmission
+
+        Returns:
+            bytes: Bytes read (if any), then the status byte
+
+        Raises:
+            FPGATimeoutError: If the frame is still missing after
+                max_transmissions transmissions
+        """
+        self._wait(seq, timeout)
+        return self._replies.pop(seq)
+
+    def transfer(self, frames, timeout=None):
+        """
+        Send frames through the window and return their replies in order.
+
+        Args:
+            frames (list of bytes): Binary-mode frames
+            timeout (float): Reply deadline of each transmission
+
+        Returns:
+            list of bytes: Reply body of each frame
+        """
+        seqs = [self.send(frame) for frame in frames]
+        return [self.result(seq, timeout) for seq in seqs]
+
+    def execute(self, frame, timeout=None):
+        """
+        Send one frame and wait for its parsed reply (see parse()).
+        """
+        return self.parse(self.result(self.send(frame), timeout))
+
+    def parse(self, reply):
+        """
+        Parse the reply to a single-byte command like FPGA.read_result(),
+        leaving its raw bytes in the FPGA's last_reply.
+
+        Args:
+            reply (bytes): Reply body returned by result()
+
+        Returns:
+            int, bool or BadReply: Value byte for a one-byte OP_READ, True
+                for the other commands, BadReply for an error status
+        """
+        self.fpga._rx.last_reply = reply
+        if reply[-1] != STATUS_OK:
+            return BadReply(reply)
+        return reply[0] if len(reply) == 2 else True
+
+    def _wait(self, seq, timeout=None):
+        # Receive until the frame has been answered, retransmitting as needed
+        self.flush(timeout)
+        fpga = self.fpga
+        rx = fpga._rx
+        while seq in self._outstanding:
+            encoded = rx.take_line(terminator=FRAME_DELIMITER)
+            if encoded is not None:
+                self._on_frame(encoded, timeout)
+                continue
+            oldest = next(iter(self._outstanding.values()))
+            if time.monotonic() >= oldest.deadline:
+                # Bytes may have arrived while this thread was not running
+                if not rx.fill(fpga.uart, wait=False):
+                    self._retransmit(oldest, timeout, "no reply")
+                continue
+            rx.fill(fpga.uart)
+
+    def _on_frame(self, encoded, timeout):
+        decoded = decode_frame(encoded)
+        if decoded is None:
+            self.crc_errors += 1
+            self.fpga.logger.warning("Dropped a corrupted reply frame (%d bytes)", len(encoded))
+            return
+        seq, body = decoded
+        if body == NAK_BODY:
+            self.naks += 1
+            entry = self._outstanding.get(seq)
+            if entry is not None:
+                self._retransmit(entry, timeout, "NAK")
+            return
+        entry = self._outstanding.pop(seq, None)
+        if entry is None:
+            # Reply to a frame answered already
+            return
+        self._replies[seq] = body
+        fpga = self.fpga
+        if entry.transmissions == 1 and entry.sent > self._retransmitted_at and fpga.rtt is not None:
+            # Round trip without the time spent behind the frames sent before
+            # it. Retransmitted frames are ambiguous and frames sent before a
+            # retransmission may have been held by the FPGA: neither is measured
+            behind = (entry.queued - entry.wire_len) * BITS_PER_BYTE / fpga.baud_rate
+            fpga.rtt.observe(max(time.monotonic() - entry.sent - behind, 0.0))
+        # Replies come in order: the earlier frames were executed, but their replies were lost
+        for earlier in list(self._outstanding.values()):
+            if (seq - earlier.seq) % SEQUENCE_SPACE > self.window:
+                break
+            if not earlier.gap_resent:
+                earlier.gap_resent = True
+                self._retransmit(earlier, timeout, f"reply {seq} arrived first")
+
+    def _retransmit(self, entry, timeout, reason):
+        fpga = self.fpga
+        if entry.transmissions >= self.max_transmissions:
+            error_msg = f"Frame {entry.seq} unanswered after {entry.transmissions} transmissions ({reason})"
+            fpga.logger.error(error_msg)
+            self.reset()
+            raise FPGATimeoutError(error_msg)
+        fpga.logger.warning("Retransmitting frame %d (%s)", entry.seq, reason)
+        fpga._write(entry.encoded)
+        entry.transmissions += 1
+        self._retransmitted_at = time.monotonic()
+        entry.deadline = self._retransmitted_at + (fpga.response_timeout(entry.wire_len) if timeout is None else timeout)
+        # The FPGA holds the frames sent after this one until it arrives:
+        # their replies now come behind its reply
+        queued = entry.wire_len
+        behind = False
+        for later in self._outstanding.values():
+            if later is entry:
+                behind = True
+            elif behind and later.sent is not None:
+                queued += later.wire_len
+                later.deadline = max(later.deadline, self._retransmitted_at +
+                                     (fpga.response_timeout(queued) if timeout is None else timeout))
+        self.retransmissions += 1
+        self.frames_sent += 1
+
+    def reset(self):
+        """
+        Forget every frame in flight and restart the sequence numbers on both
+        sides, after an unrecoverable failure.
+
+        Raises:
+            FPGATimeoutError: If the FPGA does not acknowledge the reset
+            FPGAResponseError: If the FPGA rejects it
+        """
+        fpga = self.fpga
+        self._outstanding.clear()
+        self._replies.clear()
+        self._unsent.clear()
+        fpga.current_addr = None
+        if fpga.shadow is not None:
+            # Frames in flight may or may not have been executed
+            fpga.shadow.invalidate()
+        for _ in range(RESET_ATTEMPTS):
+            seq = self._next_seq
+            self._next_seq = (seq + 1) % SEQUENCE_SPACE
+            fpga.resync()
+            fpga._write(encode_frame(seq, bytes((OP_RELIABLE, self.window))))
+            deadline = time.monotonic() + fpga.timeout
+            while time.monotonic() < deadline:
+                encoded = fpga._rx.take_line(terminator=FRAME_DELIMITER)
+                if encoded is None:
+                    fpga._rx.fill(fpga.uart)
+                    continue
+                decoded = decode_frame(encoded)
+                if decoded is None or decoded[0] != seq:
+                    continue
+                if decoded[1][-1:] != bytes((STATUS_OK,)):
+                    raise FPGAResponseError(f"FPGA rejected the link reset (status 0x{decoded[1][-1]:02X})")
+                fpga.logger.warning("Reliable link reset at sequence number %d", seq)
+                return
+        raise FPGATimeoutError("FPGA did not acknowledge the link reset")
+
+    def stats(self):
+        """
+        Returns:
+            dict: Frame counters of the link
+        """
+        return {'frames_sent': self.frames_sent, 'retransmissions': self.retransmissions,
+                'crc_errors': self.crc_errors, 'naks': self.naks}
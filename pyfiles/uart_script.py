@@ -0,0 +1,153 @@
+"""
+Batch execution of command scripts for the uart_improv3 CLI.
+
+A script holds the commands of the interactive mode, one per line:
+
+    # Provision the LED pattern
+    addr 0x00
+    write 0xF5
+    read 0xF5       # optional expected value
+    display
+
+The whole script is parsed and checked before anything is sent, compiled to
+protocol commands and run through a single pipeline, so a provisioning run
+over hundreds of addresses costs about one round trip per window of commands
+instead of one per line. The results are reported as JSON:
+
+    python uart_improv3.py --port /dev/ttyUSB0 --script provision.txt
+    generate_commands | python uart_improv3.py --port /dev/ttyUSB0 --script -
+"""
+
+import time
+from collections import namedtuple
+
+from uart_improv3 import ADDR_COMMANDS, MEMORY_SIZE, WRITE_COMMANDS
+
+# Commands in flight while a script runs
+DEFAULT_WINDOW = 64
+
+# Script commands and the number of hex arguments they take (min, max)
+SCRIPT_COMMANDS = {
+    'addr': (1, 1),
+    'write': (1, 1),
+    'read': (0, 1),
+    'display': (0, 0),
+}
+
+# One parsed script line: line number, script command, protocol command, and
+# the value a read expects (None for no check)
+ScriptStep = namedtuple('ScriptStep', ['line', 'op', 'command', 'expected'])
+
+
+def _parse_byte(token, limit, line_number):
+    if not token.lower().startswith('0x'):
+        raise ValueError(f"Line {line_number}: expected a hex value such as 0x0F, got {token}")
+    try:
+        value = int(token, 16)
+    except ValueError:
+        raise ValueError(f"Line {line_number}: invalid hex value {token}") from None
+    if not 0 <= value < limit:
+        raise ValueError(f"Line {line_number}: {token} is out of range (0x00-0x{limit - 1:02X})")
+    return value
+
+
+def parse_script(lines):
+    """
+    Parse and check a whole script.
+
+    Blank lines and everything after a '#' are ignored. Commands are not
+    case-sensitive.
+
+    Args:
+        lines (iterable of str): Script lines
+
+    Returns:
+        list of ScriptStep: One step per command, in order
+
+    Raises:
+        ValueError: On the first line that is not a valid command
+    """
+    steps = []
+    for line_number, line in enumerate(lines, 1):
+        words = line.split('#', 1)[0].split()
+        if not words:
+            continue
+        op, args = words[0].lower(), words[1:]
+        if op not in SCRIPT_COMMANDS:
+            raise ValueError(f"Line {line_number}: unknown command {words[0]} "
+                             f"(scripts accept {', '.join(SCRIPT_COMMANDS)})")
+        low, high = SCRIPT_COMMANDS[op]
+        if not low <= len(args) <= high:
+            raise ValueError(f"Line {line_number}: {op} takes "
+                             f"{low if low == high else f'{low} to {high}'} argument(s), got {len(args)}")
+
+        expected = None
+        if op == 'addr':
+            command = ADDR_COMMANDS[_parse_byte(args[0], MEMORY_SIZE, line_number)]
+        elif op == 'write':
+            command = WRITE_COMMANDS[_parse_byte(args[0], 256, line_number)]
+        elif op == 'read':
+            command = 'R'
+            if args:
+                expected = _parse_byte(args[0], 256, line_number)
+        else:
+            command = 'G'
+        steps.append(ScriptStep(line_number, op, command, expected))
+    return steps
+
+
+def run_script(fpga, steps, window=DEFAULT_WINDOW):
+    """
+    Run parsed script steps as one pipelined command stream.
+
+    A failed command does not stop the script: its error is reported and the
+    following commands still run (after a lost response, the commands in
+    flight with it fail too, see CommandPipeline).
+
+    Args:
+        fpga (FPGA or DaemonClient): Open FPGA connection, or a daemon client
+            (whose board runs the commands as one batch request)
+        steps (list of ScriptStep): Steps returned by parse_script()
+        window (int): Maximum number of commands in flight
+
+    Returns:
+        dict: 'commands', 'errors' (failed commands and reads that did not
+            match their expected value), 'elapsed_s' and 'results', with for
+            each step its line, op, command, 'ok' and the 'value' read or the
+            'error' ({'type', 'message'})
+    """
+    commands = [step.command for step in steps]
+    start = time.perf_counter()
+    if hasattr(fpga, 'pipeline'):
+        with fpga.pipeline(window) as pipe:
+            pending = pipe.submit_many(commands)
+        outcomes = []
+        for response in pending:
+            error = response.exception()
+            outcomes.append(response.result() if error is None
+                            else {'type': type(error).__name__, 'message': str(error)})
+    else:
+        outcomes = fpga.batch(commands, window)
+    elapsed = time.perf_counter() - start
+
+    results = []
+    errors = 0
+    for step, outcome in zip(steps, outcomes):
+        result = {'line': step.line, 'op': step.op, 'command': step.command, 'ok': True}
+        if isinstance(outcome, dict):
+            result['ok'] = False
+            result['error'] = outcome
+        elif step.op == 'read':
+            result['value'] = f"0x{outcome:02X}"
+            if step.expected is not None:
+                result['expected'] = f"0x{step.expected:02X}"
+                result['ok'] = outcome == step.expected
+        errors += not result['ok']
+        results.append(result)
+
+    return {
+        'commands': len(steps),
+        'errors': errors,
+        'elapsed_s': elapsed,
+        'results': results,
+    }
@@ -0,0 +1,305 @@
+"""
+In-memory trace of the last UART transactions with an FPGA.
+
+Every command sent by the FPGA client is recorded with its response and
+latency in a fixed-size ring buffer, at the cost of a tuple store per
+command. The buffer can be dumped to a compact binary file (for instance
+when an error occurs) and the file pretty-printed or replayed against a
+board offline.
+"""
+
+import struct
+import time
+from collections import namedtuple
+from datetime import datetime
+
+# File header: magic, format version, number of records
+TRACE_MAGIC = b'FPGATRC\0'
+TRACE_VERSION = 2
+HEADER = struct.Struct('<8sHI')
+
+# Record header: timestamp, latency, flags, command length, response length
+RECORD = struct.Struct('<ddBHH')
+
+# Record flags
+TRACE_BINARY = 0x01     # command sent in binary framing mode
+TRACE_ERROR = 0x02      # no valid response (timeout or unexpected reply)
+TRACE_RELIABLE = 0x04   # binary frame and reply body carried by the reliable link
+
+# Default number of transactions kept
+DEFAULT_TRACE_SIZE = 1024
+
+# One transaction: wall-clock time it was sent, latency in seconds, raw bytes
+TraceRecord = namedtuple('TraceRecord', ['timestamp', 'latency', 'command', 'response', 'flags'])
+
+
+class TraceBuffer:
+    """
+    Fixed-size ring buffer of the last transactions.
+    """
+
+    def __init__(self, capacity=DEFAULT_TRACE_SIZE):
+        """
+        Args:
+            capacity (int): Number of transactions kept
+        """
+        if capacity < 1:
+            raise ValueError(f"Trace capacity must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self.total = 0
+        self._slots = [None] * capacity
+        self._next = 0
+        # Transactions are timed with time.perf_counter(); this converts to wall-clock time
+        self._epoch = time.time() - time.perf_counter()
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def record(self, sent, received, command, response, flags=0):
+        """
+        Store one transaction, overwriting the oldest one if the buffer is full.
+
+        Args:
+            sent (float): time.perf_counter() when the command was written
+            received (float): time.perf_counter() when the response was complete
+            command (bytes): Bytes sent
+            response (bytes): Bytes received
+            flags (int): TRACE_BINARY, TRACE_RELIABLE and TRACE_ERROR bits
+        """
+        self._slots[self._next] = (sent, received, command, response, flags)
+        self._next += 1
+        if self._next == self.capacity:
+            self._next = 0
+        self.total += 1
+
+    def records(self):
+        """
+        Returns:
+            list of TraceRecord: Stored transactions, oldest first
+        """
+        ordered = self._slots[self._next:] + self._slots[:self._next]
+        return [TraceRecord(sent + self._epoch, received - sent, command, response, flags)
+                for sent, received, command, response, flags in filter(None, ordered)]
+
+    def clear(self):
+        """
+        Drop every stored transaction.
+        """
+        self._slots = [None] * self.capacity
+        self._next = 0
+        self.total = 0
+
+    def dump(self, path):
+        """
+        Write the stored transactions to a binary trace file.
+
+        Args:
+            path (str): File to write
+
+        Returns:
+            int: Number of transactions written
+        """
+        records = self.records()
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, len(records)))
+            for record in records:
+                f.write(RECORD.pack(record.timestamp, record.latency, record.flags,
+                                    len(record.command), len(record.response)))
+                f.write(record.command)
+                f.write(record.response)
+        return len(records)
+
+
+def load_trace(path):
+    """
+    Read a trace file written by TraceBuffer.dump.
+
+    Version 1 files are read too; they do not mark the transactions of the
+    reliable mode, which are recorded as binary ones.
+
+    Args:
+        path (str): Trace file
+
+    Returns:
+        list of TraceRecord: Transactions, oldest first
+
+    Raises:
+        ValueError: If the file is not a trace file
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is too short to be a trace file")
+    magic, version, count = HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC or not 1 <= version <= TRACE_VERSION:
+        raise ValueError(f"{path} is not a version 1 to {TRACE_VERSION} trace file")
+
+    records = []
+    offset = HEADER.size
+    for _ in range(count):
+        timestamp, latency, flags, command_len, response_len = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        command = data[offset:offset + command_len]
+        offset += command_len
+        response = data[offset:offset + response_len]
+        offset += response_len
+        records.append(TraceRecord(timestamp, latency, command, response, flags))
+    return records
+
+
+def trace_mode(records):
+    """
+    Protocol mode a trace was recorded in, that of its last transaction (the
+    switches to the binary and reliable modes come first in a session).
+
+    Args:
+        records (list of TraceRecord): Transactions
+
+    Returns:
+        tuple: (binary, reliable) flags, both False for ASCII or an empty trace
+    """
+    if not records:
+        return False, False
+    flags = records[-1].flags
+    return bool(flags & TRACE_BINARY), bool(flags & TRACE_RELIABLE)
+
+
+def format_bytes(data, binary=False):
+    """
+    Readable form of raw bytes: printable ASCII text, or hex for binary frames.
+
+    Args:
+        data (bytes): Bytes to format
+        binary (bool): Always use hex
+
+    Returns:
+        str: Formatted bytes
+    """
+    if binary:
+        return data.hex(' ').upper()
+    return ''.join(chr(b) if 32 <= b < 127 else f'\\x{b:02X}' for b in data)
+
+
+def format_record(index, record):
+    """
+    One-line description of a transaction.
+
+    Args:
+        index (int): Position of the transaction in the trace
+        record (TraceRecord): Transaction
+
+    Returns:
+        str: Formatted line
+    """
+    binary = bool(record.flags & TRACE_BINARY)
+    mode = 'REL' if record.flags & TRACE_RELIABLE else 'BIN' if binary else 'TXT'
+    time_text = datetime.fromtimestamp(record.timestamp).strftime('%H:%M:%S.%f')
+    status = 'ERROR' if record.flags & TRACE_ERROR else 'ok'
+    return (f"{index:6d} {time_text} {record.latency * 1e3:8.3f} ms {status:5s} "
+            f"{mode}  {format_bytes(record.command, binary):<24s} -> "
+            f"{format_bytes(record.response, binary)}")
+
+
+def replay(records, fpga, timeout=None):
+    """
+    Send the commands of a trace again and compare the responses.
+
+    Each recorded command is written as-is and as many bytes as were recorded
+    are read back, so ASCII and binary-mode transactions are replayed alike.
+    Reliable-mode transactions record the frame and reply body the link
+    carried: they are sent through fpga.link, which numbers and checks the
+    frames again. Transactions recorded in another mode than the FPGA's
+    (such as the mode switches at the start of a session) are skipped, see
+    trace_mode(). Transactions that timed out have no reference response:
+    whatever arrives within the deadline is discarded and they are not
+    compared.
+
+    Args:
+        records (list of TraceRecord): Transactions to replay
+        fpga (FPGA): Open FPGA connection
+        timeout (float): Per-response deadline in seconds (default: fpga.timeout)
+
+    Returns:
+        list of tuple: (record, response received, True/False if it matches
+            the trace, None if it cannot be compared or was skipped)
+    """
+    if timeout is None:
+        timeout = fpga.timeout
+    results = []
+    for record in records:
+        if trace_mode([record]) != (fpga.binary, fpga.reliable):
+            results.append((record, b'', None))
+            continue
+        if fpga.reliable:
+            try:
+                response = fpga.link.result(fpga.link.send(record.command), timeout)
+            except TimeoutError:
+                response = b''
+            results.append((record, response, response == record.response if record.response else None))
+            continue
+        fpga._write(record.command)
+        if not record.response:
+            # Nothing is read back, so the write is not flushed by a read
+            fpga.uart.flush()
+            time.sleep(timeout)
+            fpga.discard_input()
+            results.append((record, b'', None))
+            continue
+        try:
+            response = fpga.read_frame(len(record.response), timeout)
+        except TimeoutError:
+            response = b''
+        results.append((record, response, response == record.response))
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description='Print or replay an FPGA UART trace file')
+    parser.add_argument('trace', help='Trace file written by TraceBuffer.dump')
+    parser.add_argument('--replay', '-r', type=str, default=None, metavar='PORT',
+                        help='Replay the commands on this serial port and report mismatches')
+    parser.add_argument('--baud', '-b', type=int, default=115200,
+                        help='Baud rate for --replay (default: 115200)')
+    parser.add_argument('--errors', '-e', action='store_true',
+                        help='Only print failed transactions')
+
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace)
+    if args.replay is None:
+        for i, rec in enumerate(trace):
+            if not args.errors or rec.flags & TRACE_ERROR:
+                print(format_record(i, rec))
+        latencies = sorted(rec.latency for rec in trace)
+        if latencies:
+            print(f"{len(trace)} transactions, {sum(rec.flags & TRACE_ERROR != 0 for rec in trace)} errors, "
+                  f"median latency {latencies[len(latencies) // 2] * 1e3:.3f} ms")
+    else:
+        from uart_improv3 import FPGA
+
+        # Reopen in the mode the trace was recorded in
+        binary, reliable = trace_mode(trace)
+        fpga = FPGA(port=args.replay, baud_rate=args.baud, log_level=logging.WARNING, trace_size=0,
+                    binary=binary, reliable=reliable)
+        if not fpga.open_instrument():
+            raise SystemExit(f"Failed to connect to FPGA on port {args.replay}")
+        try:
+            if (fpga.binary, fpga.reliable) != (binary, reliable):
+                raise SystemExit(f"FPGA on port {args.replay} does not support the "
+                                 f"{'reliable' if reliable else 'binary'} mode of the trace")
+            mismatches = skipped = 0
+            for i, (rec, response, match) in enumerate(replay(trace, fpga)):
+                if trace_mode([rec]) != (binary, reliable):
+                    skipped += 1
+                elif match is False:
+                    mismatches += 1
+                    print(format_record(i, rec))
+                    print(f"{'':>34s}replayed -> {format_bytes(response, bool(rec.flags & TRACE_BINARY))}")
+            print(f"{len(trace) - skipped - mismatches}/{len(trace) - skipped} transactions reproduced"
+                  + (f" ({skipped} recorded in another mode skipped)" if skipped else ""))
+        finally:
+            fpga.close_instrument()
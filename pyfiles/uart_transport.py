@@ -0,0 +1,431 @@
+"""
+Byte transports between the FPGA client and a board, with write coalescing.
+
+The FPGA class talks to whatever open_transport() returns for its port name:
+
+    /dev/ttyUSB0, COM3       SerialTransport, a pyserial port
+    tcp://host:port          TCPTransport, a serial-over-network bridge
+                             (ser2net, a console server, ...)
+    loop://                  LoopbackTransport, a simulated FPGAModel running
+                             in-process, for tests without any device
+
+Every transport buffers consecutive writes and sends them in a single
+system call (one USB transfer or TCP segment) when one of these happens:
+- the buffer reaches `coalesce_size` bytes;
+- the client reads, which it does whenever it waits for a reply;
+- flush() or close() is called;
+- `coalesce_delay` seconds pass after the first buffered write, if set.
+A burst of small commands therefore costs one transfer instead of one each,
+while a command followed by its reply is not delayed at all. The delay is
+enforced by a timer thread, whose wake-up per burst costs about 20 us, so it
+is off by default: only a caller that writes without reading needs it.
+"""
+
+import socket
+import struct
+import threading
+import time
+
+import serial
+
+try:
+    import fcntl
+    import termios
+except ImportError:  # Windows: bytes waiting on a socket are found with MSG_PEEK
+    fcntl = termios = None
+
+# Writes are sent once this many bytes are buffered
+DEFAULT_COALESCE_SIZE = 4096
+
+# Longest time a write waits for more writes when nothing is read, in seconds
+# (None: until the next read, flush() or close())
+DEFAULT_COALESCE_DELAY = None
+
+# Read timeout of the transports, so per-command deadlines are honoured
+DEFAULT_READ_TIMEOUT = 0.01
+
+TCP_SCHEME = 'tcp://'
+LOOPBACK_SCHEME = 'loop://'
+
+# Largest read of a socket when counting the bytes waiting with MSG_PEEK
+_PEEK_SIZE = 65536
+
+
+class Transport:
+    """
+    Base class of the transports: a coalescing write buffer in front of
+    _send(), and the read side of a pyserial port (in_waiting, read,
+    readinto, reset_input_buffer). Reading flushes the buffered writes first.
+
+    Subclasses implement _send(), _in_waiting(), _read(), _readinto(),
+    _reset_input() and _close(); `fd` is a file descriptor the reply parser
+    may read directly, or None.
+    """
+
+    fd = None
+
+    def __init__(self, coalesce_size=DEFAULT_COALESCE_SIZE, coalesce_delay=DEFAULT_COALESCE_DELAY):
+        """
+        Args:
+            coalesce_size (int): Buffered bytes that trigger a send, 0 to
+                send every write at once
+            coalesce_delay (float): Seconds a buffered write may wait when
+                nothing is read, None for no timer
+        """
+        self.coalesce_size = coalesce_size
+        self.coalesce_delay = coalesce_delay
+        self.is_open = True
+        self._tx = bytearray()
+        self._lock = threading.Lock()
+        self._timer_cond = threading.Condition(self._lock)
+        self._deadline = None
+        self._timer = None
+
+        # Counters
+        self.write_calls = 0
+        self.sends = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, data):
+        """
+        Buffer bytes, sending the buffer if it is full.
+
+        Args:
+            data (bytes-like): Bytes to send
+
+        Returns:
+            int: Number of bytes accepted
+        """
+        with self._lock:
+            self.write_calls += 1
+            self._tx += data
+            if len(self._tx) >= self.coalesce_size:
+                self._send_buffered()
+            elif self._deadline is None and self.coalesce_delay is not None:
+                self._deadline = time.monotonic() + self.coalesce_delay
+                if self._timer is None:
+                    self._timer = threading.Thread(target=self._timer_loop, name='transport-flush', daemon=True)
+                    self._timer.start()
+                else:
+                    self._timer_cond.notify()
+        return len(data)
+
+    def flush(self):
+        """
+        Send the buffered writes now.
+        """
+        if self._tx:
+            with self._lock:
+                self._send_buffered()
+
+    def _send_buffered(self):
+        # Called with the lock held
+        self._deadline = None
+        if self._tx:
+            data = bytes(self._tx)
+            self._tx.clear()
+            self.sends += 1
+            self._send(data)
+
+    def _timer_loop(self):
+        with self._lock:
+            while self.is_open:
+                if self._deadline is None:
+                    self._timer_cond.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._timer_cond.wait(remaining)
+                    continue
+                try:
+                    self._send_buffered()
+                except OSError:
+                    # The next write or read reports the broken link
+                    pass
+
+    @property
+    def in_waiting(self):
+        """
+        Returns:
+            int: Bytes received and not read yet
+        """
+        if self._tx:
+            self.flush()
+        return self._in_waiting()
+
+    def read(self, size=1):
+        """
+        Read up to `size` bytes, waiting up to the read timeout for the first one.
+
+        Returns:
+            bytes: Bytes read, empty on timeout
+        """
+        if self._tx:
+            self.flush()
+        return self._read(size)
+
+    def readinto(self, buffer):
+        """
+        Read the bytes waiting into a writable buffer without blocking.
+
+        Returns:
+            int: Number of bytes read
+        """
+        if self._tx:
+            self.flush()
+        return self._readinto(buffer)
+
+    def reset_input_buffer(self):
+        """
+        Drop every byte received and not read yet.
+        """
+        if self._tx:
+            self.flush()
+        self._reset_input()
+
+    def close(self):
+        """
+        Send the buffered writes and close the transport.
+        """
+        if not self.is_open:
+            return
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self.is_open = False
+                self._timer_cond.notify()
+            self._close()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Write calls and the sends they were coalesced into
+        """
+        return {'write_calls': self.write_calls, 'sends': self.sends}
+
+    def _send(self, data):
+        raise NotImplementedError
+
+    def _in_waiting(self):
+        raise NotImplementedError
+
+    def _read(self, size):
+        raise NotImplementedError
+
+    def _readinto(self, buffer):
+        raise NotImplementedError
+
+    def _reset_input(self):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class SerialTransport(Transport):
+    """
+    A local serial port opened with pyserial.
+    """
+
+    def __init__(self, port, baudrate=115200, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
+                 timeout=DEFAULT_READ_TIMEOUT, **coalescing):
+        """
+        Args:
+            port (str): Serial port name (e.g., 'COM3', '/dev/ttyUSB0')
+            baudrate, parity, stopbits: Passed to serial.Serial
+            timeout (float): Read timeout in seconds
+            **coalescing: coalesce_size and coalesce_delay, see Transport
+
+        Raises:
+            serial.SerialException: If the port cannot be opened
+        """
+        self.serial = serial.Serial(port=port, baudrate=baudrate, parity=parity, stopbits=stopbits,
+                                    timeout=timeout)
+        super().__init__(**coalescing)
+        # POSIX ports are read straight into the parser's buffer
+        self.fd = getattr(self.serial, 'fd', None)
+
+    def _send(self, data):
+        self.serial.write(data)
+
+    def _in_waiting(self):
+        return self.serial.in_waiting
+
+    def _read(self, size):
+        return self.serial.read(size)
+
+    def _readinto(self, buffer):
+        return self.serial.readinto(buffer)
+
+    def _reset_input(self):
+        self.serial.reset_input_buffer()
+
+    def _close(self):
+        self.serial.close()
+
+
+class TCPTransport(Transport):
+    """
+    A raw TCP connection to a serial-over-network bridge.
+
+    Nagle's algorithm is disabled: the transport coalesces writes itself and
+    a command waiting for its reply must not wait for an acknowledgement.
+    """
+
+    def __init__(self, host, port, timeout=DEFAULT_READ_TIMEOUT, connect_timeout=5.0, **coalescing):
+        """
+        Args:
+            host (str): Bridge host name or address
+            port (int): Bridge TCP port
+            timeout (float): Read timeout in seconds
+            connect_timeout (float): Connection timeout in seconds
+            **coalescing: coalesce_size and coalesce_delay, see Transport
+
+        Raises:
+            OSError: If the connection fails
+        """
+        self.address = (host, port)
+        self.sock = socket.create_connection(self.address, connect_timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+        super().__init__(**coalescing)
+        # The socket is non-blocking at the OS level once it has a timeout
+        self.fd = self.sock.fileno() if fcntl is not None else None
+
+    def _send(self, data):
+        self.sock.sendall(data)
+
+    def _in_waiting(self):
+        if fcntl is not None:
+            return struct.unpack('i', fcntl.ioctl(self.sock, termios.FIONREAD, bytes(4)))[0]
+        timeout = self.sock.gettimeout()
+        self.sock.settimeout(0)
+        try:
+            return len(self.sock.recv(_PEEK_SIZE, socket.MSG_PEEK))
+        except BlockingIOError:
+            return 0
+        finally:
+            self.sock.settimeout(timeout)
+
+    def _read(self, size):
+        try:
+            data = self.sock.recv(size)
+        except socket.timeout:
+            return b''
+        if not data:
+            raise ConnectionResetError(f"Connection to {self.address[0]}:{self.address[1]} closed")
+        return data
+
+    def _readinto(self, buffer):
+        try:
+            count = self.sock.recv_into(buffer)
+        except socket.timeout:
+            return 0
+        if not count and len(buffer):
+            raise ConnectionResetError(f"Connection to {self.address[0]}:{self.address[1]} closed")
+        return count
+
+    def _reset_input(self):
+        timeout = self.sock.gettimeout()
+        self.sock.settimeout(0)
+        try:
+            while self.sock.recv(_PEEK_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+        finally:
+            self.sock.settimeout(timeout)
+
+    def _close(self):
+        self.sock.close()
+
+
+class LoopbackTransport(Transport):
+    """
+    An FPGAModel (see fpga_sim.py) answering in-process.
+
+    Commands are executed when they are sent, so replies are waiting as soon
+    as the writes are flushed. No baud rate, latency or corruption is
+    simulated; use VirtualFPGA for that.
+    """
+
+    def __init__(self, model=None, timeout=DEFAULT_READ_TIMEOUT, **coalescing):
+        """
+        Args:
+            model (FPGAModel): Simulated FPGA (default: a new FPGAModel)
+            timeout (float): How long a read waits when no reply is pending
+            **coalescing: coalesce_size and coalesce_delay, see Transport
+        """
+        # fpga_sim imports the FPGA client, which imports this module
+        from fpga_sim import FPGAModel
+
+        self.model = FPGAModel() if model is None else model
+        self.timeout = timeout
+        self._rx = bytearray()
+        super().__init__(**coalescing)
+
+    def _send(self, data):
+        for _, reply in self.model.feed(data):
+            self._rx += reply
+
+    def _in_waiting(self):
+        return len(self._rx)
+
+    def _read(self, size):
+        with self._lock:
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+        if not data:
+            # Nothing will arrive: behave like a port whose read timed out
+            time.sleep(self.timeout)
+        return data
+
+    def _readinto(self, buffer):
+        with self._lock:
+            count = min(len(buffer), len(self._rx))
+            buffer[:count] = self._rx[:count]
+            del self._rx[:count]
+        return count
+
+    def _reset_input(self):
+        with self._lock:
+            self._rx.clear()
+
+    def _close(self):
+        pass
+
+
+def open_transport(port, baudrate=115200, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
+                   timeout=DEFAULT_READ_TIMEOUT, **coalescing):
+    """
+    Open the transport named by a port string.
+
+    Args:
+        port (str): Serial port name, 'tcp://host:port' or 'loop://'
+        baudrate, parity, stopbits: Serial settings (ignored by the other transports)
+        timeout (float): Read timeout in seconds
+        **coalescing: coalesce_size and coalesce_delay, see Transport
+
+    Returns:
+        Transport: Open transport
+
+    Raises:
+        ValueError: If a tcp:// port has no valid port number
+        serial.SerialException: If a serial port cannot be opened
+        OSError: If a TCP connection fails
+    """
+    if port.startswith(TCP_SCHEME):
+        host, _, number = port[len(TCP_SCHEME):].rstrip('/').rpartition(':')
+        if not host or not number.isdigit():
+            raise ValueError(f"Expected tcp://host:port, got {port}")
+        return TCPTransport(host.strip('[]'), int(number), timeout=timeout, **coalescing)
+    if port.startswith(LOOPBACK_SCHEME):
+        return LoopbackTransport(timeout=timeout, **coalescing)
+    return SerialTransport(port, baudrate=baudrate, parity=parity, stopbits=stopbits, timeout=timeout,
+                           **coalescing)